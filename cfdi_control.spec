@@ -11,6 +11,8 @@ a = Analysis(
     hiddenimports=[
         'xml.etree.ElementTree',
         'xml.etree',
+        'multiprocessing',
+        'concurrent.futures',
         'tkinter',
         'tkinter.ttk',
         'tkinter.filedialog',
@@ -0,0 +1,338 @@
+"""
+Command-line entry point for CFDI Control (no GUI)
+
+Runs month or year fills from scripts, cron jobs or batch servers and
+prints a JSON summary on stdout, starts the local processing service, or
+queues jobs and drains the queue with a pool of worker processes, or
+queries the ledger of parsed CFDI.
+Only the core modules are imported, so tkinter is never loaded.
+
+Examples:
+    python -m src.main process --template plantilla.xlsx --xml-dir xml/ --year 2025 --month 1 --workers 4
+    python -m src.main serve --port 8765
+    python -m src.main queue add --template cliente_a.xlsx --xml-dir xml/cliente_a --year 2025 --month 1
+    python -m src.main queue work --workers 4
+    python -m src.main ledger --rfc AAA010101AAA --desde 2025-04-01 --hasta 2025-06-30
+"""
+
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import argparse
+import json
+import logging
+import sqlite3
+import sys
+
+# Add src to Python path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).parent))
+
+# Exit codes
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+
+def _positive_int(value: str) -> int:
+    """argparse type for counts that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"debe ser mayor que 0: {value}")
+    return number
+
+
+def _date(value: str) -> datetime:
+    """argparse type for YYYY-MM-DD dates."""
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"fecha inválida (use AAAA-MM-DD): {value}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the argument parser with one subparser per command."""
+    parser = argparse.ArgumentParser(prog="cfdi-control", description="Control de CFDI sin interfaz gráfica")
+    parser.add_argument("--log-level", default="WARNING", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Nivel de log en stderr y en cfdi_control.log (default: WARNING)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    process = commands.add_parser("process", help="Llenar la plantilla con los CFDI de un mes o de un año")
+    process.add_argument("--template", required=True, help="Plantilla Excel (.xlsx)")
+    process.add_argument("--xml-dir", action="append", default=[], metavar="DIR",
+                         help="Carpeta con XML o paquetes ZIP (se recorre recursivamente; repetible)")
+    process.add_argument("--xml", nargs="+", default=[], metavar="FILE",
+                         help="Archivos XML o paquetes ZIP individuales")
+    process.add_argument("--year", type=int, required=True, help="Año")
+    period = process.add_mutually_exclusive_group(required=True)
+    period.add_argument("--month", type=int, choices=range(1, 13), metavar="{1..12}", help="Mes")
+    period.add_argument("--all-months", action="store_true",
+                        help="Llenar cada pestaña del año según la Fecha de cada CFDI")
+    process.add_argument("--workers", type=_positive_int, default=None,
+                         help="Procesos de lectura de XML en paralelo (1 = serial; default: configuración)")
+    process.add_argument("--output-dir", default=None, help="Carpeta de salida (default: la de la plantilla)")
+    process.add_argument("--output-mode", choices=["workbook", "patch", "auto"], default=None,
+                         help="Forma de escribir el Excel (default: configuración)")
+    process.add_argument("--no-cache", action="store_true", help="No usar la caché de XML ya leídos")
+    process.add_argument("--ledger", action="store_true",
+                         help="Guardar los CFDI leídos en el registro (default: configuración)")
+    process.add_argument("--from-ledger", action="store_true",
+                         help="Llenar con los CFDI del periodo guardados en el registro, sin leer XML")
+    process.add_argument("--ledger-db", default=None, metavar="FILE",
+                         help="Archivo SQLite del registro (default: configuración)")
+    process.add_argument("--duplicates", choices=["drop", "flag", "off"], default=None,
+                         help="CFDI con UUID ya leído: omitir, solo reportar o no revisar (default: configuración)")
+    
+    serve = commands.add_parser("serve", help="Servicio local que mantiene plantillas y procesos listos")
+    serve.add_argument("--host", default=None, help="Dirección (default: configuración, solo local)")
+    serve.add_argument("--port", type=int, default=None, help="Puerto (default: configuración)")
+    serve.add_argument("--workers", type=_positive_int, default=None,
+                       help="Procesos de lectura de XML en paralelo (default: configuración)")
+    serve.add_argument("--no-cache", action="store_true", help="No usar la caché de XML ya leídos")
+    
+    queue = commands.add_parser("queue", help="Cola persistente de trabajos (varias empresas o periodos)")
+    queue.add_argument("--queue-db", default=None, metavar="FILE",
+                       help="Archivo SQLite de la cola (default: configuración)")
+    queue_commands = queue.add_subparsers(dest="queue_command", required=True)
+    
+    add = queue_commands.add_parser("add", help="Agregar un trabajo a la cola")
+    add.add_argument("--template", required=True, help="Plantilla Excel (.xlsx)")
+    add.add_argument("--xml-dir", action="append", default=[], metavar="DIR",
+                     help="Carpeta con XML o paquetes ZIP (se recorre recursivamente; repetible)")
+    add.add_argument("--xml", nargs="+", default=[], metavar="FILE",
+                     help="Archivos XML o paquetes ZIP individuales")
+    add.add_argument("--year", type=int, required=True, help="Año")
+    add_period = add.add_mutually_exclusive_group(required=True)
+    add_period.add_argument("--month", type=int, choices=range(1, 13), metavar="{1..12}", help="Mes")
+    add_period.add_argument("--all-months", action="store_true",
+                            help="Llenar cada pestaña del año según la Fecha de cada CFDI")
+    add.add_argument("--output-dir", default=None, help="Carpeta de salida (default: la de la plantilla)")
+    add.add_argument("--output-mode", choices=["workbook", "patch", "auto"], default=None,
+                     help="Forma de escribir el Excel (default: configuración)")
+    add.add_argument("--max-attempts", type=_positive_int, default=None,
+                     help="Intentos antes de marcar el trabajo como fallido (default: configuración)")
+    
+    work = queue_commands.add_parser("work", help="Procesar los trabajos pendientes")
+    work.add_argument("--workers", type=_positive_int, default=None,
+                      help="Trabajos en paralelo, uno por proceso (default: configuración)")
+    work.add_argument("--parse-workers", type=_positive_int, default=None,
+                      help="Procesos de lectura de XML por trabajo (default: 1)")
+    work.add_argument("--forever", action="store_true",
+                      help="Seguir esperando trabajos nuevos en lugar de terminar con la cola vacía")
+    work.add_argument("--no-cache", action="store_true", help="No usar la caché de XML ya leídos")
+    
+    status = queue_commands.add_parser("status", help="Mostrar el estado de los trabajos")
+    status.add_argument("--status", choices=["pending", "running", "done", "failed"], default=None,
+                        help="Solo los trabajos con este estado")
+    status.add_argument("--limit", type=_positive_int, default=None, help="Solo los últimos N trabajos")
+    
+    ledger = commands.add_parser("ledger", help="Consultar el registro de CFDI ya leídos")
+    ledger.add_argument("--ledger-db", default=None, metavar="FILE",
+                        help="Archivo SQLite del registro (default: configuración)")
+    ledger.add_argument("--uuid", default=None, help="Folio fiscal (UUID)")
+    ledger.add_argument("--rfc", default=None, help="RFC del emisor o del receptor")
+    ledger.add_argument("--emisor", default=None, metavar="RFC", help="RFC del emisor")
+    ledger.add_argument("--receptor", default=None, metavar="RFC", help="RFC del receptor")
+    ledger.add_argument("--desde", type=_date, default=None, metavar="AAAA-MM-DD", help="Fecha inicial")
+    ledger.add_argument("--hasta", type=_date, default=None, metavar="AAAA-MM-DD", help="Fecha final (incluida)")
+    ledger.add_argument("--limit", type=_positive_int, default=None, help="Máximo de CFDI listados")
+    return parser
+
+
+def run_process(args: argparse.Namespace) -> int:
+    """
+    Run the process command and print its summary.
+    
+    Args:
+        args: Parsed arguments of the process command
+    
+    Returns:
+        Exit code
+    """
+    # Imported here so that --help and usage errors do not pay for openpyxl
+    from core.batch_runner import BatchRunner
+    from core.xml_sources import DirectorySource
+    
+    xml_sources = [DirectorySource(folder) for folder in args.xml_dir] + list(args.xml)
+    if not xml_sources and not args.from_ledger:
+        print("Indique --xml-dir, --xml o --from-ledger", file=sys.stderr)
+        return EXIT_USAGE
+    
+    runner = BatchRunner(workers=args.workers, use_cache=False if args.no_cache else None,
+                         use_ledger=True if args.ledger or args.from_ledger else None, ledger_path=args.ledger_db,
+                         duplicate_mode=args.duplicates)
+    try:
+        summary = runner.run(args.template, xml_sources, args.year, None if args.all_months else args.month,
+                             output_dir=args.output_dir, output_mode=args.output_mode,
+                             from_ledger=args.from_ledger)
+    finally:
+        runner.close()
+    
+    json.dump(summary, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return EXIT_OK if summary['success'] else EXIT_FAILED
+
+
+def run_serve(args: argparse.Namespace) -> int:
+    """
+    Run the serve command until interrupted.
+    
+    Args:
+        args: Parsed arguments of the serve command
+    
+    Returns:
+        Exit code
+    """
+    from config.settings import SERVICE_CONFIG
+    from service import ProcessingService, TOKEN_HEADER
+    
+    try:
+        service = ProcessingService(args.host, args.port, workers=args.workers,
+                                    use_cache=False if args.no_cache else None)
+    except OSError as e:
+        print(f"No se pudo iniciar el servicio: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    host, port = service.address
+    print(f"Servicio escuchando en http://{host}:{port} (Ctrl+C para detener)", file=sys.stderr)
+    print(f"Envíe el token de {SERVICE_CONFIG['token_path']} en el encabezado {TOKEN_HEADER}", file=sys.stderr)
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return EXIT_OK
+
+
+def run_queue(args: argparse.Namespace) -> int:
+    """
+    Run a queue command and print its result.
+    
+    Args:
+        args: Parsed arguments of the queue command
+    
+    Returns:
+        Exit code
+    """
+    from core.job_queue import JobQueue, JobWorkerPool
+    
+    if args.queue_command == "work":
+        pool = JobWorkerPool(args.queue_db, workers=args.workers, parse_workers=args.parse_workers,
+                             use_cache=False if args.no_cache else None)
+        try:
+            counts = pool.run(stop_when_empty=not args.forever)
+        except KeyboardInterrupt:
+            return EXIT_FAILED
+        # Jobs that failed in earlier runs stay in the counts but do not fail this one
+        output = {'counts': counts, 'failed': [job['id'] for job in pool.last_failures]}
+        exit_code = EXIT_FAILED if pool.last_failures else EXIT_OK
+    else:
+        try:
+            job_queue = JobQueue(args.queue_db)
+        except sqlite3.Error as e:
+            print(f"No se pudo abrir la cola: {e}", file=sys.stderr)
+            return EXIT_FAILED
+        try:
+            if args.queue_command == "add":
+                if not args.xml_dir and not args.xml:
+                    print("Indique --xml-dir o --xml", file=sys.stderr)
+                    return EXIT_USAGE
+                job_id = job_queue.submit(args.template, args.year, None if args.all_months else args.month,
+                                          xml_dirs=args.xml_dir, xml_files=args.xml,
+                                          output_dir=args.output_dir, output_mode=args.output_mode,
+                                          max_attempts=args.max_attempts)
+                output = {'id': job_id}
+            else:
+                output = {'counts': job_queue.counts(),
+                          'jobs': job_queue.list_jobs(args.status, args.limit)}
+        finally:
+            job_queue.close()
+        exit_code = EXIT_OK
+    
+    json.dump(output, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return exit_code
+
+
+def _record_summary(cfdi_data) -> Dict[str, Any]:
+    """Main fields of a ledger record, for the ledger command output."""
+    return {
+        'uuid': cfdi_data.uuid,
+        'fecha': cfdi_data.fecha,
+        'tipo_comprobante': cfdi_data.tipo_comprobante,
+        'total': cfdi_data.total,
+        'moneda': cfdi_data.moneda,
+        'emisor_rfc': cfdi_data.emisor_rfc,
+        'emisor_nombre': cfdi_data.emisor_nombre,
+        'receptor_rfc': cfdi_data.receptor_rfc,
+        'file_path': cfdi_data.file_path
+    }
+
+
+def run_ledger(args: argparse.Namespace) -> int:
+    """
+    Run the ledger command and print the matching records.
+    
+    Args:
+        args: Parsed arguments of the ledger command
+    
+    Returns:
+        Exit code
+    """
+    from core.ledger import CFDILedger
+    
+    criteria = {
+        'uuid': args.uuid,
+        'rfc': args.rfc,
+        'emisor_rfc': args.emisor,
+        'receptor_rfc': args.receptor,
+        'start': args.desde,
+        'end': args.hasta + timedelta(days=1) if args.hasta else None
+    }
+    try:
+        ledger = CFDILedger(args.ledger_db)
+    except sqlite3.Error as e:
+        print(f"No se pudo abrir el registro: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    try:
+        output = {
+            'count': ledger.count(**criteria),
+            'records': [_record_summary(cfdi_data) for cfdi_data in ledger.query(limit=args.limit, **criteria)]
+        }
+    finally:
+        ledger.close()
+    
+    json.dump(output, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return EXIT_OK
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Parse the command line and run the command.
+    
+    Args:
+        argv: Arguments without the program name (default: sys.argv[1:])
+    
+    Returns:
+        Exit code (0 success, 1 processing failed, 2 usage error)
+    """
+    parser = build_parser()
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit as e:
+        return EXIT_OK if e.code == 0 else EXIT_USAGE
+    logging.getLogger().setLevel(args.log_level)
+    
+    if args.command == "process":
+        return run_process(args)
+    if args.command == "serve":
+        return run_serve(args)
+    if args.command == "queue":
+        return run_queue(args)
+    if args.command == "ledger":
+        return run_ledger(args)
+    return EXIT_USAGE
+
+
+if __name__ == "__main__":
+    sys.exit(main())
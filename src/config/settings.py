@@ -22,10 +22,30 @@ CFDI_MAPPING = {
     "cfdi:Impuestos/@TotalImpuestosTrasladados": "P" # Total Taxes
 }
 
+# Namespace URIs for the supported CFDI versions (the "cfdi" prefix)
+CFDI_NAMESPACES = {
+    "3": "http://www.sat.gob.mx/cfd/3",
+    "4": "http://www.sat.gob.mx/cfd/4"
+}
+
+# Values extracted with every record but not written to the month tabs
+# (XML path -> record key)
+CFDI_IDENTITY_MAPPING = {
+    "cfdi:Complemento/tfd:TimbreFiscalDigital/@UUID": "UUID"  # Folio fiscal assigned by the SAT stamp
+}
+
+# Namespace URIs of the other prefixes used in the mappings
+CFDI_EXTRA_NAMESPACES = {
+    "tfd": "http://www.sat.gob.mx/TimbreFiscalDigital"
+}
+
 # Excel Template Configuration
 EXCEL_CONFIG = {
     "header_row": 3,              # Row where column headers are located
     "data_start_row": 4,          # Row where data starts (after headers)
+    "amount_format": "#,##0.00",  # Number format of the "cfdi_amount" named style (SubTotal, Total, ...)
+    "date_format": "yyyy-mm-dd hh:mm:ss",  # Number format of the "cfdi_fecha" named style (Fecha)
+    "max_rows_per_sheet": 1048576,  # Excel's row limit; further records continue in "Ene2025 (2)", ...
     "month_tabs": [               # Expected month tab names
         "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
         "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"
@@ -47,5 +67,62 @@ APP_CONFIG = {
 PROCESSING_CONFIG = {
     "max_files_per_batch": 1000,  # Maximum XML files to process at once
     "progress_update_interval": 0.1,  # Progress bar update interval (seconds)
+    "xml_extraction_mode": "stream",  # "stream" (iterparse with bounded memory, stops after the last mapped
+                                      # node), "dom" (full ET.parse) or "fast" (byte-level header scan that
+                                      # skips the Conceptos, streaming for unusual files)
+    "xml_backend": "lxml",        # "lxml" (falls back to xml.etree if missing) or "etree"
+    "parallel_mode": "auto",      # "process", "thread" or "auto" (threads with lxml, processes otherwise)
+    "parse_workers": None,        # Parallel parse workers (None: one per CPU, 1: serial)
+    "parse_chunk_size": 64,       # Files sent to a worker process per task
+    "parallel_min_files": 200,    # Below this many files the serial loop is faster than starting workers
+    "pipeline_queue_size": 2,     # Chunks of max_files_per_batch files buffered between pipeline stages
+    "excel_output_mode": "auto",  # "workbook" (openpyxl load and save), "patch" (copy the template package
+                                  # and stream only the month tab's sheet) or "auto" (patch from streaming_min_rows)
+    "streaming_min_rows": 20000,  # Records from which "auto" streams the month tab instead of loading the workbook
     "output_filename_template": "CFDI_Control_{year}_{month:02d}_{timestamp}.xlsx"
-} 
\ No newline at end of file
+} 
+
+# Parse Cache Settings
+CACHE_CONFIG = {
+    "enabled": True,                          # Serve unchanged XML files from the cache
+    "db_path": "cfdi_control_cache.sqlite3",  # SQLite file (next to cfdi_control.log)
+    "max_entries": 500000,                    # Least recently used records are evicted above this
+    "hash_contents": False                    # Also key on a SHA-1 of the file contents
+}
+
+# Local Processing Service Settings (python -m src.main serve)
+SERVICE_CONFIG = {
+    "host": "127.0.0.1",           # Only local clients: jobs name files on this machine
+    "port": 8765,
+    "max_cached_templates": 8,     # Prepared templates kept between jobs (see TemplateCache)
+    "output_mode": "patch",        # Month jobs reuse the prepared month tab instead of loading the workbook
+    "max_request_bytes": 1048576,  # Largest accepted job description
+    "token_path": "cfdi_control_service.token"  # Per-install token clients send in the X-CFDI-Token header
+}
+
+# Duplicate Detection Settings (the same invoice under another file name or inside a ZIP)
+DUPLICATE_CONFIG = {
+    "mode": "drop",                          # "drop" (write only the first copy of each UUID), "flag" (write
+                                             # every copy) or "off"; repeats are listed in the run result
+    "persist": False,                        # Remember UUIDs across runs, to also report copies of files read
+                                             # in earlier runs (always written: the first copy is not in this run)
+    "db_path": "cfdi_control_uuids.sqlite3"  # SQLite file of the persisted index
+}
+
+# CFDI Ledger Settings (every parsed record, queryable by UUID, RFC and Fecha)
+LEDGER_CONFIG = {
+    "enabled": False,                          # Store the records of every run in the ledger
+    "db_path": "cfdi_control_ledger.sqlite3",  # SQLite file (next to cfdi_control.log)
+    "batch_size": 5000                         # Records read from the ledger at a time by month fills
+}
+
+# Job Queue Settings (python -m src.main queue)
+JOB_QUEUE_CONFIG = {
+    "db_path": "cfdi_control_jobs.sqlite3",  # SQLite file shared by the queue commands and workers
+    "workers": 2,                            # Worker processes, each running one job at a time
+    "max_attempts": 3,                       # Runs before a job is marked failed
+    "retry_delay": 30,                       # Seconds before a failed job is retried, per attempt
+    "poll_interval": 1.0,                    # Seconds between polls while waiting for retries or new jobs
+    "heartbeat_interval": 10,                # Seconds between the heartbeats of a worker running a job
+    "stale_after": 60                        # Running jobs without a heartbeat for this long are requeued
+}
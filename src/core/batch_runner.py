@@ -0,0 +1,154 @@
+"""
+Headless runner for month (or year) fills, shared by the command line and batch jobs
+"""
+
+from typing import Any, Dict, Iterable, Optional
+import logging
+import time
+
+# Import configuration
+from config.settings import CACHE_CONFIG, LEDGER_CONFIG
+from .xml_parser import CFDIXMLParser
+from .data_models import CFDIDataProcessor
+from .excel_processor import ExcelProcessor
+from .pipeline import CFDIPipeline
+from .template_cache import TemplateCache
+from .parse_cache import ParseCache
+from .ledger import CFDILedger, month_range
+from .mapping_plan import DEFAULT_PLAN
+
+# Result entries copied as they are into the summary
+_RESULT_KEYS = ('success', 'output_path', 'error_message', 'records_processed', 'sheets',
+                'months', 'missing_months', 'skipped_records')
+
+
+def summarize_result(result: Dict[str, Any], elapsed: float = None) -> Dict[str, Any]:
+    """
+    Turn a CFDIPipeline.run() result into a JSON-serializable summary.
+    
+    Args:
+        result: Dictionary returned by CFDIPipeline.run()
+        elapsed: Run time in seconds, if measured
+    
+    Returns:
+        Dictionary of plain values (amounts as strings, to keep their exact decimals)
+    """
+    summary = {key: result[key] for key in _RESULT_KEYS if key in result}
+    if 'months' in summary:
+        summary['months'] = {str(month): count for month, count in summary['months'].items()}
+    
+    processing_result = result.get('processing_result')
+    if processing_result is not None:
+        summary['successful_files'] = processing_result.successful_files
+        summary['failed_files'] = processing_result.failed_files
+        summary['total_amount'] = str(processing_result.total_amount)
+        summary['currency'] = processing_result.currency
+        summary['date_range'] = dict(processing_result.date_range)
+        summary['errors'] = list(processing_result.errors)
+        summary['duplicate_files'] = processing_result.duplicate_files
+        summary['duplicates'] = list(processing_result.duplicates)
+    if elapsed is not None:
+        summary['elapsed_seconds'] = round(elapsed, 3)
+    return summary
+
+
+class BatchRunner:
+    """
+    Runs fills without the GUI, keeping the parser and processors between runs.
+    
+    The parser, validator and Excel processor are created once and driven
+    through CFDIPipeline, so consecutive runs (e.g. one per month or per
+    client) reuse the compiled mapping plan and the parse cache. Long-lived
+    runners can also keep the parse workers and prepared templates warm.
+    With the ledger enabled, parsed records are stored in it and runs can
+    fill a template from the ledger alone.
+    Runs must not overlap: the parser and the cached patchers hold per-run state.
+    """
+    
+    def __init__(self, workers: int = None, use_cache: bool = None, batch_size: int = None,
+                 template_cache: TemplateCache = None, keep_workers: bool = False, use_ledger: bool = None,
+                 ledger_path: str = None, duplicate_mode: str = None):
+        """
+        Initialize the batch runner.
+        
+        Args:
+            workers: Parallel parse workers (default: parse_workers from config, 1 = serial)
+            use_cache: Use the on-disk parse cache (default: enabled from CACHE_CONFIG)
+            batch_size: Files per pipeline chunk (default: max_files_per_batch from config)
+            template_cache: Cache of prepared templates for the patch output mode
+            keep_workers: Keep the parse workers alive between runs until close()
+            use_ledger: Store parsed records in the ledger (default: enabled from LEDGER_CONFIG)
+            ledger_path: Ledger SQLite file (default: db_path from LEDGER_CONFIG)
+            duplicate_mode: "drop", "flag" or "off" for repeated UUIDs (default: mode from DUPLICATE_CONFIG)
+        """
+        self.logger = logging.getLogger(__name__)
+        if use_cache is None:
+            use_cache = CACHE_CONFIG.get('enabled', False)
+        self.cache = self._create_parse_cache() if use_cache else None
+        if use_ledger is None:
+            use_ledger = LEDGER_CONFIG.get('enabled', False)
+        self.ledger = CFDILedger(ledger_path) if use_ledger else None
+        self.xml_parser = CFDIXMLParser(cache=self.cache)
+        self.data_processor = CFDIDataProcessor()
+        self.excel_processor = ExcelProcessor(template_cache)
+        self.pipeline = CFDIPipeline(self.xml_parser, self.data_processor, self.excel_processor,
+                                     batch_size=batch_size, workers=workers, ledger=self.ledger,
+                                     duplicate_mode=duplicate_mode)
+        if keep_workers:
+            self.xml_parser.keep_pool(workers)
+    
+    def _create_parse_cache(self) -> Optional[ParseCache]:
+        """Open the on-disk parse cache, or None if it is unavailable."""
+        try:
+            return ParseCache(plan_signature=DEFAULT_PLAN.signature)
+        except Exception as e:
+            self.logger.warning(f"Parse cache unavailable, parsing every file: {e}")
+            return None
+    
+    def run(self, template_path: Any, xml_sources: Iterable[Any], year: int, month: Optional[int],
+            output_dir: str = None, output_mode: str = None, from_ledger: bool = False) -> Dict[str, Any]:
+        """
+        Fill a template and summarize the run.
+        
+        Args:
+            template_path: Path to Excel template or a TemplateSession
+            xml_sources: XML paths, ZIP package paths, folders (DirectorySource) or XML sources
+                (ignored with from_ledger)
+            year: Year for processing
+            month: Month for processing, or None to fill every month tab of the year
+            output_dir: Output directory (default: same as template)
+            output_mode: "workbook", "patch" or "auto" (default: excel_output_mode from config)
+            from_ledger: Take the records of the period from the ledger instead of parsing XML
+        
+        Returns:
+            Summary as returned by summarize_result()
+        """
+        started = time.perf_counter()
+        try:
+            records = record_count = None
+            if from_ledger:
+                if self.ledger is None:
+                    raise ValueError("El registro de CFDI no está habilitado")
+                start, end = month_range(year, month)
+                records = self.ledger.iter_batches(start=start, end=end)
+                record_count = self.ledger.count(start=start, end=end)
+            result = self.pipeline.run(template_path, xml_sources, year, month, output_dir=output_dir,
+                                       output_mode=output_mode, records=records, record_count=record_count)
+        except Exception as e:
+            self.logger.error(f"Batch run failed: {e}")
+            result = {'success': False, 'output_path': '', 'error_message': f"Error inesperado: {str(e)}",
+                      'records_processed': 0, 'sheets': []}
+        summary = summarize_result(result, time.perf_counter() - started)
+        self.logger.info(f"Batch run finished in {summary['elapsed_seconds']}s: "
+                         f"{summary['records_processed']} records written")
+        return summary
+    
+    def close(self):
+        """Stop the kept parse workers and close the parse cache and the ledger, if any."""
+        self.xml_parser.close()
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+        if self.ledger is not None:
+            self.ledger.close()
+            self.ledger = None
@@ -2,12 +2,71 @@
 Data models for CFDI information
 """
 
-from dataclasses import dataclass
-from typing import Dict, List, Optional, Any
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Any, Sequence, Tuple, Union
 from datetime import datetime
+from decimal import Decimal
 import logging
+import os
 
-@dataclass
+from utils.helpers import parse_money, parse_cfdi_datetime
+
+if TYPE_CHECKING:
+    from .uuid_index import UUIDIndex
+
+# Excel columns written for each record, in the order of CFDIData fields
+CFDI_COLUMNS = ('B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O', 'P')
+
+# Excel columns holding amounts
+MONEY_COLUMNS = ('D', 'E', 'G', 'P')
+
+# Excel column holding Fecha
+FECHA_COLUMN = 'B'
+
+# Record key of the TimbreFiscalDigital UUID (see CFDI_IDENTITY_MAPPING; not written to Excel)
+UUID_KEY = 'UUID'
+
+def normalize_uuid(uuid: str) -> str:
+    """
+    Normalize a TimbreFiscalDigital UUID for comparisons.
+    
+    Args:
+        uuid: UUID as written in the XML
+    
+    Returns:
+        Upper-case UUID without surrounding spaces ('' if empty)
+    """
+    return (uuid or '').strip().upper()
+
+def _validate_values(fecha: str, total: str, total_value: Optional[Decimal], subtotal: str,
+                     subtotal_value: Optional[Decimal], emisor_rfc: str, receptor_rfc: str) -> List[str]:
+    """Validation shared by CFDIData and CFDIBatch rows."""
+    errors = []
+    
+    # Required fields validation
+    if not fecha:
+        errors.append("Fecha es requerida")
+    if not total:
+        errors.append("Total es requerido")
+    if not emisor_rfc:
+        errors.append("RFC del emisor es requerido")
+    if not receptor_rfc:
+        errors.append("RFC del receptor es requerido")
+    
+    # Format validation (a non-empty field without a typed value failed to parse)
+    if total and total_value is None:
+        errors.append("Total debe ser un número válido")
+    elif total_value is not None and total_value < 0:
+        errors.append("Total no puede ser negativo")
+    
+    if subtotal and subtotal_value is None:
+        errors.append("Subtotal debe ser un número válido")
+    elif subtotal_value is not None and subtotal_value < 0:
+        errors.append("Subtotal no puede ser negativo")
+    
+    return errors
+
+@dataclass(slots=True)
 class CFDIData:
     """Data model for a single CFDI record."""
     
@@ -38,6 +97,43 @@ class CFDIData:
     file_path: str = ''                # Original file path
     file_name: str = ''                # Original file name
     
+    # Stamp information
+    uuid: str = ''                     # Folio fiscal (TimbreFiscalDigital UUID)
+    
+    # Typed values, parsed once from the fields above when the record is created
+    fecha_value: Optional[datetime] = field(default=None, init=False, repr=False, compare=False)
+    subtotal_value: Optional[Decimal] = field(default=None, init=False, repr=False, compare=False)
+    descuento_value: Optional[Decimal] = field(default=None, init=False, repr=False, compare=False)
+    total_value: Optional[Decimal] = field(default=None, init=False, repr=False, compare=False)
+    total_impuestos_value: Optional[Decimal] = field(default=None, init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        self.fecha_value = parse_cfdi_datetime(self.fecha)
+        self.subtotal_value = parse_money(self.subtotal)
+        self.descuento_value = parse_money(self.descuento)
+        self.total_value = parse_money(self.total)
+        self.total_impuestos_value = parse_money(self.total_impuestos)
+    
+    def money_values(self) -> Dict[str, Optional[Decimal]]:
+        """Get the parsed amounts by Excel column (None for empty or invalid amounts)."""
+        return {
+            'D': self.subtotal_value,
+            'E': self.descuento_value,
+            'G': self.total_value,
+            'P': self.total_impuestos_value
+        }
+    
+    def excel_values(self) -> Tuple[str, ...]:
+        """Get the cell values in CFDI_COLUMNS order."""
+        return (self.fecha, self.forma_pago, self.subtotal, self.descuento, self.moneda, self.total,
+                self.tipo_comprobante, self.metodo_pago, self.emisor_rfc, self.emisor_nombre,
+                self.emisor_regimen, self.receptor_rfc, self.receptor_nombre, self.receptor_regimen,
+                self.total_impuestos)
+    
+    def money_row(self) -> Tuple[Optional[Decimal], ...]:
+        """Get the parsed amounts in MONEY_COLUMNS order."""
+        return self.subtotal_value, self.descuento_value, self.total_value, self.total_impuestos_value
+    
     def to_excel_row(self) -> Dict[str, str]:
         """Convert to Excel row format."""
         return {
@@ -78,37 +174,195 @@ class CFDIData:
             receptor_regimen=data.get('O', ''),
             total_impuestos=data.get('P', ''),
             file_path=data.get('file_path', ''),
-            file_name=data.get('file_name', '')
+            file_name=data.get('file_name', ''),
+            uuid=data.get(UUID_KEY, '')
         )
     
     def validate(self) -> List[str]:
         """Validate the CFDI data and return list of errors."""
-        errors = []
-        
-        # Required fields validation
-        if not self.fecha:
-            errors.append("Fecha es requerida")
-        if not self.total:
-            errors.append("Total es requerido")
-        if not self.emisor_rfc:
-            errors.append("RFC del emisor es requerido")
-        if not self.receptor_rfc:
-            errors.append("RFC del receptor es requerido")
-        
-        # Format validation
-        try:
-            if self.total and float(self.total) < 0:
-                errors.append("Total no puede ser negativo")
-        except ValueError:
-            errors.append("Total debe ser un número válido")
-        
-        try:
-            if self.subtotal and float(self.subtotal) < 0:
-                errors.append("Subtotal no puede ser negativo")
-        except ValueError:
-            errors.append("Subtotal debe ser un número válido")
-        
-        return errors
+        return _validate_values(self.fecha, self.total, self.total_value, self.subtotal,
+                                self.subtotal_value, self.emisor_rfc, self.receptor_rfc)
+
+class CFDIBatch:
+    """
+    Column-oriented store of CFDI records.
+    
+    Every Excel column is kept as one list of strings, and the amounts and
+    dates as lists of typed values parsed once on append, so a large batch
+    costs one list slot per value instead of a dict or object per record.
+    The parser appends rows straight from its compact outcomes and the Excel
+    writer iterates the columns directly. Indexing or iterating the batch
+    gives CFDIData objects, built on demand.
+    """
+    
+    __slots__ = ('_source_positions', '_uuid_position', '_values', 'file_paths', 'file_names', 'uuids',
+                 'fecha_values', '_amounts')
+    
+    def __init__(self, source_columns: Sequence[str] = CFDI_COLUMNS):
+        """
+        Initialize an empty batch.
+        
+        Args:
+            source_columns: Excel column of each value in the tuples passed to append_values()
+                (the mapping plan column order)
+        """
+        # Position of each CFDI column in the appended tuples (None: column not mapped)
+        self._source_positions = tuple(
+            source_columns.index(column) if column in source_columns else None for column in CFDI_COLUMNS
+        )
+        self._uuid_position = source_columns.index(UUID_KEY) if UUID_KEY in source_columns else None
+        self._values: Dict[str, List[str]] = {column: [] for column in CFDI_COLUMNS}
+        self.file_paths: List[str] = []
+        self.file_names: List[str] = []
+        self.uuids: List[str] = []
+        self.fecha_values: List[Optional[datetime]] = []
+        self._amounts: Dict[str, List[Optional[Decimal]]] = {column: [] for column in MONEY_COLUMNS}
+    
+    def append_values(self, values: Sequence[str], file_path: str = '', file_name: str = ''):
+        """
+        Append a record given as a tuple of values in source column order.
+        
+        Args:
+            values: Extracted values (e.g. a parse_compact() payload)
+            file_path: Original file path
+            file_name: Original file name
+        """
+        self._append_row(tuple(values[position] if position is not None else ''
+                               for position in self._source_positions), file_path, file_name,
+                         values[self._uuid_position] if self._uuid_position is not None else '')
+    
+    def append_dict(self, data: Dict[str, Any]):
+        """
+        Append a record given as a parser result dictionary.
+        
+        Args:
+            data: Dictionary of Excel column -> value, plus file_path and file_name
+        """
+        self._append_row(tuple(data.get(column, '') for column in CFDI_COLUMNS),
+                         data.get('file_path', ''), data.get('file_name', ''), data.get(UUID_KEY, ''))
+    
+    def _append_row(self, values: Tuple[str, ...], file_path: str, file_name: str, uuid: str = '',
+                    fecha_value: Optional[datetime] = None, amounts: Tuple[Optional[Decimal], ...] = None):
+        """Append values already in CFDI_COLUMNS order (typed values reused when given)."""
+        for column, value in zip(CFDI_COLUMNS, values):
+            self._values[column].append(value)
+        self.file_paths.append(file_path)
+        self.file_names.append(file_name)
+        self.uuids.append(uuid)
+        if amounts is None:
+            fecha_value = parse_cfdi_datetime(self._values['B'][-1])
+            amounts = tuple(parse_money(self._values[column][-1]) for column in MONEY_COLUMNS)
+        self.fecha_values.append(fecha_value)
+        for column, amount in zip(MONEY_COLUMNS, amounts):
+            self._amounts[column].append(amount)
+    
+    def __len__(self) -> int:
+        return len(self.file_paths)
+    
+    def __getitem__(self, index: int) -> CFDIData:
+        """Build the CFDIData for one row."""
+        values = [self._values[column][index] for column in CFDI_COLUMNS]
+        return CFDIData(*values, file_path=self.file_paths[index], file_name=self.file_names[index],
+                        uuid=self.uuids[index])
+    
+    def __iter__(self) -> Iterator[CFDIData]:
+        for index in range(len(self)):
+            yield self[index]
+    
+    def column(self, column: str) -> List[str]:
+        """Get the values of one Excel column."""
+        return self._values[column]
+    
+    def amounts(self, column: str) -> List[Optional[Decimal]]:
+        """Get the parsed amounts of one money column (None for empty or invalid amounts)."""
+        return self._amounts[column]
+    
+    def iter_rows(self) -> Iterator[Tuple[str, ...]]:
+        """Iterate over the rows as tuples of cell values in CFDI_COLUMNS order."""
+        return zip(*(self._values[column] for column in CFDI_COLUMNS))
+    
+    def iter_typed_rows(self) -> Iterator[Tuple[Tuple[str, ...], Optional[datetime], Tuple[Optional[Decimal], ...]]]:
+        """Iterate over the rows as (cell values, parsed Fecha, parsed amounts) tuples."""
+        return zip(self.iter_rows(), self.fecha_values, self.iter_money_rows())
+    
+    def iter_money_rows(self) -> Iterator[Tuple[Optional[Decimal], ...]]:
+        """Iterate over the rows as tuples of parsed amounts in MONEY_COLUMNS order."""
+        return zip(*(self._amounts[column] for column in MONEY_COLUMNS))
+    
+    def validate_row(self, index: int) -> List[str]:
+        """Validate one row and return the list of errors (same rules as CFDIData.validate)."""
+        return _validate_values(self._values['B'][index], self._values['G'][index], self._amounts['G'][index],
+                                self._values['D'][index], self._amounts['D'][index],
+                                self._values['J'][index], self._values['M'][index])
+    
+    def select(self, indices: Iterable[int]) -> 'CFDIBatch':
+        """
+        Copy some rows into a new batch.
+        
+        Args:
+            indices: Row indices to keep, in the order wanted
+        
+        Returns:
+            New CFDIBatch with the selected rows
+        """
+        selected = CFDIBatch()
+        for index in indices:
+            selected._append_row(tuple(self._values[column][index] for column in CFDI_COLUMNS),
+                                 self.file_paths[index], self.file_names[index], self.uuids[index],
+                                 self.fecha_values[index],
+                                 tuple(self._amounts[column][index] for column in MONEY_COLUMNS))
+        return selected
+    
+    def extend(self, other: 'CFDIBatch'):
+        """Append every row of another batch."""
+        for column in CFDI_COLUMNS:
+            self._values[column].extend(other._values[column])
+        for column in MONEY_COLUMNS:
+            self._amounts[column].extend(other._amounts[column])
+        self.file_paths.extend(other.file_paths)
+        self.file_names.extend(other.file_names)
+        self.uuids.extend(other.uuids)
+        self.fecha_values.extend(other.fecha_values)
+
+
+def iter_typed_rows(records: Union[List['CFDIData'], CFDIBatch]) -> Iterator[Tuple[Tuple[str, ...], Optional[datetime], Tuple[Optional[Decimal], ...]]]:
+    """
+    Iterate over records as (cell values, parsed Fecha, parsed amounts) tuples.
+    
+    Args:
+        records: List of CFDI data objects or a CFDIBatch
+    
+    Yields:
+        Cell values in CFDI_COLUMNS order, Fecha datetime (or None) and amounts in MONEY_COLUMNS order
+    """
+    # Batches are read column-wise; typed values were parsed once when the records were created
+    if isinstance(records, CFDIBatch):
+        return records.iter_typed_rows()
+    return ((cfdi_data.excel_values(), cfdi_data.fecha_value, cfdi_data.money_row()) for cfdi_data in records)
+
+def group_by_month(records: Union[List['CFDIData'], CFDIBatch]) -> Dict[Optional[Tuple[int, int]], Union[List['CFDIData'], CFDIBatch]]:
+    """
+    Split records by the month of their Fecha in a single pass.
+    
+    Args:
+        records: List of CFDI data objects or a CFDIBatch
+    
+    Returns:
+        Dictionary of (year, month) -> records of that month, in their original
+        order and of the same kind as the input (None groups records whose
+        Fecha could not be parsed)
+    """
+    fecha_values = records.fecha_values if isinstance(records, CFDIBatch) else [
+        cfdi_data.fecha_value for cfdi_data in records
+    ]
+    positions: Dict[Optional[Tuple[int, int]], List[int]] = {}
+    for index, fecha_value in enumerate(fecha_values):
+        key = (fecha_value.year, fecha_value.month) if fecha_value is not None else None
+        positions.setdefault(key, []).append(index)
+    
+    if isinstance(records, CFDIBatch):
+        return {key: records.select(indices) for key, indices in positions.items()}
+    return {key: [records[index] for index in indices] for key, indices in positions.items()}
 
 @dataclass
 class ProcessingResult:
@@ -116,11 +370,17 @@ class ProcessingResult:
     
     successful_files: int = 0
     failed_files: int = 0
-    total_amount: float = 0.0
+    total_amount: Decimal = Decimal('0')
     currency: str = ''
     date_range: Dict[str, str] = None
     errors: List[str] = None
-    processed_data: List[CFDIData] = None
+    processed_data: Union[List[CFDIData], CFDIBatch] = None
+    duplicate_files: int = 0              # Records repeating a UUID already read (see UUIDIndex)
+    duplicates: List[str] = None          # One message per repeat
+    
+    # Earliest and latest Fecha seen by add_dates(), compared as datetimes
+    _first_date: Optional[datetime] = field(default=None, init=False, repr=False, compare=False)
+    _last_date: Optional[datetime] = field(default=None, init=False, repr=False, compare=False)
     
     def __post_init__(self):
         if self.date_range is None:
@@ -129,16 +389,42 @@ class ProcessingResult:
             self.errors = []
         if self.processed_data is None:
             self.processed_data = []
+        if self.duplicates is None:
+            self.duplicates = []
     
     def add_error(self, error: str):
         """Add an error to the result."""
         self.errors.append(error)
     
+    def add_duplicate(self, message: str):
+        """Count a record that repeats an invoice already read."""
+        self.duplicate_files += 1
+        self.duplicates.append(message)
+    
+    def add_date(self, fecha_value: Optional[datetime], fecha: str):
+        """
+        Widen date_range to include a record date.
+        
+        Args:
+            fecha_value: Parsed date (ignored if None)
+            fecha: Date as written in the XML (reported in date_range)
+        """
+        if fecha_value is None:
+            return
+        if self._first_date is None or fecha_value < self._first_date:
+            self._first_date = fecha_value
+            self.date_range['start'] = fecha
+        if self._last_date is None or fecha_value > self._last_date:
+            self._last_date = fecha_value
+            self.date_range['end'] = fecha
+    
     def get_summary_text(self) -> str:
         """Get a human-readable summary of the processing result."""
         summary = f"Procesamiento completado:\n"
         summary += f"• Archivos procesados exitosamente: {self.successful_files}\n"
         summary += f"• Archivos con errores: {self.failed_files}\n"
+        if self.duplicate_files:
+            summary += f"• CFDI duplicados (mismo UUID): {self.duplicate_files}\n"
         
         if self.total_amount > 0:
             summary += f"• Monto total: {self.total_amount:.2f} {self.currency}\n"
@@ -151,8 +437,34 @@ class ProcessingResult:
             for error in self.errors:
                 summary += f"• {error}\n"
         
+        if self.duplicates:
+            summary += f"\nCFDI duplicados:\n"
+            for duplicate in self.duplicates:
+                summary += f"• {duplicate}\n"
+        
         return summary
 
+# Failure reasons reported in ParseOutcome.failure
+FAILURE_IO_ERROR = 'io_error'                        # File missing or unreadable
+FAILURE_XML_SYNTAX = 'xml_syntax'                    # Not well-formed XML
+FAILURE_NOT_CFDI = 'not_cfdi'                        # Root is not a CFDI Comprobante
+FAILURE_UNSUPPORTED_VERSION = 'unsupported_version'  # SAT Comprobante of a version not in CFDI_NAMESPACES
+FAILURE_UNEXPECTED = 'unexpected'                    # Any other error
+
+@dataclass
+class ParseOutcome:
+    """Result of validating and extracting a single CFDI file in one pass."""
+    
+    file_path: str = ''
+    record: Optional[Dict[str, Any]] = None   # Extracted data, as returned by parse_cfdi_file()
+    failure: Optional[str] = None             # One of the FAILURE_* reasons
+    message: str = ''                         # Human-readable failure description
+    
+    @property
+    def success(self) -> bool:
+        """True if the file is a valid CFDI and its data was extracted."""
+        return self.failure is None
+
 class CFDIDataProcessor:
     """Processor for CFDI data with validation and transformation."""
     
@@ -160,16 +472,24 @@ class CFDIDataProcessor:
         """Initialize the CFDI data processor."""
         self.logger = logging.getLogger(__name__)
     
-    def process_raw_data(self, raw_data_list: List[Dict[str, Any]]) -> ProcessingResult:
+    def process_raw_data(self, raw_data_list: Union[List[Dict[str, Any]], CFDIBatch],
+                         uuid_index: 'UUIDIndex' = None) -> ProcessingResult:
         """
         Process raw CFDI data into structured format.
         
         Args:
-            raw_data_list: List of raw data dictionaries from XML parser
-            
+            raw_data_list: List of raw data dictionaries from XML parser, or a CFDIBatch
+            uuid_index: Index the repeated invoices are detected with (default: no detection)
+        
         Returns:
             ProcessingResult with processed data and statistics
+            (processed_data is a CFDIBatch when a batch is given)
         """
+        if isinstance(raw_data_list, CFDIBatch):
+            result = ProcessingResult()
+            result.processed_data = self.process_chunk(raw_data_list, result, uuid_index)
+            return result
+        
         result = ProcessingResult()
         processed_data = []
         
@@ -186,20 +506,24 @@ class CFDIDataProcessor:
                         result.add_error(f"{cfdi_data.file_name}: {error}")
                     continue
                 
+                if uuid_index is not None:
+                    earlier = uuid_index.check_many([cfdi_data.uuid], [cfdi_data.file_path])[0]
+                    if earlier is not None:
+                        result.add_duplicate(_duplicate_message(cfdi_data.file_name, cfdi_data.uuid, *earlier))
+                        if uuid_index.drop and earlier[1]:
+                            continue
+                
                 # Add to processed data
                 processed_data.append(cfdi_data)
                 result.successful_files += 1
                 
                 # Update statistics
-                try:
-                    if cfdi_data.total:
-                        result.total_amount += float(cfdi_data.total)
-                except ValueError:
-                    pass
+                if cfdi_data.total_value is not None:
+                    result.total_amount += cfdi_data.total_value
                 
                 if cfdi_data.moneda:
                     result.currency = cfdi_data.moneda
-                
+            
             except Exception as e:
                 result.failed_files += 1
                 error_msg = f"Error procesando {raw_data.get('file_name', 'archivo')}: {str(e)}"
@@ -208,13 +532,93 @@ class CFDIDataProcessor:
         
         result.processed_data = processed_data
         
-        # Calculate date range
-        if processed_data:
-            dates = [data.fecha for data in processed_data if data.fecha]
-            if dates:
-                result.date_range = {
-                    'start': min(dates),
-                    'end': max(dates)
-                }
+        # Calculate date range (compared as datetimes, reported as in the XML)
+        for data in processed_data:
+            result.add_date(data.fecha_value, data.fecha)
+        
+        return result 
+    
+    def process_chunk(self, batch: CFDIBatch, result: ProcessingResult, uuid_index: 'UUIDIndex' = None) -> CFDIBatch:
+        """
+        Validate a CFDIBatch column-wise and add its statistics to a running result.
+        
+        Counts, total amount, currency, date range and errors are updated
+        incrementally, so a run can be processed chunk by chunk without
+        keeping earlier chunks. result.processed_data is not touched.
+        With a UUID index, valid rows repeating an invoice already seen are
+        reported in result.duplicates and, if the index drops repeats and the
+        earlier copy was read in this run, left out (they then count as
+        neither successful nor failed).
+        
+        Args:
+            batch: Records filled by the parser
+            result: Result the statistics are added to
+            uuid_index: Index the repeated invoices are detected with (default: no detection)
+        
+        Returns:
+            New CFDIBatch with the valid rows
+        """
+        valid = []
+        file_names = batch.file_names
+        
+        for index in range(len(batch)):
+            validation_errors = batch.validate_row(index)
+            if validation_errors:
+                result.failed_files += 1
+                for error in validation_errors:
+                    result.add_error(f"{file_names[index]}: {error}")
+                continue
+            valid.append(index)
+        
+        if uuid_index is not None:
+            valid = self._skip_duplicates(batch, valid, result, uuid_index)
+        
+        result.successful_files += len(valid)
+        totals = batch.amounts('G')
+        result.total_amount += sum((totals[index] for index in valid if totals[index] is not None), Decimal('0'))
+        
+        currencies = batch.column('F')
+        for index in reversed(valid):
+            if currencies[index]:
+                result.currency = currencies[index]
+                break
+        
+        fechas = batch.fecha_values
+        fecha_texts = batch.column('B')
+        for index in valid:
+            result.add_date(fechas[index], fecha_texts[index])
+        
+        return batch.select(valid)
+    
+    def _skip_duplicates(self, batch: CFDIBatch, valid: List[int], result: ProcessingResult,
+                         uuid_index: 'UUIDIndex') -> List[int]:
+        """
+        Report the rows that repeat an invoice already seen.
+        
+        Args:
+            batch: Records filled by the parser
+            valid: Indices of the valid rows
+            result: Result the repeats are reported in
+            uuid_index: Index of the UUIDs seen in the run
         
-        return result 
\ No newline at end of file
+        Returns:
+            Indices of the rows to keep
+        """
+        uuids = batch.uuids
+        file_paths = batch.file_paths
+        earlier = uuid_index.check_many([uuids[index] for index in valid], [file_paths[index] for index in valid])
+        
+        kept = []
+        for index, repeat in zip(valid, earlier):
+            if repeat is not None:
+                result.add_duplicate(_duplicate_message(batch.file_names[index], uuids[index], *repeat))
+                # A copy read in an earlier run is not in this output: keep this one
+                if uuid_index.drop and repeat[1]:
+                    continue
+            kept.append(index)
+        return kept
+
+def _duplicate_message(file_name: str, uuid: str, first_path: str, in_run: bool = True) -> str:
+    """Message reported for a repeated invoice."""
+    message = f"{file_name}: UUID {normalize_uuid(uuid)} ya leído en {os.path.basename(first_path)}"
+    return message if in_run else f"{message} (en una ejecución anterior)"
@@ -4,34 +4,70 @@ Handles Excel template filling with CFDI data
 """
 
 import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.cell.cell import Cell
+from openpyxl.styles import Font, Alignment, PatternFill, NamedStyle
+from copy import copy
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 import logging
 from datetime import datetime
 import os
+import threading
 
 # Import our data models
-from .data_models import CFDIData, ProcessingResult
+from .template_inspector import TemplateInspector, TemplateInspectionError
+from .template_cache import TemplateCache
+from .xlsx_patcher import XlsxSheetPatcher, XlsxPatchError, continuation_sheet_name
+from .data_models import (CFDIData, CFDIBatch, ProcessingResult, CFDI_COLUMNS, MONEY_COLUMNS, FECHA_COLUMN,
+                          iter_typed_rows, group_by_month)
 from config.settings import EXCEL_CONFIG, PROCESSING_CONFIG
 
+# Named styles registered in the output workbook
+AMOUNT_STYLE = 'cfdi_amount'
+FECHA_STYLE = 'cfdi_fecha'
+
+OUTPUT_MODES = ('workbook', 'patch', 'auto')
+
 class ExcelProcessor:
     """Processor for Excel templates with CFDI data."""
     
-    def __init__(self):
-        """Initialize the Excel processor."""
+    def __init__(self, template_cache: TemplateCache = None):
+        """
+        Initialize the Excel processor.
+        
+        Args:
+            template_cache: Optional cache of prepared templates used by create_sheet_patcher()
+        """
         self.logger = logging.getLogger(__name__)
+        self.template_cache = template_cache
         
-    def load_template(self, template_path: str) -> Optional[openpyxl.Workbook]:
+        # Column plan resolved once: (worksheet column, position in CFDI_COLUMNS)
+        column_index = openpyxl.utils.column_index_from_string
+        self._text_columns = [
+            (column_index(column), position) for position, column in enumerate(CFDI_COLUMNS)
+            if column not in MONEY_COLUMNS and column != FECHA_COLUMN
+        ]
+        self._money_columns = [
+            (column_index(column), CFDI_COLUMNS.index(column)) for column in MONEY_COLUMNS
+        ]
+        self._fecha_column = (column_index(FECHA_COLUMN), CFDI_COLUMNS.index(FECHA_COLUMN))
+        
+        # Sheets written by the last fill_month_tab() call (the month tab plus any continuation sheets)
+        self.last_sheets = []
+    
+    def load_template(self, template_path: Union[str, 'TemplateSession']) -> Optional[openpyxl.Workbook]:
         """
         Load Excel template file.
         
         Args:
-            template_path: Path to Excel template file
-            
+            template_path: Path to Excel template file, or a TemplateSession
+                (its already loaded workbook is returned)
+        
         Returns:
             Workbook object or None if loading fails
         """
+        if isinstance(template_path, TemplateSession):
+            return template_path.workbook
         try:
             workbook = openpyxl.load_workbook(template_path)
             self.logger.info(f"Template loaded successfully: {template_path}")
@@ -47,7 +83,7 @@ class ExcelProcessor:
         Args:
             month: Month number (1-12)
             year: Year (optional, defaults to current year)
-            
+        
         Returns:
             Month tab name in Spanish with year (e.g., "Ene2025")
         """
@@ -59,7 +95,7 @@ class ExcelProcessor:
         if year is None:
             from datetime import datetime
             year = datetime.now().year
-            
+        
         return f"{month_abbreviations[month - 1]}{year}"
     
     def find_month_tab(self, workbook: openpyxl.Workbook, month: int, year: int = None) -> Optional[openpyxl.worksheet.worksheet.Worksheet]:
@@ -70,20 +106,38 @@ class ExcelProcessor:
             workbook: Excel workbook
             month: Month number (1-12)
             year: Year (optional, defaults to current year)
-            
+        
         Returns:
             Worksheet for the month or None if not found
         """
+        sheet_name = self.match_month_tab_name(workbook.sheetnames, month, year)
+        if sheet_name is None:
+            self.logger.error(f"Month tab '{self.get_month_tab_name(month, year)}' not found in template")
+            return None
+        return workbook[sheet_name]
+    
+    def match_month_tab_name(self, sheet_names: List[str], month: int, year: int = None) -> Optional[str]:
+        """
+        Pick the month tab among a list of sheet names.
+        
+        Args:
+            sheet_names: Sheet names of the template, in workbook order
+            month: Month number (1-12)
+            year: Year (optional, defaults to current year)
+        
+        Returns:
+            Name of the month tab or None if not found
+        """
         month_tab_name = self.get_month_tab_name(month, year)
         
         # Try exact match first (e.g., "Ene2025")
-        if month_tab_name in workbook.sheetnames:
-            return workbook[month_tab_name]
+        if month_tab_name in sheet_names:
+            return month_tab_name
         
         # Try with month number
         month_number_tab = f"{month:02d}"
-        if month_number_tab in workbook.sheetnames:
-            return workbook[month_number_tab]
+        if month_number_tab in sheet_names:
+            return month_number_tab
         
         # Try with full month names (fallback)
         month_names = [
@@ -91,15 +145,14 @@ class ExcelProcessor:
             "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"
         ]
         full_month_name = month_names[month - 1]
-        if full_month_name in workbook.sheetnames:
-            return workbook[full_month_name]
+        if full_month_name in sheet_names:
+            return full_month_name
         
         # Try with month name in different formats
-        for sheet_name in workbook.sheetnames:
+        for sheet_name in sheet_names:
             if month_tab_name.lower() in sheet_name.lower():
-                return workbook[sheet_name]
+                return sheet_name
         
-        self.logger.error(f"Month tab '{month_tab_name}' not found in template")
         return None
     
     def clear_month_data(self, worksheet: openpyxl.worksheet.worksheet.Worksheet, start_row: int = None):
@@ -113,66 +166,178 @@ class ExcelProcessor:
         if start_row is None:
             start_row = EXCEL_CONFIG['data_start_row']
         
-        # Clear all data rows after headers
-        for row in range(start_row, worksheet.max_row + 1):
-            for col in range(1, worksheet.max_column + 1):
-                cell = worksheet.cell(row=row, column=col)
+        # Only visit cells that exist (openpyxl keeps them in a (row, column) dict);
+        # looping over max_row x max_column would create every empty position
+        cells = worksheet._cells
+        for coordinate in [coordinate for coordinate in cells if coordinate[0] >= start_row]:
+            cell = cells[coordinate]
+            if cell.has_style:
+                # Keep the template formatting, drop the old value
                 cell.value = None
+            else:
+                del cells[coordinate]
     
     def fill_month_tab(self, worksheet: openpyxl.worksheet.worksheet.Worksheet, 
-                      cfdi_data_list: List[CFDIData], month: int) -> bool:
+                      cfdi_data_list: Union[List[CFDIData], CFDIBatch], month: int) -> bool:
         """
         Fill the month tab with CFDI data.
         
         Args:
             worksheet: Excel worksheet to fill
-            cfdi_data_list: List of CFDI data objects
+            cfdi_data_list: List of CFDI data objects or a CFDIBatch
             month: Month number for logging
-            
+        
         Returns:
             True if successful, False otherwise
         """
+        self.last_sheets = []
         try:
             # Clear existing data
             self.clear_month_data(worksheet)
             
-            # Get starting row for data
-            start_row = EXCEL_CONFIG['data_start_row']
-            
-            # Fill data row by row
-            for row_idx, cfdi_data in enumerate(cfdi_data_list, start=start_row):
-                excel_row = cfdi_data.to_excel_row()
-                
-                # Fill each column
-                for column_letter, value in excel_row.items():
-                    col_idx = openpyxl.utils.column_index_from_string(column_letter)
-                    cell = worksheet.cell(row=row_idx, column=col_idx)
-                    cell.value = value
-                    
-                    # Apply formatting for numeric values
-                    if column_letter in ['D', 'E', 'G', 'P']:  # Numeric columns
-                        try:
-                            if value and float(value) != 0:
-                                cell.number_format = '#,##0.00'
-                        except ValueError:
-                            pass
+            # Fill data from the first data row, continuing in new sheets past the row limit
+            writer = MonthTabWriter(self, worksheet)
+            writer.write(cfdi_data_list)
+            self.last_sheets = writer.sheets
             
             self.logger.info(f"Filled {len(cfdi_data_list)} records in month {month}")
             return True
-            
+        
         except Exception as e:
             self.logger.error(f"Error filling month tab {month}: {e}")
             return False
     
-    def create_output_filename(self, year: int, month: int, template_path: str) -> str:
+    def write_records(self, worksheet: openpyxl.worksheet.worksheet.Worksheet,
+                      cfdi_data_list: Union[List[CFDIData], CFDIBatch], start_row: int) -> int:
+        """
+        Write records to consecutive rows, without clearing the tab.
+        
+        Amounts are written as numbers with the "cfdi_amount" named style and
+        Fecha as a datetime with the "cfdi_fecha" style; values that could
+        not be parsed are written as text, and empty values are skipped.
+        Cells the template already formats keep their font, fill, border and
+        alignment and only get the number format of those styles.
+        
+        Args:
+            worksheet: Excel worksheet to fill
+            cfdi_data_list: List of CFDI data objects or a CFDIBatch
+            start_row: Row of the first record
+        
+        Returns:
+            Row following the last record written
+        """
+        amount_style = self._named_style_array(worksheet, AMOUNT_STYLE, EXCEL_CONFIG['amount_format'])
+        fecha_style = self._named_style_array(worksheet, FECHA_STYLE, EXCEL_CONFIG['date_format'])
+        amount_format_id = amount_style.numFmtId
+        fecha_format_id = fecha_style.numFmtId
+        text_columns = self._text_columns
+        money_columns = self._money_columns
+        fecha_col_idx, fecha_position = self._fecha_column
+        write_cell = worksheet.cell
+        
+        row_idx = start_row
+        for values, fecha_value, amounts in iter_typed_rows(cfdi_data_list):
+            for col_idx, position in text_columns:
+                value = values[position]
+                if value:
+                    write_cell(row=row_idx, column=col_idx, value=value)
+            
+            for (col_idx, position), amount in zip(money_columns, amounts):
+                if amount is not None:
+                    cell = write_cell(row=row_idx, column=col_idx)
+                    cell.value = amount
+                    if cell.has_style:
+                        cell_style = copy(cell._style)
+                        cell_style.numFmtId = amount_format_id
+                        cell._style = cell_style
+                    else:
+                        cell._style = copy(amount_style)
+                elif values[position]:
+                    write_cell(row=row_idx, column=col_idx, value=values[position])
+            
+            if fecha_value is not None:
+                cell = write_cell(row=row_idx, column=fecha_col_idx)
+                # Checked before the value: openpyxl gives datetime cells a date format
+                template_styled = cell.has_style
+                cell.value = fecha_value
+                if template_styled:
+                    cell_style = copy(cell._style)
+                    cell_style.numFmtId = fecha_format_id
+                    cell._style = cell_style
+                else:
+                    cell._style = copy(fecha_style)
+            elif values[fecha_position]:
+                write_cell(row=row_idx, column=fecha_col_idx, value=values[fecha_position])
+            row_idx += 1
+        return row_idx
+    
+    def add_continuation_sheet(self, worksheet: openpyxl.worksheet.worksheet.Worksheet, title: str,
+                               after: openpyxl.worksheet.worksheet.Worksheet) -> openpyxl.worksheet.worksheet.Worksheet:
+        """
+        Add a sheet that continues a month tab, with the same header rows and column widths.
+        
+        Args:
+            worksheet: Month tab whose headers are copied
+            title: Name of the new sheet
+            after: Sheet the new one is placed after
+        
+        Returns:
+            New worksheet
+        """
+        workbook = worksheet.parent
+        continuation = workbook.create_sheet(title, workbook.index(after) + 1)
+        start_row = EXCEL_CONFIG['data_start_row']
+        
+        # Only existing header cells are copied (see clear_month_data)
+        for (row, column), cell in list(worksheet._cells.items()):
+            if row < start_row:
+                new_cell = continuation.cell(row=row, column=column, value=cell.value)
+                if cell.has_style:
+                    new_cell._style = copy(cell._style)
+        for key, dimension in worksheet.column_dimensions.items():
+            continuation.column_dimensions[key] = copy(dimension)
+            continuation.column_dimensions[key].worksheet = continuation
+        for row, dimension in worksheet.row_dimensions.items():
+            if row < start_row:
+                continuation.row_dimensions[row] = copy(dimension)
+                continuation.row_dimensions[row].worksheet = continuation
+        for merged_range in worksheet.merged_cells.ranges:
+            if merged_range.max_row < start_row:
+                continuation.merge_cells(merged_range.coord)
+        continuation.freeze_panes = worksheet.freeze_panes
+        return continuation
+    
+    def _named_style_array(self, worksheet: openpyxl.worksheet.worksheet.Worksheet, name: str, number_format: str):
+        """
+        Register a named style in the workbook (once) and get its cell style array.
+        
+        Copying the style array into each cell is much cheaper than assigning
+        the named style by name cell by cell.
+        
+        Args:
+            worksheet: Worksheet whose workbook gets the style
+            name: Named style name
+            number_format: Number format of the style
+        
+        Returns:
+            Style array to copy into cells
+        """
+        workbook = worksheet.parent
+        if name not in workbook.named_styles:
+            workbook.add_named_style(NamedStyle(name=name, number_format=number_format))
+        prototype = Cell(worksheet)
+        prototype.style = name
+        return prototype._style
+    
+    def create_output_filename(self, year: int, month: Optional[int], template_path: str) -> str:
         """
         Create output filename with timestamp.
         
         Args:
             year: Year
-            month: Month
+            month: Month (None for a whole-year run)
             template_path: Original template path
-            
+        
         Returns:
             Output filename
         """
@@ -180,7 +345,8 @@ class ExcelProcessor:
         template_name = Path(template_path).stem
         
         # Create output filename
-        output_filename = f"{template_name}_CFDI_{year}_{month:02d}_{timestamp}.xlsx"
+        period = f"{year}" if month is None else f"{year}_{month:02d}"
+        output_filename = f"{template_name}_CFDI_{period}_{timestamp}.xlsx"
         
         return output_filename
     
@@ -191,7 +357,7 @@ class ExcelProcessor:
         Args:
             workbook: Excel workbook
             output_path: Output file path
-            
+        
         Returns:
             True if successful, False otherwise
         """
@@ -203,29 +369,115 @@ class ExcelProcessor:
             self.logger.error(f"Error saving workbook to {output_path}: {e}")
             return False
     
-    def process_cfdi_to_excel(self, template_path: str, cfdi_data_list: List[CFDIData], 
-                             year: int, month: int, output_dir: str = None) -> Dict[str, Any]:
+    def build_output_path(self, template_path: str, year: int, month: Optional[int], output_dir: str = None) -> str:
+        """
+        Build the output file path.
+        
+        Args:
+            template_path: Original template path
+            year: Year
+            month: Month (None for a whole-year run)
+            output_dir: Output directory (default: same as template)
+        
+        Returns:
+            Output file path
+        """
+        if output_dir is None:
+            output_dir = str(Path(template_path).parent)
+        return os.path.join(output_dir, self.create_output_filename(year, month, template_path))
+    
+    def resolve_output_mode(self, output_mode: str = None, record_count: Optional[int] = None) -> str:
+        """
+        Resolve the output mode, defaulting to excel_output_mode from config.
+        
+        "auto" streams the month tab ("patch") from streaming_min_rows
+        records on, or when the number of records is not known in advance,
+        and uses the workbook writer for smaller months.
+        
+        Args:
+            output_mode: "workbook", "patch", "auto" or None
+            record_count: Number of records to write, if known
+        
+        Returns:
+            "workbook" or "patch"
+        """
+        if output_mode is None:
+            output_mode = PROCESSING_CONFIG.get('excel_output_mode', 'workbook')
+        if output_mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode: {output_mode}")
+        if output_mode == 'auto':
+            large = record_count is None or record_count >= PROCESSING_CONFIG.get('streaming_min_rows', 20000)
+            output_mode = 'patch' if large else 'workbook'
+        return output_mode
+    
+    def create_sheet_patcher(self, template_path: Union[str, 'TemplateSession'], month: int,
+                             year: int = None) -> Optional[XlsxSheetPatcher]:
+        """
+        Prepare a sheet-level patcher for the month tab of a template.
+        
+        Args:
+            template_path: Path to Excel template or a TemplateSession
+            month: Month number (1-12)
+            year: Year (optional, defaults to current year)
+        
+        Returns:
+            Prepared patcher, or None if the template has no such tab or cannot be patched
+            (the caller should then use the workbook writer)
+        """
+        try:
+            if self.template_cache is not None:
+                sheet_name = self.match_month_tab_name(self.template_cache.sheet_names(template_path), month, year)
+                return self.template_cache.patcher(template_path, sheet_name) if sheet_name is not None else None
+            sheet_name = self.match_month_tab_name(TemplateInspector(template_path).sheet_names(), month, year)
+            if sheet_name is None:
+                return None
+            patcher = XlsxSheetPatcher(template_path, sheet_name)
+            patcher.prepare()
+            return patcher
+        except (TemplateInspectionError, XlsxPatchError) as e:
+            self.logger.warning(f"Template {template_path} cannot be patched, using the workbook writer: {e}")
+            return None
+    
+    def process_cfdi_to_excel(self, template_path: Union[str, 'TemplateSession'], cfdi_data_list: Union[List[CFDIData], CFDIBatch], 
+                             year: int, month: int, output_dir: str = None, output_mode: str = None) -> Dict[str, Any]:
         """
         Main method to process CFDI data and fill Excel template.
         
         Args:
-            template_path: Path to Excel template
-            cfdi_data_list: List of CFDI data objects
+            template_path: Path to Excel template or a TemplateSession
+            cfdi_data_list: List of CFDI data objects or a CFDIBatch
             year: Year for processing
             month: Month for processing
             output_dir: Output directory (default: same as template)
-            
+            output_mode: "workbook" (load, fill and save the whole workbook), "patch"
+                (stream only the month tab's sheet) or "auto" (patch for large months);
+                default: excel_output_mode from config
+        
         Returns:
             Dictionary with processing results
         """
+        output_mode = self.resolve_output_mode(output_mode, len(cfdi_data_list))
         result = {
             'success': False,
             'output_path': '',
             'error_message': '',
-            'records_processed': 0
+            'records_processed': 0,
+            'sheets': []
         }
         
         try:
+            # Patch mode: copy the template package and regenerate only the month tab
+            patcher = self.create_sheet_patcher(template_path, month, year) if output_mode == 'patch' else None
+            if patcher is not None:
+                output_path = self.build_output_path(template_path, year, month, output_dir)
+                records_written = patcher.write(output_path, [cfdi_data_list])
+                result['success'] = True
+                result['output_path'] = output_path
+                result['records_processed'] = records_written
+                result['sheets'] = patcher.sheets
+                self.logger.info(f"Excel processing completed: {records_written} records processed")
+                return result
+            
             # Load template
             workbook = self.load_template(template_path)
             if not workbook:
@@ -243,14 +495,8 @@ class ExcelProcessor:
                 result['error_message'] = "Error al llenar la pestaña del mes"
                 return result
             
-            # Create output filename
-            output_filename = self.create_output_filename(year, month, template_path)
-            
-            # Determine output directory
-            if output_dir is None:
-                output_dir = str(Path(template_path).parent)
-            
-            output_path = os.path.join(output_dir, output_filename)
+            # Create output path
+            output_path = self.build_output_path(template_path, year, month, output_dir)
             
             # Save workbook
             if not self.save_workbook(workbook, output_path):
@@ -261,22 +507,87 @@ class ExcelProcessor:
             result['success'] = True
             result['output_path'] = output_path
             result['records_processed'] = len(cfdi_data_list)
+            result['sheets'] = self.last_sheets
             
             self.logger.info(f"Excel processing completed: {len(cfdi_data_list)} records processed")
+        
+        except Exception as e:
+            result['error_message'] = f"Error inesperado: {str(e)}"
+            self.logger.error(f"Unexpected error in Excel processing: {e}")
+        
+        return result
+    
+    def process_cfdi_year_to_excel(self, template_path: Union[str, 'TemplateSession'],
+                                   cfdi_data_list: Union[List[CFDIData], CFDIBatch], year: int,
+                                   output_dir: str = None) -> Dict[str, Any]:
+        """
+        Fill every month tab of a year from unsorted records and save the workbook once.
+        
+        Records are split by the month of their Fecha in one pass; each month
+        with records is written to the tab found by find_month_tab(). Tabs of
+        months without records are left as they are in the template.
+        
+        Args:
+            template_path: Path to Excel template or a TemplateSession
+            cfdi_data_list: List of CFDI data objects or a CFDIBatch, in any order
+            year: Year whose month tabs are filled
+            output_dir: Output directory (default: same as template)
+        
+        Returns:
+            Dictionary like process_cfdi_to_excel() plus 'months' (month -> records
+            written), 'missing_months' (months with records but no tab) and
+            'skipped_records' (records of other years, of months without a tab
+            or without a valid Fecha)
+        """
+        result = {
+            'success': False,
+            'output_path': '',
+            'error_message': '',
+            'records_processed': 0,
+            'sheets': [],
+            'months': {},
+            'missing_months': [],
+            'skipped_records': 0
+        }
+        
+        try:
+            # Load template
+            workbook = self.load_template(template_path)
+            if not workbook:
+                result['error_message'] = "No se pudo cargar la plantilla Excel"
+                return result
+            
+            writer = YearTabWriter(self, workbook, year)
+            writer.write(cfdi_data_list)
+            result.update(writer.summary())
+            if not writer.months:
+                result['error_message'] = f"Ningún CFDI corresponde a una pestaña de mes del año {year}"
+                return result
             
+            # Save workbook
+            output_path = self.build_output_path(template_path, year, None, output_dir)
+            if not self.save_workbook(workbook, output_path):
+                result['error_message'] = "Error al guardar el archivo de salida"
+                return result
+            
+            result['success'] = True
+            result['output_path'] = output_path
+            self.logger.info(f"Excel processing completed: {result['records_processed']} records in "
+                             f"{len(writer.months)} month tabs")
+        
         except Exception as e:
             result['error_message'] = f"Error inesperado: {str(e)}"
             self.logger.error(f"Unexpected error in Excel processing: {e}")
         
         return result
     
-    def validate_template_structure(self, template_path: str) -> Dict[str, Any]:
+    def validate_template_structure(self, template_path: Union[str, 'TemplateSession']) -> Dict[str, Any]:
         """
         Validate that the Excel template has the correct structure.
         
         Args:
-            template_path: Path to Excel template
-            
+            template_path: Path to Excel template or a TemplateSession
+        
         Returns:
             Dictionary with validation results
         """
@@ -287,8 +598,11 @@ class ExcelProcessor:
         }
         
         try:
-            workbook = self.load_template(template_path)
-            if not workbook:
+            # Only the sheet names are needed: read them from the package, not the whole workbook
+            try:
+                sheet_names = TemplateInspector(template_path).sheet_names()
+            except TemplateInspectionError as e:
+                self.logger.error(f"Error inspecting template {template_path}: {e}")
                 validation_result['errors'].append("No se pudo cargar la plantilla")
                 return validation_result
             
@@ -297,7 +611,7 @@ class ExcelProcessor:
             current_year = datetime.now().year
             
             for month in range(1, 13):
-                month_tab = self.find_month_tab(workbook, month, current_year)
+                month_tab = self.match_month_tab_name(sheet_names, month, current_year)
                 if month_tab:
                     month_tabs_found.append(month)
                 else:
@@ -308,8 +622,204 @@ class ExcelProcessor:
                 validation_result['month_tabs_found'] = month_tabs_found
             else:
                 validation_result['errors'].append("No se encontraron pestañas de meses válidas")
-            
+        
         except Exception as e:
             validation_result['errors'].append(f"Error validando plantilla: {str(e)}")
         
-        return validation_result 
\ No newline at end of file
+        return validation_result
+
+
+class MonthTabWriter:
+    """
+    Writes record chunks to a month tab, continuing in new sheets at the row limit.
+    
+    When the next record would go past max_rows_per_sheet, a sheet named
+    like "Ene2025 (2)" is added right after the previous one with the
+    month tab's header rows, and writing goes on there. Chunks are
+    written as they come, so no second pass over the data is needed.
+    """
+    
+    def __init__(self, excel_processor: ExcelProcessor, worksheet: openpyxl.worksheet.worksheet.Worksheet,
+                 start_row: int = None, max_rows: int = None):
+        """
+        Initialize the month tab writer.
+        
+        Args:
+            excel_processor: Processor that writes the rows
+            worksheet: Month tab (already cleared)
+            start_row: First data row (default: data_start_row from config)
+            max_rows: Last row of a sheet (default: max_rows_per_sheet from config)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.excel_processor = excel_processor
+        self.month_worksheet = worksheet
+        self.worksheet = worksheet
+        self.start_row = start_row or EXCEL_CONFIG['data_start_row']
+        self.max_rows = max_rows or EXCEL_CONFIG['max_rows_per_sheet']
+        if self.max_rows < self.start_row:
+            raise ValueError(f"max_rows ({self.max_rows}) is above the first data row ({self.start_row})")
+        self.next_row = self.start_row
+        self.sheets = [worksheet.title]
+    
+    def write(self, records: Union[List[CFDIData], CFDIBatch]) -> int:
+        """
+        Write records after the ones already written.
+        
+        Args:
+            records: List of CFDI data objects or a CFDIBatch
+        
+        Returns:
+            Number of records written
+        """
+        total = len(records)
+        offset = 0
+        while offset < total:
+            if self.next_row > self.max_rows:
+                self._continue_in_new_sheet()
+            count = min(total - offset, self.max_rows - self.next_row + 1)
+            if offset == 0 and count == total:
+                part = records
+            elif isinstance(records, CFDIBatch):
+                part = records.select(range(offset, offset + count))
+            else:
+                part = records[offset:offset + count]
+            self.next_row = self.excel_processor.write_records(self.worksheet, part, self.next_row)
+            offset += count
+        return total
+    
+    def _continue_in_new_sheet(self):
+        """Add the next continuation sheet and move the writing position to it."""
+        workbook = self.month_worksheet.parent
+        title = continuation_sheet_name(self.month_worksheet.title, len(self.sheets) + 1, workbook.sheetnames)
+        self.worksheet = self.excel_processor.add_continuation_sheet(self.month_worksheet, title, self.worksheet)
+        self.sheets.append(title)
+        self.next_row = self.start_row
+        self.logger.info(f"Sheet {self.month_worksheet.title!r} is full, continuing in {title!r}")
+
+
+class YearTabWriter:
+    """
+    Writes unsorted record chunks to the month tabs of one year.
+    
+    Each chunk is split by the month of Fecha and every part is handed to
+    a MonthTabWriter for that month's tab, created (and the tab cleared)
+    when the month's first record arrives. A whole year is therefore
+    written in one pass over the records, into a single loaded workbook.
+    """
+    
+    def __init__(self, excel_processor: ExcelProcessor, workbook: openpyxl.Workbook, year: int):
+        """
+        Initialize the year writer.
+        
+        Args:
+            excel_processor: Processor that finds the tabs and writes the rows
+            workbook: Loaded template
+            year: Year whose month tabs are filled
+        """
+        self.logger = logging.getLogger(__name__)
+        self.excel_processor = excel_processor
+        self.workbook = workbook
+        self.year = year
+        self.months: Dict[int, int] = {}
+        self.missing_months: List[int] = []
+        self.skipped_records = 0
+        self._writers: Dict[int, MonthTabWriter] = {}
+    
+    @property
+    def sheets(self) -> List[str]:
+        """Sheets written so far, month by month."""
+        return [sheet for month in sorted(self._writers) for sheet in self._writers[month].sheets]
+    
+    def write(self, records: Union[List[CFDIData], CFDIBatch]) -> int:
+        """
+        Write records to the tabs of their months.
+        
+        Args:
+            records: List of CFDI data objects or a CFDIBatch, in any order
+        
+        Returns:
+            Number of records written (the rest is counted in skipped_records)
+        """
+        written = 0
+        for key, month_records in group_by_month(records).items():
+            writer = self._month_writer(key[1]) if key is not None and key[0] == self.year else None
+            if writer is None:
+                self.skipped_records += len(month_records)
+                continue
+            writer.write(month_records)
+            self.months[key[1]] = self.months.get(key[1], 0) + len(month_records)
+            written += len(month_records)
+        return written
+    
+    def summary(self) -> Dict[str, Any]:
+        """Result entries of the records written so far (see ExcelProcessor.process_cfdi_year_to_excel)."""
+        return {
+            'records_processed': sum(self.months.values()),
+            'sheets': self.sheets,
+            'months': dict(sorted(self.months.items())),
+            'missing_months': sorted(self.missing_months),
+            'skipped_records': self.skipped_records
+        }
+    
+    def _month_writer(self, month: int) -> Optional[MonthTabWriter]:
+        """Get the writer of a month, starting it on the month's tab the first time (None if there is no tab)."""
+        if month in self._writers:
+            return self._writers[month]
+        if month in self.missing_months:
+            return None
+        sheet_name = self.excel_processor.match_month_tab_name(self.workbook.sheetnames, month, self.year)
+        if sheet_name is None:
+            self.logger.warning(f"Month tab '{self.excel_processor.get_month_tab_name(month, self.year)}' "
+                                f"not found, skipping its records")
+            self.missing_months.append(month)
+            return None
+        worksheet = self.workbook[sheet_name]
+        self.excel_processor.clear_month_data(worksheet)
+        self._writers[month] = MonthTabWriter(self.excel_processor, worksheet)
+        return self._writers[month]
+
+
+class TemplateSession:
+    """
+    Excel template loaded once and shared by every step of one run.
+    
+    Validation, month tab lookup and filling all go through
+    ExcelProcessor.load_template(), which returns the session's workbook
+    instead of reading the file again. The workbook is loaded on first use
+    and then kept; since filling modifies it, a session serves a single run.
+    The session is path-like, so it can be passed wherever a template path
+    is expected.
+    """
+    
+    def __init__(self, template_path: str, excel_processor: ExcelProcessor = None):
+        """
+        Initialize the template session.
+        
+        Args:
+            template_path: Path to Excel template file
+            excel_processor: Processor used to load the template (default: new ExcelProcessor)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.template_path = str(template_path)
+        self.excel_processor = excel_processor or ExcelProcessor()
+        self._workbook = None
+        self._loaded = False
+        self._lock = threading.Lock()  # Validation runs in the GUI thread, filling in a worker
+    
+    @property
+    def workbook(self) -> Optional[openpyxl.Workbook]:
+        """Template workbook, loaded on first access (None if it could not be loaded)."""
+        with self._lock:
+            if not self._loaded:
+                self._workbook = self.excel_processor.load_template(self.template_path)
+                self._loaded = True
+            return self._workbook
+    
+    def __fspath__(self) -> str:
+        return self.template_path
+    
+    def __str__(self) -> str:
+        return self.template_path
+    
+    def __repr__(self) -> str:
+        return f"TemplateSession({self.template_path!r})"
@@ -0,0 +1,294 @@
+"""
+Byte-level scanner for the header nodes of a CFDI document
+"""
+
+from typing import Dict, Optional, Tuple
+import logging
+import mmap
+import re
+
+from .mapping_plan import FieldGroup, MappingPlan
+from .xml_sources import XMLSource, FileSource
+
+# Everything allowed before the root element: UTF-8 BOM, XML declaration, whitespace
+_PROLOG = re.compile(rb'(?:\xef\xbb\xbf)?\s*(?:<\?xml\s[^<>]*\?>)?\s*')
+_ENCODING = re.compile(rb'encoding\s*=\s*["\']([A-Za-z0-9._-]+)["\']')
+_TAG = re.compile(rb'<(/?)([A-Za-z_][\w.-]*:)?([A-Za-z_][\w.-]*)')
+_ATTRIBUTE = re.compile(rb'\s+([A-Za-z_][\w.:-]*)\s*=\s*(?:"([^"<]*)"|\'([^\'<]*)\')')
+_TAG_END = re.compile(rb'\s*(/?)>')
+_END_TAG_END = re.compile(rb'\s*>')
+_REFERENCE = re.compile(r'&(#x[0-9A-Fa-f]+|#[0-9]+|[A-Za-z]+);')
+
+_ENTITIES = {'lt': '<', 'gt': '>', 'amp': '&', 'quot': '"', 'apos': "'"}
+
+CONCEPTOS_CLOSE = b'</cfdi:Conceptos>'
+
+
+class Fallback(Exception):
+    """The document is not in the shape the scanner handles; use a real parser."""
+
+
+def _unescape(raw: bytes) -> str:
+    """
+    Decode an attribute value the way an XML parser would.
+    
+    Literal line breaks and tabs become spaces (attribute value
+    normalization) before character and predefined entity references are
+    expanded.
+    
+    Args:
+        raw: Attribute value bytes between the quotes
+    
+    Returns:
+        Decoded value
+    
+    Raises:
+        Fallback: If the value is not UTF-8 or uses an unknown entity
+    """
+    try:
+        value = raw.decode('utf-8')
+    except UnicodeDecodeError:
+        raise Fallback("attribute value is not UTF-8")
+    if '\r' in value or '\n' in value or '\t' in value:
+        value = value.replace('\r\n', ' ').replace('\r', ' ').replace('\n', ' ').replace('\t', ' ')
+    if '&' not in value:
+        return value
+    
+    def expand(match):
+        name = match.group(1)
+        if name[0] == '#':
+            try:
+                return chr(int(name[2:], 16) if name[1] == 'x' else int(name[1:]))
+            except (ValueError, OverflowError):
+                raise Fallback(f"invalid character reference &{name};")
+        if name not in _ENTITIES:
+            raise Fallback(f"unknown entity &{name};")
+        return _ENTITIES[name]
+    
+    expanded = _REFERENCE.sub(expand, value)
+    if '&' in _REFERENCE.sub('', value):
+        raise Fallback("unterminated entity reference")
+    return expanded
+
+
+class HeaderScanner:
+    """
+    Reads the mapped header attributes straight from the document bytes.
+    
+    Comprobante, Emisor and Receptor sit in the first kilobytes of a CFDI
+    and the top-level Impuestos follows the closing Conceptos tag near the
+    end of the file, so the scanner touches the start and the tail of the
+    document and skips the Conceptos entirely. The SAT stamp
+    (Complemento/TimbreFiscalDigital) is also in the tail. Files are
+    memory-mapped, so only those pages are read from disk.
+    
+    The scanner only accepts documents in the canonical layout (a "cfdi"
+    prefix bound on the root, UTF-8, no DOCTYPE or comments around the
+    header nodes, every mapped element present). Anything else makes
+    scan() return None so the caller can fall back to a full parser.
+    """
+    
+    def __init__(self, plan: MappingPlan):
+        """
+        Initialize the scanner.
+        
+        Args:
+            plan: Compiled mapping plan
+        """
+        self.logger = logging.getLogger(__name__)
+        self.plan = plan
+        
+        # Only attributes of the root, of its direct "cfdi:" children and of their
+        # children (e.g. Complemento/TimbreFiscalDigital) can be scanned
+        self.supported = (
+            all(attr_name is not None for attr_name, _ in plan.root_fields)
+            and all(len(group.steps) <= 2 and group.steps[0][0] == 'cfdi' and not group.reads_text
+                    for group in plan.groups)
+        )
+        self._groups = {}   # Local name of a child of Comprobante -> group
+        self._nested = {}   # (local name of the child, local name of the grandchild) -> group
+        if self.supported:
+            for group in plan.groups:
+                names = tuple(local_name.encode('ascii') for _, local_name in group.steps)
+                if len(names) == 1:
+                    self._groups[names[0]] = group
+                else:
+                    self._nested[names] = group
+    
+    def scan_source(self, source: XMLSource) -> Optional[Dict[str, str]]:
+        """
+        Scan an XML source.
+        
+        Args:
+            source: XML source to scan
+        
+        Returns:
+            Dictionary of Excel column -> extracted value, or None if a full parse is needed
+        """
+        if not self.supported:
+            return None
+        
+        if isinstance(source, FileSource):
+            with open(source.path, 'rb') as xml_file:
+                try:
+                    data = mmap.mmap(xml_file.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    return None  # Empty file
+                try:
+                    return self.scan(data)
+                finally:
+                    data.close()
+        
+        with source.open() as xml_file:
+            return self.scan(xml_file.read())
+    
+    def scan(self, data) -> Optional[Dict[str, str]]:
+        """
+        Scan a document held in memory (bytes or an mmap).
+        
+        Args:
+            data: Document bytes
+        
+        Returns:
+            Dictionary of Excel column -> extracted value, or None if a full parse is needed
+        """
+        try:
+            return self._scan(data)
+        except Fallback as e:
+            self.logger.debug(f"Header scan fell back to full parsing: {e}")
+            return None
+    
+    def _scan(self, data) -> Dict[str, str]:
+        """Scan a document, raising Fallback when it is not in the canonical layout."""
+        prolog = _PROLOG.match(data)
+        declaration = data[:prolog.end()]
+        encoding = _ENCODING.search(declaration)
+        if encoding and encoding.group(1).lower() not in (b'utf-8', b'utf8'):
+            raise Fallback("document is not UTF-8")
+        
+        position = prolog.end()
+        tag = _TAG.match(data, position)
+        if tag is None or tag.group(1) or tag.group(2, 3) != (b'cfdi:', b'Comprobante'):
+            raise Fallback("root element is not cfdi:Comprobante")
+        attributes, position, self_closing = self._read_start_tag(data, tag.end())
+        if self_closing:
+            raise Fallback("empty Comprobante")
+        if attributes.get(b'xmlns:cfdi', '') not in self.plan.cfdi_namespaces:
+            raise Fallback("unknown CFDI namespace")
+        
+        record = self.plan.new_record()
+        for attr_name, excel_column in self.plan.root_fields:
+            record[excel_column] = attributes.get(attr_name.encode('ascii'), '')
+        found = set()
+        
+        # Header: children of Comprobante up to the Conceptos start tag
+        conceptos, position = self._scan_children(data, position, attributes, record, found,
+                                                  stop_at=b'Conceptos')
+        
+        # Tail: children after Conceptos, found from the end of the file
+        if conceptos is not None:
+            if not conceptos:
+                closing = data.rfind(CONCEPTOS_CLOSE)
+                if closing < position:
+                    raise Fallback("closing Conceptos tag not found")
+                position = closing + len(CONCEPTOS_CLOSE)
+            self._scan_children(data, position, attributes, record, found, stop_at=None)
+        
+        if len(found) != len(self.plan.groups):
+            raise Fallback("mapped element not found")
+        return record
+    
+    def _scan_children(self, data, position: int, root_attributes: Dict[bytes, str], record: Dict[str, str],
+                       found: set, stop_at: Optional[bytes]) -> Tuple[Optional[bool], int]:
+        """
+        Walk the tags after position, reading mapped children (and grandchildren) of Comprobante.
+        
+        Args:
+            data: Document bytes
+            position: Offset inside Comprobante, between two of its children
+            root_attributes: Attributes of Comprobante (namespace declarations for grandchildren)
+            record: Record to fill
+            found: Groups read so far
+            stop_at: Local name of the child to stop at (None: walk to </cfdi:Comprobante>)
+        
+        Returns:
+            (whether the stop child was self-closing or None if the walk
+            reached the end of Comprobante, offset after the last tag read)
+        """
+        depth = 0
+        parent = None  # Local name of the child of Comprobante the walk is in
+        while True:
+            position = data.find(b'<', position)
+            if position < 0:
+                raise Fallback("document ended inside Comprobante")
+            tag = _TAG.match(data, position)
+            if tag is None:
+                raise Fallback("comment, CDATA or processing instruction")
+            closing, prefix, local_name = tag.groups()
+            
+            if closing:
+                end = _END_TAG_END.match(data, tag.end())
+                if end is None:
+                    raise Fallback("malformed end tag")
+                position = end.end()
+                if depth:
+                    depth -= 1
+                    continue
+                if prefix == b'cfdi:' and local_name == b'Comprobante':
+                    return None, position
+                raise Fallback("unexpected end tag")
+            
+            attributes, position, self_closing = self._read_start_tag(data, tag.end())
+            if depth == 0:
+                if prefix != b'cfdi:' or any(name.startswith(b'xmlns') for name in attributes):
+                    raise Fallback("unexpected child of Comprobante")
+                parent = local_name
+                group = self._groups.get(local_name)
+                if group is not None and group not in found:
+                    found.add(group)
+                    self._read_group(group, attributes, record)
+                if local_name == stop_at:
+                    return self_closing, position
+            elif depth == 1 and self._nested:
+                group = self._nested.get((parent, local_name))
+                if group is not None and group not in found:
+                    # The grandchild usually declares its own prefix (xmlns:tfd="...")
+                    declaration = b'xmlns:' + prefix[:-1] if prefix else b'xmlns'
+                    namespace = attributes.get(declaration, root_attributes.get(declaration))
+                    expected = group.clark_paths[root_attributes[b'xmlns:cfdi']][1]
+                    if f"{{{namespace}}}{local_name.decode('ascii')}" != expected:
+                        raise Fallback("mapped element in an unexpected namespace")
+                    found.add(group)
+                    self._read_group(group, attributes, record)
+            if not self_closing:
+                depth += 1
+    
+    def _read_group(self, group: FieldGroup, attributes: Dict[bytes, str], record: Dict[str, str]):
+        """Copy the mapped attributes of a group's element into the record."""
+        for attr_name, excel_column in group.fields:
+            record[excel_column] = attributes.get(attr_name.encode('ascii'), '')
+    
+    def _read_start_tag(self, data, position: int) -> Tuple[Dict[bytes, str], int, bool]:
+        """
+        Read the attributes of a start tag.
+        
+        Args:
+            data: Document bytes
+            position: Offset just after the tag name
+        
+        Returns:
+            (attribute name -> decoded value, offset after the tag, self-closing flag)
+        """
+        attributes = {}
+        while True:
+            attribute = _ATTRIBUTE.match(data, position)
+            if attribute is None:
+                break
+            name, double_quoted, single_quoted = attribute.groups()
+            attributes[name] = _unescape(double_quoted if double_quoted is not None else single_quoted)
+            position = attribute.end()
+        
+        end = _TAG_END.match(data, position)
+        if end is None:
+            raise Fallback("malformed start tag")
+        return attributes, end.end(), bool(end.group(1))
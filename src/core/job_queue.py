@@ -0,0 +1,504 @@
+"""
+Persistent job queue and worker pool for unattended processing of many templates
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+# Import configuration
+from config.settings import JOB_QUEUE_CONFIG
+
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_STATUSES = (JOB_PENDING, JOB_RUNNING, JOB_DONE, JOB_FAILED)
+
+# Columns returned for a job, in table order
+_JOB_COLUMNS = ('id', 'template', 'xml_dirs', 'xml_files', 'year', 'month', 'output_dir', 'output_mode',
+                'status', 'attempts', 'max_attempts', 'available_at', 'worker', 'created_at', 'started_at',
+                'finished_at', 'elapsed_seconds', 'output_path', 'error_message', 'summary', 'heartbeat_at')
+
+
+class JobQueue:
+    """
+    SQLite store of fill jobs (template, XML sources, year and month).
+    
+    Jobs move from pending to running when a worker claims them, then to
+    done or, after max_attempts unsuccessful runs, to failed; a failed
+    attempt goes back to pending and becomes available again after
+    retry_delay seconds per attempt. The store keeps the timing, output
+    path, error and summary of each job for later inspection, and can be
+    shared by several worker processes (claims are single UPDATE
+    statements, so two workers never get the same job). Workers write a
+    heartbeat while they run a job; a running job whose heartbeat stops
+    was abandoned and goes back to pending (see requeue_stale()).
+    """
+    
+    def __init__(self, db_path: str = None):
+        """
+        Initialize the job queue.
+        
+        Args:
+            db_path: SQLite file (default: db_path from JOB_QUEUE_CONFIG)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.db_path = db_path or JOB_QUEUE_CONFIG['db_path']
+        
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self._initialize()
+    
+    def _initialize(self):
+        """Create the schema."""
+        with self._lock, self._connection:
+            # WAL lets the status command read while workers write
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " template TEXT NOT NULL,"
+                " xml_dirs TEXT NOT NULL,"
+                " xml_files TEXT NOT NULL,"
+                " year INTEGER NOT NULL,"
+                " month INTEGER,"
+                " output_dir TEXT,"
+                " output_mode TEXT,"
+                " status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " max_attempts INTEGER NOT NULL,"
+                " available_at REAL NOT NULL,"
+                " worker TEXT,"
+                " created_at REAL NOT NULL,"
+                " started_at REAL,"
+                " finished_at REAL,"
+                " elapsed_seconds REAL,"
+                " output_path TEXT,"
+                " error_message TEXT,"
+                " summary TEXT,"
+                " heartbeat_at REAL)"
+            )
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")}
+            if 'heartbeat_at' not in columns:
+                # Queues created before workers wrote heartbeats
+                self._connection.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, available_at)"
+            )
+    
+    def submit(self, template: str, year: int, month: Optional[int], xml_dirs: Sequence[str] = (),
+               xml_files: Sequence[str] = (), output_dir: str = None, output_mode: str = None,
+               max_attempts: int = None) -> int:
+        """
+        Add a job to the queue.
+        
+        Args:
+            template: Path to Excel template
+            year: Year for processing
+            month: Month for processing, or None to fill every month tab of the year
+            xml_dirs: Folders with XML files or ZIP packages
+            xml_files: XML files or ZIP packages
+            output_dir: Output directory (default: same as template)
+            output_mode: "workbook", "patch" or "auto" (default: excel_output_mode from config)
+            max_attempts: Runs before the job is marked failed (default: max_attempts from JOB_QUEUE_CONFIG)
+        
+        Returns:
+            Job id
+        """
+        if not xml_dirs and not xml_files:
+            raise ValueError("A job needs xml_dirs or xml_files")
+        if max_attempts is None:
+            max_attempts = JOB_QUEUE_CONFIG.get('max_attempts', 3)
+        now = time.time()
+        # Paths are stored absolute: workers may run from another directory
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO jobs (template, xml_dirs, xml_files, year, month, output_dir, output_mode,"
+                " status, max_attempts, available_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (os.path.abspath(template), json.dumps([os.path.abspath(path) for path in xml_dirs]),
+                 json.dumps([os.path.abspath(path) for path in xml_files]), year, month,
+                 os.path.abspath(output_dir) if output_dir else None, output_mode,
+                 JOB_PENDING, max(1, max_attempts), now, now)
+            )
+        return cursor.lastrowid
+    
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """
+        Take the oldest available pending job and mark it running.
+        
+        Args:
+            worker: Unique name of the claiming worker (a worker runs one job at a time)
+        
+        Returns:
+            The claimed job (see get()), or None if no job is available
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            claimed = self._connection.execute(
+                "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, started_at = ?, heartbeat_at = ?,"
+                " finished_at = NULL WHERE id = (SELECT id FROM jobs WHERE status = ? AND available_at <= ?"
+                " ORDER BY available_at, id LIMIT 1)",
+                (JOB_RUNNING, worker, now, now, JOB_PENDING, now)
+            ).rowcount
+            if not claimed:
+                return None
+            row = self._connection.execute(
+                f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs WHERE status = ? AND worker = ?"
+                " ORDER BY started_at DESC LIMIT 1", (JOB_RUNNING, worker)
+            ).fetchone()
+        return self._to_job(row)
+    
+    def heartbeat(self, job_id: int, worker: str) -> bool:
+        """
+        Record that a worker is still running a job.
+        
+        Args:
+            job_id: Job id
+            worker: Name of the worker that claimed the job
+        
+        Returns:
+            False if the job is no longer running on this worker (it was requeued as abandoned)
+        """
+        with self._lock, self._connection:
+            return bool(self._connection.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ? AND worker = ?",
+                (time.time(), job_id, JOB_RUNNING, worker)
+            ).rowcount)
+    
+    def complete(self, job_id: int, summary: Dict[str, Any]):
+        """
+        Record the outcome of a run: done if it succeeded, otherwise retried or failed.
+        
+        Args:
+            job_id: Job id
+            summary: Summary returned by BatchRunner.run()
+        """
+        if summary.get('success'):
+            self._finish(job_id, JOB_DONE, summary)
+        else:
+            self.fail(job_id, summary.get('error_message', ''), summary)
+    
+    def fail(self, job_id: int, error_message: str, summary: Dict[str, Any] = None):
+        """
+        Record a failed attempt; the job is retried later unless it is out of attempts.
+        
+        Args:
+            job_id: Job id
+            error_message: Why the attempt failed
+            summary: Summary of the attempt, if there is one
+        """
+        job = self.get(job_id)
+        if job is None:
+            return
+        if job['attempts'] < job['max_attempts']:
+            delay = JOB_QUEUE_CONFIG.get('retry_delay', 30) * job['attempts']
+            self._finish(job_id, JOB_PENDING, summary, error_message, available_at=time.time() + delay)
+            self.logger.warning(f"Job {job_id} attempt {job['attempts']} failed, retrying in {delay}s: "
+                                f"{error_message}")
+        else:
+            self._finish(job_id, JOB_FAILED, summary, error_message)
+            self.logger.error(f"Job {job_id} failed after {job['attempts']} attempts: {error_message}")
+    
+    def _finish(self, job_id: int, status: str, summary: Dict[str, Any] = None, error_message: str = None,
+                available_at: float = None):
+        """Store the end of an attempt."""
+        summary = summary or {}
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, elapsed_seconds = ? - started_at, output_path = ?,"
+                " error_message = ?, summary = ?, available_at = COALESCE(?, available_at) WHERE id = ?",
+                (status, now, now, summary.get('output_path') or None,
+                 error_message if error_message is not None else summary.get('error_message') or None,
+                 json.dumps(summary, ensure_ascii=False) if summary else None, available_at, job_id)
+            )
+    
+    def requeue_stale(self, older_than: float = None) -> int:
+        """
+        Put back jobs left running by workers that died (e.g. the machine was restarted).
+        
+        A job counts as abandoned when its worker has not written a heartbeat
+        for older_than seconds, however long the job itself has been running.
+        
+        Args:
+            older_than: Seconds without a heartbeat before a job counts as abandoned
+                (default: stale_after from JOB_QUEUE_CONFIG)
+        
+        Returns:
+            Number of jobs put back in the queue
+        """
+        if older_than is None:
+            older_than = JOB_QUEUE_CONFIG.get('stale_after', 60)
+        now = time.time()
+        with self._lock, self._connection:
+            requeued = self._connection.execute(
+                "UPDATE jobs SET status = ?, available_at = ? WHERE status = ?"
+                " AND COALESCE(heartbeat_at, started_at) < ?",
+                (JOB_PENDING, now, JOB_RUNNING, now - older_than)
+            ).rowcount
+        if requeued:
+            self.logger.warning(f"Requeued {requeued} abandoned jobs")
+        return requeued
+    
+    def release(self, worker_prefix: str) -> int:
+        """
+        Put back the running jobs of a stopped pool without counting the interrupted attempt.
+        
+        Args:
+            worker_prefix: Prefix of the worker names of the pool (names are "<prefix>-<number>")
+        
+        Returns:
+            Number of jobs put back in the queue
+        """
+        prefix = f"{worker_prefix}-"
+        with self._lock, self._connection:
+            released = self._connection.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, attempts = MAX(attempts - 1, 0)"
+                " WHERE status = ? AND substr(worker, 1, ?) = ?",
+                (JOB_PENDING, time.time(), JOB_RUNNING, len(prefix), prefix)
+            ).rowcount
+        if released:
+            self.logger.warning(f"Put back {released} jobs of stopped workers {prefix}*")
+        return released
+    
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get a job.
+        
+        Args:
+            job_id: Job id
+        
+        Returns:
+            Dictionary with the job columns (xml_dirs, xml_files and summary decoded), or None
+        """
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._to_job(row) if row else None
+    
+    def list_jobs(self, status: str = None, limit: int = None) -> List[Dict[str, Any]]:
+        """
+        List jobs in submission order.
+        
+        Args:
+            status: Only jobs with this status (default: all)
+            limit: Only the latest jobs (default: all)
+        
+        Returns:
+            List of jobs (see get())
+        """
+        if status is not None and status not in JOB_STATUSES:
+            raise ValueError(f"Unknown job status: {status}")
+        query = f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs"
+        parameters = []
+        if status is not None:
+            query += " WHERE status = ?"
+            parameters.append(status)
+        query += " ORDER BY id DESC"
+        if limit:
+            query += " LIMIT ?"
+            parameters.append(limit)
+        with self._lock:
+            rows = self._connection.execute(query, parameters).fetchall()
+        return [self._to_job(row) for row in reversed(rows)]
+    
+    def counts(self) -> Dict[str, int]:
+        """Get the number of jobs per status."""
+        with self._lock:
+            rows = self._connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update(dict(rows))
+        return counts
+    
+    def _to_job(self, row: tuple) -> Dict[str, Any]:
+        """Turn a row into a job dictionary."""
+        job = dict(zip(_JOB_COLUMNS, row))
+        job['xml_dirs'] = json.loads(job['xml_dirs'])
+        job['xml_files'] = json.loads(job['xml_files'])
+        job['summary'] = json.loads(job['summary']) if job['summary'] else None
+        return job
+    
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
+
+
+def run_worker(db_path: str, name: str, parse_workers: int = None, use_cache: bool = None,
+               stop_when_empty: bool = True, poll_interval: float = None) -> int:
+    """
+    Claim and run jobs until the queue is empty (or forever).
+    
+    Runs in the worker processes of JobWorkerPool, and can also be called
+    directly for a single in-process worker. While a job runs, a thread
+    writes its heartbeat every heartbeat_interval seconds. An idle worker
+    requeues abandoned jobs and, with stop_when_empty, returns only once
+    no job is pending or running (a running job may still fail and be
+    retried).
+    
+    Args:
+        db_path: SQLite file of the queue
+        name: Unique worker name
+        parse_workers: Parallel parse workers per job (default: 1, the pool already runs jobs in parallel)
+        use_cache: Use the on-disk parse cache (default: enabled from CACHE_CONFIG)
+        stop_when_empty: Return once no job is available instead of polling
+        poll_interval: Seconds between polls of an empty queue (default: poll_interval from JOB_QUEUE_CONFIG)
+    
+    Returns:
+        Number of jobs run
+    """
+    # Imported here: the queue itself does not need the processing stack
+    from .batch_runner import BatchRunner
+    from .xml_sources import DirectorySource
+    
+    logger = logging.getLogger(__name__)
+    if poll_interval is None:
+        poll_interval = JOB_QUEUE_CONFIG.get('poll_interval', 1.0)
+    heartbeat_interval = JOB_QUEUE_CONFIG.get('heartbeat_interval', 10)
+    job_queue = JobQueue(db_path)
+    runner = BatchRunner(workers=parse_workers or 1, use_cache=use_cache)
+    jobs_run = 0
+    try:
+        while True:
+            job = job_queue.claim(name)
+            if job is None:
+                # Jobs of dead workers, retries and jobs still running elsewhere may become available later
+                job_queue.requeue_stale()
+                counts = job_queue.counts()
+                if stop_when_empty and not counts[JOB_PENDING] and not counts[JOB_RUNNING]:
+                    return jobs_run
+                time.sleep(poll_interval)
+                continue
+            
+            logger.info(f"Worker {name} running job {job['id']} (attempt {job['attempts']})")
+            finished = threading.Event()
+            beating = threading.Thread(target=_beat, args=(job_queue, job['id'], name, finished, heartbeat_interval),
+                                       name=f"{name}-heartbeat", daemon=True)
+            beating.start()
+            try:
+                summary = runner.run(job['template'],
+                                     [DirectorySource(folder) for folder in job['xml_dirs']] + job['xml_files'],
+                                     job['year'], job['month'], output_dir=job['output_dir'],
+                                     output_mode=job['output_mode'])
+                job_queue.complete(job['id'], summary)
+            except Exception as e:
+                job_queue.fail(job['id'], f"Error inesperado: {str(e)}")
+            finally:
+                finished.set()
+                beating.join()
+            jobs_run += 1
+    finally:
+        runner.close()
+        job_queue.close()
+
+
+def _beat(job_queue: JobQueue, job_id: int, worker: str, finished: threading.Event, interval: float):
+    """Write the heartbeat of a running job until it is finished."""
+    while not finished.wait(interval):
+        if not job_queue.heartbeat(job_id, worker):
+            logging.getLogger(__name__).warning(f"Job {job_id} was requeued while {worker} was running it")
+            return
+
+
+class JobWorkerPool:
+    """
+    Pool of worker processes draining a JobQueue concurrently.
+    
+    Each process runs run_worker() with its own database connection and
+    BatchRunner, so jobs of different clients are parsed and written in
+    parallel without sharing any state but the queue file. The jobs that
+    failed for good during the last run() are listed in last_failures.
+    """
+    
+    def __init__(self, db_path: str = None, workers: int = None, parse_workers: int = None,
+                 use_cache: bool = None):
+        """
+        Initialize the worker pool.
+        
+        Args:
+            db_path: SQLite file of the queue (default: db_path from JOB_QUEUE_CONFIG)
+            workers: Worker processes (default: workers from JOB_QUEUE_CONFIG)
+            parse_workers: Parallel parse workers per job (default: 1)
+            use_cache: Use the on-disk parse cache (default: enabled from CACHE_CONFIG)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.db_path = os.path.abspath(db_path or JOB_QUEUE_CONFIG['db_path'])
+        self.workers = workers or JOB_QUEUE_CONFIG.get('workers', 2)
+        self.parse_workers = parse_workers
+        self.use_cache = use_cache
+        self.last_failures: List[Dict[str, Any]] = []
+    
+    def run(self, stop_when_empty: bool = True) -> Dict[str, int]:
+        """
+        Start the workers and wait for them to finish.
+        
+        Jobs left running by a previous pool that died are put back first.
+        If the pool is interrupted, the jobs its workers were running go back
+        to pending; the job of a worker process that crashed counts as a
+        failed attempt.
+        
+        Args:
+            stop_when_empty: Stop once the queue is drained instead of waiting for new jobs
+        
+        Returns:
+            Number of jobs per status once the workers are done (whole queue;
+            the jobs this run failed are left in last_failures)
+        """
+        self.last_failures = []
+        started = time.time()
+        job_queue = JobQueue(self.db_path)
+        try:
+            job_queue.requeue_stale()
+        finally:
+            job_queue.close()
+        
+        # "spawn" behaves the same on every platform and inside the PyInstaller build
+        context = multiprocessing.get_context('spawn')
+        prefix = f"{socket.gethostname()}-{os.getpid()}"
+        processes = [
+            context.Process(target=run_worker, name=f"cfdi-job-worker-{number}",
+                            args=(self.db_path, f"{prefix}-{number}", self.parse_workers, self.use_cache,
+                                  stop_when_empty))
+            for number in range(1, self.workers + 1)
+        ]
+        self.logger.info(f"Starting {len(processes)} job workers on {self.db_path}")
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+            job_queue = JobQueue(self.db_path)
+            try:
+                job_queue.release(prefix)
+            finally:
+                job_queue.close()
+            raise
+        
+        job_queue = JobQueue(self.db_path)
+        try:
+            # Workers only return with no job running, so a job still running here lost its worker
+            exit_codes = {f"{prefix}-{number}": process.exitcode for number, process in enumerate(processes, 1)}
+            for job in job_queue.list_jobs(JOB_RUNNING):
+                if job['worker'] in exit_codes:
+                    job_queue.fail(job['id'], f"El proceso del trabajador terminó inesperadamente "
+                                              f"(código {exit_codes[job['worker']]})")
+            self.last_failures = sorted(
+                (job for job in job_queue.list_jobs(JOB_FAILED)
+                 if job['worker'] in exit_codes and job['finished_at'] >= started),
+                key=lambda job: job['id'])
+            return job_queue.counts()
+        finally:
+            job_queue.close()
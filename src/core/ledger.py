@@ -0,0 +1,285 @@
+"""
+Persistent ledger of extracted CFDI records
+"""
+
+from datetime import datetime
+from typing import Any, Iterator, List, Optional, Set, Tuple, Union
+import logging
+import sqlite3
+import threading
+import time
+
+# Import configuration
+from config.settings import LEDGER_CONFIG
+from .data_models import CFDIBatch, CFDIData, CFDI_COLUMNS, UUID_KEY, normalize_uuid
+
+# Ledger columns holding the Excel columns, in CFDI_COLUMNS order
+_VALUE_COLUMNS = ('fecha', 'forma_pago', 'subtotal', 'descuento', 'moneda', 'total', 'tipo_comprobante',
+                  'metodo_pago', 'emisor_rfc', 'emisor_nombre', 'emisor_regimen', 'receptor_rfc',
+                  'receptor_nombre', 'receptor_regimen', 'total_impuestos')
+
+# Columns read back into records, in the order CFDIBatch.append_values() is given them
+_RECORD_COLUMNS = _VALUE_COLUMNS + ('uuid', 'file_path', 'file_name')
+_RECORD_SOURCE_COLUMNS = CFDI_COLUMNS + (UUID_KEY,)
+
+
+class CFDILedger:
+    """
+    SQLite store of every record extracted from the XML files.
+    
+    Records are kept with their TimbreFiscalDigital UUID and indexed on
+    UUID, emisor and receptor RFC and Fecha, so questions such as "which
+    invoices did this RFC issue in Q2" or "was this UUID already loaded"
+    and month fills (see iter_batches()) are answered without parsing the
+    XML again. Each invoice is stored once: the first file read with a
+    UUID keeps it, and reading that same file again refreshes the record
+    while copies of the invoice in other files are ignored, as in
+    UUIDIndex. Documents without a stamp are keyed by file path. Fecha is
+    also stored as a sortable "YYYY-MM-DDTHH:MM:SS" value for range
+    queries.
+    """
+    
+    def __init__(self, db_path: str = None):
+        """
+        Initialize the ledger.
+        
+        Args:
+            db_path: SQLite file (default: db_path from LEDGER_CONFIG)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.db_path = db_path or LEDGER_CONFIG['db_path']
+        
+        # The pipeline writes from its parse thread; job queue workers may share the file
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self._initialize()
+    
+    def _initialize(self):
+        """Create the schema."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                " id INTEGER PRIMARY KEY,"
+                " record_key TEXT NOT NULL UNIQUE,"
+                " uuid TEXT,"
+                + "".join(f" {column} TEXT NOT NULL," for column in _VALUE_COLUMNS) +
+                " fecha_value TEXT,"
+                " file_path TEXT NOT NULL,"
+                " file_name TEXT NOT NULL,"
+                " loaded_at REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS idx_records_uuid ON records (uuid)")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_records_emisor ON records (emisor_rfc, fecha_value)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_records_receptor ON records (receptor_rfc, fecha_value)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS idx_records_fecha ON records (fecha_value)")
+    
+    def add(self, records: Union[List[CFDIData], CFDIBatch]) -> int:
+        """
+        Store records; an invoice already stored from another file is kept as it is.
+        
+        Args:
+            records: List of CFDI data objects or a CFDIBatch
+        
+        Returns:
+            Number of records given
+        """
+        if isinstance(records, CFDIBatch):
+            rows = zip(records.iter_rows(), records.fecha_values, records.uuids, records.file_paths,
+                       records.file_names)
+        else:
+            rows = ((cfdi_data.excel_values(), cfdi_data.fecha_value, cfdi_data.uuid, cfdi_data.file_path,
+                     cfdi_data.file_name) for cfdi_data in records)
+        
+        now = time.time()
+        parameters = []
+        for values, fecha_value, uuid, file_path, file_name in rows:
+            uuid = normalize_uuid(uuid)
+            parameters.append((f"uuid:{uuid}" if uuid else f"file:{file_path}", uuid or None, *values,
+                               _sortable(fecha_value), file_path, file_name, now))
+        if not parameters:
+            return 0
+        
+        columns = ('record_key', 'uuid') + _VALUE_COLUMNS + ('fecha_value', 'file_path', 'file_name', 'loaded_at')
+        updates = ', '.join(f"{column} = excluded.{column}" for column in columns[1:])
+        with self._lock, self._connection:
+            # First copy wins: only a new read of the same file replaces a stored invoice
+            self._connection.executemany(
+                f"INSERT INTO records ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+                f" ON CONFLICT (record_key) DO UPDATE SET {updates} WHERE records.file_path = excluded.file_path",
+                parameters
+            )
+        return len(parameters)
+    
+    def contains(self, uuid: str) -> bool:
+        """
+        Check whether an invoice is already in the ledger.
+        
+        Args:
+            uuid: TimbreFiscalDigital UUID (case and surrounding spaces are ignored)
+        
+        Returns:
+            True if a record with this UUID is stored
+        """
+        return bool(self.known_uuids([uuid]))
+    
+    def known_uuids(self, uuids: List[str]) -> Set[str]:
+        """
+        Find which of several UUIDs are already in the ledger.
+        
+        Args:
+            uuids: TimbreFiscalDigital UUIDs
+        
+        Returns:
+            Set of the stored ones, normalized (see normalize_uuid())
+        """
+        wanted = list({normalize_uuid(uuid) for uuid in uuids} - {''})
+        known = set()
+        with self._lock:
+            # Stay below SQLite's limit on query parameters
+            for start in range(0, len(wanted), 500):
+                chunk = wanted[start:start + 500]
+                known.update(row[0] for row in self._connection.execute(
+                    f"SELECT uuid FROM records WHERE uuid IN ({', '.join('?' * len(chunk))})", chunk
+                ))
+        return known
+    
+    def query(self, uuid: str = None, rfc: str = None, emisor_rfc: str = None, receptor_rfc: str = None,
+              start: datetime = None, end: datetime = None, limit: int = None) -> CFDIBatch:
+        """
+        Get the records matching every given criterion, ordered by Fecha.
+        
+        Args:
+            uuid: TimbreFiscalDigital UUID
+            rfc: RFC of either the emisor or the receptor
+            emisor_rfc: RFC of the emisor
+            receptor_rfc: RFC of the receptor
+            start: Earliest Fecha (inclusive)
+            end: Latest Fecha (exclusive)
+            limit: Maximum number of records
+        
+        Returns:
+            CFDIBatch with the matching records
+        """
+        batch = CFDIBatch(_RECORD_SOURCE_COLUMNS)
+        for chunk in self.iter_batches(uuid=uuid, rfc=rfc, emisor_rfc=emisor_rfc, receptor_rfc=receptor_rfc,
+                                       start=start, end=end, limit=limit):
+            batch.extend(chunk)
+        return batch
+    
+    def count(self, uuid: str = None, rfc: str = None, emisor_rfc: str = None, receptor_rfc: str = None,
+              start: datetime = None, end: datetime = None) -> int:
+        """
+        Count the records matching every given criterion (see query()).
+        
+        Returns:
+            Number of matching records
+        """
+        where, parameters = self._where(uuid, rfc, emisor_rfc, receptor_rfc, start, end)
+        with self._lock:
+            return self._connection.execute(f"SELECT COUNT(*) FROM records{where}", parameters).fetchone()[0]
+    
+    def iter_batches(self, uuid: str = None, rfc: str = None, emisor_rfc: str = None, receptor_rfc: str = None,
+                     start: datetime = None, end: datetime = None, limit: int = None,
+                     batch_size: int = None) -> Iterator[CFDIBatch]:
+        """
+        Read the records matching the criteria of query() chunk by chunk, ordered by Fecha.
+        
+        Month fills use this instead of parsing the XML files again (see
+        CFDIPipeline.run()); only batch_size records are held at a time.
+        
+        Args:
+            uuid: TimbreFiscalDigital UUID
+            rfc: RFC of either the emisor or the receptor
+            emisor_rfc: RFC of the emisor
+            receptor_rfc: RFC of the receptor
+            start: Earliest Fecha (inclusive)
+            end: Latest Fecha (exclusive)
+            limit: Maximum number of records
+            batch_size: Records per chunk (default: batch_size from LEDGER_CONFIG)
+        
+        Yields:
+            CFDIBatch with the next chunk of records
+        """
+        batch_size = batch_size or LEDGER_CONFIG.get('batch_size', 5000)
+        where, parameters = self._where(uuid, rfc, emisor_rfc, receptor_rfc, start, end)
+        query = f"SELECT {', '.join(_RECORD_COLUMNS)} FROM records{where} ORDER BY fecha_value, id"
+        if limit:
+            query += " LIMIT ?"
+            parameters.append(limit)
+        
+        with self._lock:
+            cursor = self._connection.execute(query, parameters)
+        try:
+            while True:
+                with self._lock:
+                    rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                batch = CFDIBatch(_RECORD_SOURCE_COLUMNS)
+                for row in rows:
+                    batch.append_values(row[:-2], row[-2], row[-1])
+                yield batch
+        finally:
+            cursor.close()
+    
+    def _where(self, uuid: str = None, rfc: str = None, emisor_rfc: str = None, receptor_rfc: str = None,
+               start: datetime = None, end: datetime = None) -> Tuple[str, List[Any]]:
+        """Build the WHERE clause and parameters for the query criteria."""
+        conditions = []
+        parameters: List[Any] = []
+        if uuid:
+            conditions.append("uuid = ?")
+            parameters.append(normalize_uuid(uuid))
+        if rfc:
+            conditions.append("(emisor_rfc = ? OR receptor_rfc = ?)")
+            parameters.extend([rfc.strip().upper()] * 2)
+        if emisor_rfc:
+            conditions.append("emisor_rfc = ?")
+            parameters.append(emisor_rfc.strip().upper())
+        if receptor_rfc:
+            conditions.append("receptor_rfc = ?")
+            parameters.append(receptor_rfc.strip().upper())
+        if start is not None:
+            conditions.append("fecha_value >= ?")
+            parameters.append(_sortable(start))
+        if end is not None:
+            conditions.append("fecha_value < ?")
+            parameters.append(_sortable(end))
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), parameters
+    
+    def __len__(self) -> int:
+        """Number of stored records."""
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+    
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
+
+
+def month_range(year: int, month: Optional[int]) -> Tuple[datetime, datetime]:
+    """
+    Get the Fecha range of a month, or of a whole year.
+    
+    Args:
+        year: Year
+        month: Month (1-12), or None for the whole year
+    
+    Returns:
+        (start, end) with end exclusive, as taken by CFDILedger.query()
+    """
+    if month is None:
+        return datetime(year, 1, 1), datetime(year + 1, 1, 1)
+    if month == 12:
+        return datetime(year, 12, 1), datetime(year + 1, 1, 1)
+    return datetime(year, month, 1), datetime(year, month + 1, 1)
+
+
+def _sortable(fecha_value: Optional[datetime]) -> Optional[str]:
+    """Fecha as stored in fecha_value (ISO text sorts like the dates)."""
+    return fecha_value.strftime('%Y-%m-%dT%H:%M:%S') if fecha_value is not None else None
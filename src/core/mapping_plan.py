@@ -0,0 +1,227 @@
+"""
+Compiled accessor plan for the CFDI XML to Excel mapping
+"""
+
+from typing import Dict, FrozenSet, List, Optional, Tuple
+import xml.etree.ElementTree as ET
+import hashlib
+
+# Import configuration
+from config.settings import CFDI_MAPPING, CFDI_NAMESPACES, CFDI_IDENTITY_MAPPING, CFDI_EXTRA_NAMESPACES
+
+ROOT_ELEMENT = 'cfdi:Comprobante'
+
+
+class FieldGroup:
+    """All mapped fields that live on the same XML element."""
+    
+    __slots__ = ('steps', 'fields', 'clark_paths', 'reads_text')
+    
+    def __init__(self, steps: Tuple[Tuple[str, str], ...]):
+        """
+        Initialize the field group.
+        
+        Args:
+            steps: (prefix, local name) steps below the root element
+        """
+        self.steps = steps
+        self.fields: List[Tuple[Optional[str], str]] = []  # (attribute or None for text, column)
+        self.clark_paths: Dict[str, Tuple[str, ...]] = {}  # CFDI namespace -> Clark tag per step
+        self.reads_text = False  # True if any field reads element text (only complete at the end tag)
+    
+    def read(self, element: ET.Element, record: Dict[str, str]):
+        """
+        Copy the group's values from an element into a record.
+        
+        Args:
+            element: Element matching this group
+            record: Record dictionary to update (Excel column -> value)
+        """
+        for attr_name, excel_column in self.fields:
+            if attr_name is None:
+                record[excel_column] = element.text or ''
+            else:
+                record[excel_column] = element.get(attr_name, '')
+
+
+class MappingPlan:
+    """
+    Mapping resolved once into Clark-notation tags grouped by element.
+    
+    The "cfdi" prefix resolves to the namespace of the document's CFDI
+    version, which is detected once per file from the root tag. Any other
+    prefix must be listed in the namespaces passed to compile_mapping().
+    """
+    
+    def __init__(self, root_fields: List[Tuple[Optional[str], str]], groups: List[FieldGroup],
+                 columns: Tuple[str, ...], signature: str = ''):
+        """
+        Initialize the plan. Use compile_mapping() instead of calling this directly.
+        
+        Args:
+            root_fields: (attribute, column) pairs read from the root element
+            groups: Field groups for elements below the root
+            columns: Excel columns in mapping order
+            signature: Digest of the source mapping (identifies cached records)
+        """
+        self.root_fields = root_fields
+        self.groups = groups
+        self.columns = columns
+        self.signature = signature
+        self.cfdi_namespaces = tuple(CFDI_NAMESPACES.values())
+        
+        # The Addenda is always the last child of Comprobante; nothing mapped lives after it
+        # unless the mapping reaches into the Addenda itself
+        if any(group.steps[0][1] == 'Addenda' for group in groups):
+            self.stop_tags = frozenset()
+        else:
+            self.stop_tags = frozenset(f"{{{namespace}}}Addenda" for namespace in self.cfdi_namespaces)
+        
+        # Streaming lookup: CFDI namespace -> {tuple of Clark tags below root: group}
+        self._stream_index = {
+            namespace: {group.clark_paths[namespace]: group for group in groups}
+            for namespace in self.cfdi_namespaces
+        }
+        # Every path leading to a mapped element; the streaming extractor skips the other subtrees
+        self._stream_prefixes = {
+            namespace: frozenset(path[:length] for path in index for length in range(1, len(path) + 1))
+            for namespace, index in self._stream_index.items()
+        }
+    
+    def new_record(self) -> Dict[str, str]:
+        """Create an empty record with every mapped column set to ''."""
+        return dict.fromkeys(self.columns, '')
+    
+    def detect_namespace(self, root_tag: str) -> Optional[str]:
+        """
+        Detect the CFDI namespace from the root tag.
+        
+        Args:
+            root_tag: Clark-notation tag of the root element
+        
+        Returns:
+            The CFDI namespace URI or None if the root is not in a known CFDI namespace
+        """
+        if root_tag[:1] == '{':
+            namespace = root_tag[1:root_tag.find('}')]
+            if namespace in self.cfdi_namespaces:
+                return namespace
+        return None
+    
+    def candidate_namespaces(self, root_tag: str) -> Tuple[str, ...]:
+        """Namespaces to try for child elements (all known ones if the version is unknown)."""
+        namespace = self.detect_namespace(root_tag)
+        return (namespace,) if namespace else self.cfdi_namespaces
+    
+    def stream_index(self, root_tag: str) -> Dict[Tuple[str, ...], FieldGroup]:
+        """
+        Lookup table used by the streaming extractor.
+        
+        Args:
+            root_tag: Clark-notation tag of the root element
+        
+        Returns:
+            Dictionary of Clark tag path below the root -> field group
+        """
+        namespace = self.detect_namespace(root_tag)
+        if namespace:
+            return self._stream_index[namespace]
+        
+        index = {}
+        for namespace in reversed(self.cfdi_namespaces):
+            index.update(self._stream_index[namespace])
+        return index
+    
+    def stream_prefixes(self, root_tag: str) -> FrozenSet[Tuple[str, ...]]:
+        """
+        Clark tag paths below the root that lead to a mapped element.
+        
+        Args:
+            root_tag: Clark-notation tag of the root element
+        
+        Returns:
+            Set of the paths of mapped elements and of their ancestors
+        """
+        namespace = self.detect_namespace(root_tag)
+        if namespace:
+            return self._stream_prefixes[namespace]
+        return frozenset().union(*self._stream_prefixes.values())
+    
+    def extract(self, root: ET.Element) -> Dict[str, str]:
+        """
+        Extract every mapped value from a parsed document.
+        
+        Args:
+            root: Root element of the XML tree
+        
+        Returns:
+            Dictionary of Excel column -> extracted value
+        """
+        record = self.new_record()
+        for attr_name, excel_column in self.root_fields:
+            record[excel_column] = root.get(attr_name, '')
+        
+        namespaces = self.candidate_namespaces(root.tag)
+        for group in self.groups:
+            for namespace in namespaces:
+                element = root.find('/'.join(group.clark_paths[namespace]))
+                if element is not None:
+                    group.read(element, record)
+                    break
+        return record
+
+
+def compile_mapping(mapping: Dict[str, str], namespaces: Dict[str, str] = None) -> MappingPlan:
+    """
+    Compile an XML path -> Excel column mapping into a MappingPlan.
+    
+    Args:
+        mapping: Mapping such as CFDI_MAPPING ("cfdi:Emisor/@Rfc" -> "J")
+        namespaces: Extra prefix -> namespace URI entries for non-"cfdi" prefixes
+    
+    Returns:
+        Compiled MappingPlan
+    
+    Raises:
+        ValueError: If a path uses an unknown namespace prefix
+    """
+    namespaces = namespaces or {}
+    root_fields = []
+    groups: Dict[Tuple[Tuple[str, str], ...], FieldGroup] = {}
+    
+    for xml_path, excel_column in mapping.items():
+        element_path, separator, attr_name = xml_path.partition('/@')
+        attr_name = attr_name if separator else None
+        
+        if element_path == ROOT_ELEMENT:
+            root_fields.append((attr_name, excel_column))
+            continue
+        
+        steps = []
+        for step in element_path.split('/'):
+            if step == ROOT_ELEMENT and not steps:
+                continue
+            prefix, _, local_name = step.rpartition(':')
+            if prefix != 'cfdi' and prefix not in namespaces:
+                raise ValueError(f"Unknown namespace prefix '{prefix}' in mapping path {xml_path}")
+            steps.append((prefix, local_name))
+        steps = tuple(steps)
+        
+        if steps not in groups:
+            group = FieldGroup(steps)
+            for cfdi_namespace in CFDI_NAMESPACES.values():
+                group.clark_paths[cfdi_namespace] = tuple(
+                    f"{{{cfdi_namespace if prefix == 'cfdi' else namespaces[prefix]}}}{local_name}"
+                    for prefix, local_name in steps
+                )
+            groups[steps] = group
+        groups[steps].fields.append((attr_name, excel_column))
+        groups[steps].reads_text |= attr_name is None
+    
+    signature = hashlib.sha1(repr((list(mapping.items()), sorted(namespaces.items()),
+                                   sorted(CFDI_NAMESPACES.items()))).encode('utf-8')).hexdigest()
+    return MappingPlan(root_fields, list(groups.values()), tuple(mapping.values()), signature)
+
+
+# Plan for the application mapping plus the identity fields (UUID), compiled once at import time
+DEFAULT_PLAN = compile_mapping({**CFDI_MAPPING, **CFDI_IDENTITY_MAPPING}, CFDI_EXTRA_NAMESPACES)
@@ -0,0 +1,215 @@
+"""
+Persistent cache of parsed CFDI records
+"""
+
+from typing import Dict, List, Optional, Tuple, Any, Union
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zipfile
+
+# Import configuration
+from config.settings import CACHE_CONFIG
+from .xml_sources import XMLSource, FileSource, to_source
+
+# (path, size, mtime_ns or ZIP CRC-32, content hash or '') identifying one version of a file
+CacheKey = Tuple[str, int, int, str]
+
+
+class ParseCache:
+    """
+    SQLite cache of extracted records keyed by path, size, mtime and optional content hash.
+    
+    Records are stored as the tuple of values in mapping plan column order.
+    The cache is tied to one mapping plan: if the plan signature changes,
+    every entry is discarded. When the cache grows past max_entries the
+    least recently used entries are evicted.
+    """
+    
+    def __init__(self, db_path: str = None, plan_signature: str = '', max_entries: int = None,
+                 hash_contents: bool = None):
+        """
+        Initialize the parse cache.
+        
+        Args:
+            db_path: SQLite file (default: db_path from CACHE_CONFIG)
+            plan_signature: Signature of the mapping plan the records belong to
+            max_entries: Maximum cached files (default: max_entries from CACHE_CONFIG)
+            hash_contents: Include a SHA-1 of the file contents in the key
+                (default: hash_contents from CACHE_CONFIG)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.db_path = db_path or CACHE_CONFIG['db_path']
+        self.max_entries = max_entries if max_entries is not None else CACHE_CONFIG['max_entries']
+        self.hash_contents = hash_contents if hash_contents is not None else CACHE_CONFIG['hash_contents']
+        self.plan_signature = plan_signature
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._touched: List[str] = []  # Paths hit since the last write, for LRU bookkeeping
+        
+        # The GUI creates the cache in the Tk thread and uses it from the worker thread;
+        # job queue workers in other processes may hold the write lock for a while
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self._initialize(plan_signature)
+    
+    def _initialize(self, plan_signature: str):
+        """Create the schema and drop entries written for a different mapping plan."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " path TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " content_hash TEXT NOT NULL,"
+                " record TEXT NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries (last_used)"
+            )
+            
+            row = self._connection.execute(
+                "SELECT value FROM meta WHERE key = 'plan_signature'"
+            ).fetchone()
+            if row is None or row[0] != plan_signature:
+                if row is not None:
+                    self.logger.info("Mapping plan changed, clearing parse cache")
+                self._connection.execute("DELETE FROM entries")
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('plan_signature', ?)",
+                    (plan_signature,)
+                )
+    
+    def make_key(self, source: Union[str, XMLSource]) -> Optional[CacheKey]:
+        """
+        Build the cache key for the current version of a file.
+        
+        Args:
+            source: Path to the XML file or an XML source
+        
+        Returns:
+            Cache key or None if the file cannot be read
+        """
+        source = to_source(source)
+        try:
+            size, stamp = source.fingerprint()
+            content_hash = ''
+            if self.hash_contents:
+                with source.open() as xml_file:
+                    content_hash = hashlib.sha1(xml_file.read()).hexdigest()
+            if isinstance(source, FileSource):
+                path = os.path.abspath(source.path)
+            else:
+                path = os.path.join(os.path.abspath(source.archive_path), source.member_name)
+            return path, size, stamp, content_hash
+        except (OSError, KeyError, zipfile.BadZipFile):
+            return None
+    
+    def get(self, key: Optional[CacheKey]) -> Optional[Tuple[str, ...]]:
+        """
+        Look up the record cached for a file version.
+        
+        Args:
+            key: Key returned by make_key()
+        
+        Returns:
+            Tuple of values in plan column order, or None on a miss
+        """
+        if key is None:
+            self.misses += 1
+            return None
+        
+        path, size, mtime_ns, content_hash = key
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT size, mtime_ns, content_hash, record FROM entries WHERE path = ?", (path,)
+            ).fetchone()
+            if row is None or tuple(row[:3]) != (size, mtime_ns, content_hash):
+                self.misses += 1
+                return None
+            self._touched.append(path)
+        self.hits += 1
+        return tuple(json.loads(row[3]))
+    
+    def put_many(self, items: List[Tuple[CacheKey, Tuple[str, ...]]]):
+        """
+        Store records for several file versions and apply the eviction policy.
+        
+        Also records the use of every entry returned by get() since the last
+        write, so a whole batch costs a single transaction.
+        
+        Args:
+            items: (key, values in plan column order) pairs
+        """
+        now = time.time()
+        rows = [
+            (path, size, mtime_ns, content_hash, json.dumps(list(values), ensure_ascii=False), now)
+            for (path, size, mtime_ns, content_hash), values in items
+        ]
+        
+        with self._lock, self._connection:
+            touched, self._touched = self._touched, []
+            if touched:
+                self._connection.executemany(
+                    "UPDATE entries SET last_used = ? WHERE path = ?", [(now, path) for path in touched]
+                )
+            if not rows:
+                return
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO entries (path, size, mtime_ns, content_hash, record, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self._evict()
+    
+    def _evict(self):
+        """Delete the least recently used entries above max_entries (caller holds the lock)."""
+        if not self.max_entries:
+            return
+        count = self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._connection.execute(
+                "DELETE FROM entries WHERE path IN"
+                " (SELECT path FROM entries ORDER BY last_used LIMIT ?)", (excess,)
+            )
+            self.evictions += excess
+            self.logger.info(f"Evicted {excess} entries from the parse cache")
+    
+    def clear(self):
+        """Remove every cached record."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM entries")
+    
+    def __len__(self) -> int:
+        """Number of cached records."""
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache usage counters.
+        
+        Returns:
+            Dictionary with hits, misses, evictions and current entry count
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self)
+        }
+    
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,303 @@
+"""
+Streaming pipeline from CFDI XML sources to the filled Excel template
+"""
+
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional
+import logging
+import os
+import queue
+import threading
+
+# Import configuration
+from config.settings import PROCESSING_CONFIG
+from .xml_parser import CFDIXMLParser
+from .data_models import CFDIBatch, CFDIDataProcessor, ProcessingResult
+from .excel_processor import ExcelProcessor, MonthTabWriter, YearTabWriter
+from .xml_sources import close_archives, count_sources
+from .ledger import CFDILedger
+from .uuid_index import UUIDIndex, create_uuid_index
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+class _StageFailed(Exception):
+    """Raised in a stage when another stage has failed or the run was stopped."""
+
+
+class CFDIPipeline:
+    """
+    Source -> parse -> validate -> write pipeline with bounded queues.
+    
+    Files are parsed into CFDIBatch chunks of batch_size files in
+    one thread, validated in a second one and written to the month tab by
+    the calling thread. The queues between the stages hold at most
+    pipeline_queue_size chunks, so only a few chunks of records are alive
+    at any time, and the run statistics are accumulated chunk by chunk.
+    With a ledger, the valid records of every chunk are also stored in it
+    (after repeats are dropped), and runs can take their records from the
+    ledger instead of parsing XML. Invoices
+    read twice in a run (same UUID) are detected in the validation stage
+    and dropped or flagged as configured in DUPLICATE_CONFIG.
+    """
+    
+    def __init__(self, xml_parser: CFDIXMLParser = None, data_processor: CFDIDataProcessor = None,
+                 excel_processor: ExcelProcessor = None, queue_size: int = None, batch_size: int = None,
+                 workers: int = None, ledger: CFDILedger = None, duplicate_mode: str = None):
+        """
+        Initialize the pipeline.
+        
+        Args:
+            xml_parser: Parser for the XML stage (default: new CFDIXMLParser)
+            data_processor: Processor for the validation stage (default: new CFDIDataProcessor)
+            excel_processor: Processor for the Excel stage (default: new ExcelProcessor)
+            queue_size: Chunks buffered between stages (default: pipeline_queue_size from config)
+            batch_size: Files per chunk (default: max_files_per_batch from config)
+            workers: Parallel parse workers (default: parse_workers from config, 1 = serial)
+            ledger: Ledger the parsed records are stored in
+            duplicate_mode: "drop", "flag" or "off" (default: mode from DUPLICATE_CONFIG)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.xml_parser = xml_parser or CFDIXMLParser()
+        self.data_processor = data_processor or CFDIDataProcessor()
+        self.excel_processor = excel_processor or ExcelProcessor()
+        self.queue_size = queue_size or PROCESSING_CONFIG.get('pipeline_queue_size', 2)
+        self.batch_size = batch_size
+        self.workers = workers
+        self.ledger = ledger
+        self.duplicate_mode = duplicate_mode
+    
+    def run(self, template_path: str, xml_sources: Iterable[Any], year: int, month: Optional[int],
+            output_dir: str = None, progress: Callable[[int], None] = None,
+            output_mode: str = None, records: Iterable[CFDIBatch] = None,
+            record_count: int = None) -> Dict[str, Any]:
+        """
+        Parse, validate and write every source into the month tab of the template.
+        
+        Args:
+            template_path: Path to Excel template or a TemplateSession
+            xml_sources: XML paths, ZIP package paths, folders (DirectorySource) or XML sources
+                (ignored when records are given)
+            year: Year for processing
+            month: Month for processing, or None to fill every month tab of the year
+                from the month of each record's Fecha (always uses the workbook writer)
+            output_dir: Output directory (default: same as template)
+            progress: Called with the number of files handled so far after each chunk
+            output_mode: "workbook", "patch" or "auto", as in ExcelProcessor.process_cfdi_to_excel()
+                ("auto" counts the documents, listing folders and ZIP packages without parsing them)
+            records: Chunks of already extracted records to write instead of parsing
+                xml_sources (e.g. CFDILedger.iter_batches()); they are validated as usual
+            record_count: Number of records in records, if known (for the "auto" output mode)
+        
+        Returns:
+            Dictionary like ExcelProcessor.process_cfdi_to_excel() (or
+            process_cfdi_year_to_excel() when month is None) plus
+            'processing_result' (a ProcessingResult without processed_data)
+        """
+        processing_result = ProcessingResult()
+        result = {
+            'success': False,
+            'output_path': '',
+            'error_message': '',
+            'records_processed': 0,
+            'sheets': [],
+            'processing_result': processing_result
+        }
+        
+        # Open the template before parsing anything, so a bad template fails fast
+        source_count = self._count_sources(xml_sources) if records is None else record_count
+        output_mode = self.excel_processor.resolve_output_mode(output_mode, source_count)
+        patcher = None
+        if month is not None and output_mode == 'patch':
+            patcher = self.excel_processor.create_sheet_patcher(template_path, month, year)
+        if patcher is None:
+            workbook = self.excel_processor.load_template(template_path)
+            if not workbook:
+                result['error_message'] = "No se pudo cargar la plantilla Excel"
+                return result
+            if month is None:
+                # The sheet patcher rewrites a single tab; a whole year goes through the loaded workbook
+                writer = YearTabWriter(self.excel_processor, workbook, year)
+            else:
+                worksheet = self.excel_processor.find_month_tab(workbook, month, year)
+                if not worksheet:
+                    result['error_message'] = f"No se encontró la pestaña del mes {month} para el año {year}"
+                    return result
+        output_path = self.excel_processor.build_output_path(template_path, year, month, output_dir)
+        uuid_index = create_uuid_index(self.duplicate_mode)
+        
+        parsed = queue.Queue(maxsize=self.queue_size)
+        validated = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        errors = []
+        
+        stages = [
+            threading.Thread(target=self._parse_stage, args=(xml_sources, records, parsed, stop, errors),
+                             name="cfdi-parse", daemon=True),
+            threading.Thread(target=self._validate_stage,
+                             args=(parsed, validated, processing_result, uuid_index,
+                                   self.ledger if records is None else None, stop, errors),
+                             name="cfdi-validate", daemon=True)
+        ]
+        for stage in stages:
+            stage.start()
+        
+        try:
+            chunks = self._written_chunks(validated, stop, progress)
+            if patcher is not None:
+                # The patched workbook is streamed to disk as the chunks arrive
+                patcher.write(output_path, chunks)
+                sheets = patcher.sheets
+            else:
+                if month is not None:
+                    self.excel_processor.clear_month_data(worksheet)
+                    writer = MonthTabWriter(self.excel_processor, worksheet)
+                for chunk in chunks:
+                    writer.write(chunk)
+                sheets = writer.sheets
+        except _StageFailed:
+            pass
+        except Exception as e:
+            errors.append(e)
+        finally:
+            stop.set()
+            for stage in stages:
+                stage.join()
+            if uuid_index is not None:
+                uuid_index.close()
+        
+        if errors:
+            result['error_message'] = f"Error inesperado: {errors[0]}"
+            self.logger.error(f"Pipeline failed: {errors[0]}")
+            return result
+        
+        # Files the parser could not read count as failed files
+        if records is None:
+            for failure in self.xml_parser.last_failures:
+                processing_result.failed_files += 1
+                processing_result.add_error(f"{Path(failure['file_path']).name}: {failure['error']}")
+        
+        if processing_result.successful_files == 0:
+            if patcher is not None and os.path.exists(output_path):
+                os.remove(output_path)
+            if records is None:
+                result['error_message'] = "No se pudieron procesar los archivos XML."
+            else:
+                result['error_message'] = "No hay CFDI válidos del periodo en el registro."
+            return result
+        
+        records_written = processing_result.successful_files
+        if month is None:
+            result.update(writer.summary())
+            records_written = result['records_processed']
+            if not writer.months:
+                result['error_message'] = f"Ningún CFDI corresponde a una pestaña de mes del año {year}"
+                return result
+        
+        if patcher is None and not self.excel_processor.save_workbook(workbook, output_path):
+            result['error_message'] = "Error al guardar el archivo de salida"
+            return result
+        
+        result['success'] = True
+        result['output_path'] = output_path
+        result['records_processed'] = records_written
+        result['sheets'] = sheets
+        self.logger.info(f"Pipeline completed: {records_written} records written")
+        return result
+    
+    def _count_sources(self, xml_sources: Iterable[Any]) -> Optional[int]:
+        """Number of XML documents in the sources, counted up to streaming_min_rows (None for one-shot iterables)."""
+        return count_sources(xml_sources, limit=PROCESSING_CONFIG.get('streaming_min_rows', 20000))
+    
+    def _parse_stage(self, xml_sources: Iterable[Any], records: Optional[Iterable[CFDIBatch]], output: queue.Queue,
+                     stop: threading.Event, errors: list):
+        """Parse the sources (or pass the given records on) chunk by chunk into the output queue."""
+        if records is not None:
+            batches = iter(records)
+        else:
+            batches = self.xml_parser.iter_parse_batches(xml_sources, workers=self.workers,
+                                                         batch_size=self.batch_size)
+        try:
+            for chunk in batches:
+                if records is not None:
+                    self._put(output, (chunk, 0), stop)
+                    continue
+                failures = len(self.xml_parser.last_failures)
+                self._put(output, (chunk, failures), stop)
+        except _StageFailed:
+            return
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+            return
+        finally:
+            if hasattr(batches, 'close'):
+                batches.close()  # Shuts the worker pool (or the ledger cursor) down if the run stopped early
+            close_archives()
+        self._put_done(output, stop)
+    
+    def _validate_stage(self, source: queue.Queue, output: queue.Queue, processing_result: ProcessingResult,
+                        uuid_index: Optional[UUIDIndex], ledger: Optional[CFDILedger], stop: threading.Event,
+                        errors: list):
+        """
+        Validate parsed chunks and skip repeated invoices, accumulating the statistics, into the output queue.
+        
+        The records kept are also stored in the ledger, if one is given.
+        """
+        failures_seen = 0
+        try:
+            for chunk, failures in self._drain(source, stop):
+                valid = self.data_processor.process_chunk(chunk, processing_result, uuid_index)
+                if ledger is not None:
+                    ledger.add(valid)
+                # Files handled in this chunk: parsed ones plus parser failures since the last chunk
+                self._put(output, (valid, len(chunk) + failures - failures_seen), stop)
+                failures_seen = failures
+        except _StageFailed:
+            return
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+            return
+        self._put_done(output, stop)
+    
+    def _written_chunks(self, validated: queue.Queue, stop: threading.Event, progress: Callable[[int], None] = None):
+        """Yield validated chunks to the writer, reporting progress once each chunk is written."""
+        handled = 0
+        for chunk, chunk_files in self._drain(validated, stop):
+            yield chunk
+            handled += chunk_files
+            if progress:
+                progress(handled)
+    
+    def _put(self, output: queue.Queue, item, stop: threading.Event):
+        """Put an item, waiting for room unless the run is stopped."""
+        while True:
+            if stop.is_set():
+                raise _StageFailed()
+            try:
+                output.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+    
+    def _put_done(self, output: queue.Queue, stop: threading.Event):
+        """Signal the end of a stage's output."""
+        try:
+            self._put(output, _DONE, stop)
+        except _StageFailed:
+            pass
+    
+    def _drain(self, source: queue.Queue, stop: threading.Event):
+        """Yield items from a queue until the upstream stage is done."""
+        while True:
+            if stop.is_set():
+                raise _StageFailed()
+            try:
+                item = source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            yield item
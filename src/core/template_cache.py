@@ -0,0 +1,133 @@
+"""
+Prepared Excel templates kept between runs by long-running processes
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+import logging
+import os
+import threading
+
+# Import configuration
+from config.settings import SERVICE_CONFIG
+from .template_inspector import TemplateInspector
+from .xlsx_patcher import XlsxSheetPatcher
+
+
+class TemplateCache:
+    """
+    Keeps the sheet names and prepared sheet patchers of recently used templates.
+    
+    A prepared XlsxSheetPatcher already holds the parsed workbook, styles
+    and month tab parts, so a repeated fill of the same template only
+    copies the package and streams the new rows. Entries are keyed on the
+    file's path, size and modification time, so an edited template is
+    read again; the least recently used templates are dropped above
+    max_templates.
+    """
+    
+    def __init__(self, max_templates: int = None):
+        """
+        Initialize the template cache.
+        
+        Args:
+            max_templates: Templates kept (default: max_cached_templates from SERVICE_CONFIG)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.max_templates = max_templates or SERVICE_CONFIG.get('max_cached_templates', 8)
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def sheet_names(self, template_path: Any) -> List[str]:
+        """
+        Get the sheet names of a template.
+        
+        Args:
+            template_path: Path to Excel template (or a path-like TemplateSession)
+        
+        Returns:
+            List of sheet names
+        
+        Raises:
+            TemplateInspectionError: If the file is not a readable xlsx package
+        """
+        entry = self._entry(template_path)
+        if entry['sheet_names'] is None:
+            entry['sheet_names'] = TemplateInspector(template_path).sheet_names()
+        return entry['sheet_names']
+    
+    def patcher(self, template_path: Any, sheet_name: str) -> XlsxSheetPatcher:
+        """
+        Get a prepared patcher for a tab of a template.
+        
+        The same patcher is returned for every fill of the tab, so it must not
+        be used by two runs at the same time.
+        
+        Args:
+            template_path: Path to Excel template (or a path-like TemplateSession)
+            sheet_name: Name of the tab to replace
+        
+        Returns:
+            Prepared XlsxSheetPatcher
+        
+        Raises:
+            XlsxPatchError: If the template is not in a layout the patcher handles
+        """
+        entry = self._entry(template_path)
+        patchers = entry['patchers']
+        if sheet_name in patchers:
+            self.hits += 1
+            return patchers[sheet_name]
+        self.misses += 1
+        patcher = XlsxSheetPatcher(entry['path'], sheet_name)
+        patcher.prepare()
+        patchers[sheet_name] = patcher
+        return patcher
+    
+    def _entry(self, template_path: Any) -> Dict[str, Any]:
+        """Get the entry of a template, starting a new one if the file is new or has changed."""
+        path = os.path.abspath(os.fspath(template_path))
+        try:
+            stat = os.stat(path)
+            signature: Tuple[int, int] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            signature = None  # Let the inspector or the patcher report the error
+        
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry['signature'] != signature or signature is None:
+                if entry is not None:
+                    self.logger.info(f"Template changed, reading it again: {path}")
+                entry = {'path': path, 'signature': signature, 'sheet_names': None, 'patchers': {}}
+                self._entries[path] = entry
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_templates:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return entry
+    
+    def clear(self):
+        """Drop every cached template."""
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self) -> int:
+        """Number of cached templates."""
+        return len(self._entries)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache usage counters.
+        
+        Returns:
+            Dictionary with patcher hits, misses, template evictions and current template count
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self)
+        }
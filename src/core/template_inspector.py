@@ -0,0 +1,176 @@
+"""
+Lightweight inspection of Excel templates without loading cell data
+"""
+
+from typing import List, Optional, Tuple
+import logging
+import os
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+
+import openpyxl
+
+# Import configuration
+from config.settings import EXCEL_CONFIG
+
+# Relationship type of the main workbook part (transitional and strict OOXML)
+_OFFICE_DOCUMENT_TYPES = (
+    'http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument',
+    'http://purl.oclc.org/ooxml/officeDocument/relationships/officeDocument'
+)
+_DEFAULT_WORKBOOK_PART = 'xl/workbook.xml'
+_RELATIONSHIP_ID = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+_STRICT_RELATIONSHIP_ID = '{http://purl.oclc.org/ooxml/officeDocument/relationships}id'
+
+
+class TemplateInspectionError(Exception):
+    """The template is not a readable xlsx package."""
+
+
+def _local_name(tag: str) -> str:
+    """Strip the namespace from an ElementTree tag."""
+    return tag.rsplit('}', 1)[-1]
+
+
+def rels_part(part_name: str) -> str:
+    """Name of the relationships part of a package part (xl/workbook.xml -> xl/_rels/workbook.xml.rels)."""
+    folder, name = posixpath.split(part_name)
+    return posixpath.join(folder, '_rels', name + '.rels')
+
+
+def resolve_target(part_name: str, target: str) -> str:
+    """Resolve a relationship target relative to the part that owns the relationship."""
+    if target.startswith('/'):
+        return posixpath.normpath(target.lstrip('/'))
+    return posixpath.normpath(posixpath.join(posixpath.dirname(part_name), target))
+
+
+class TemplateInspector:
+    """
+    Reads template metadata straight from the xlsx package.
+    
+    Sheet names come from the workbook part (a few kilobytes inside the
+    ZIP) and header rows from a read-only openpyxl scan that stops at the
+    requested row, so inspecting a large workbook does not load any cell
+    data of the other sheets.
+    """
+    
+    def __init__(self, template_path: str):
+        """
+        Initialize the template inspector.
+        
+        Args:
+            template_path: Path to Excel template file (or a path-like TemplateSession)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.template_path = os.fspath(template_path)
+        self._sheets = None
+        self._workbook_part = None
+    
+    def sheet_names(self) -> List[str]:
+        """
+        Get the sheet names in workbook order.
+        
+        Returns:
+            List of sheet names
+        
+        Raises:
+            TemplateInspectionError: If the file is not a readable xlsx package
+        """
+        return [name for name, _ in self._read_sheets()]
+    
+    def workbook_part(self) -> str:
+        """
+        Get the name of the workbook part inside the package (usually xl/workbook.xml).
+        
+        Raises:
+            TemplateInspectionError: If the file is not a readable xlsx package
+        """
+        self._read_sheets()
+        return self._workbook_part
+    
+    def sheet_part(self, sheet_name: str) -> Optional[str]:
+        """
+        Get the name of the worksheet part of a sheet (e.g. xl/worksheets/sheet2.xml).
+        
+        Args:
+            sheet_name: Sheet name
+        
+        Returns:
+            Part name, or None if the sheet does not exist
+        
+        Raises:
+            TemplateInspectionError: If the file is not a readable xlsx package
+        """
+        relationship_ids = dict(self._read_sheets())
+        if sheet_name not in relationship_ids:
+            return None
+        workbook_part = self._workbook_part
+        try:
+            with zipfile.ZipFile(self.template_path) as package:
+                rels = ET.fromstring(package.read(rels_part(workbook_part)))
+        except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError) as e:
+            raise TemplateInspectionError(str(e)) from e
+        for relationship in rels:
+            if relationship.get('Id') == relationship_ids[sheet_name]:
+                return resolve_target(workbook_part, relationship.get('Target', ''))
+        raise TemplateInspectionError(f"relationship {relationship_ids[sheet_name]} not found")
+    
+    def header_row(self, sheet_name: str, row: int = None) -> Optional[List[str]]:
+        """
+        Read one row of a sheet (the header row by default) in read-only mode.
+        
+        Args:
+            sheet_name: Sheet to read
+            row: Row number (default: header_row from config)
+        
+        Returns:
+            Cell values of the row as text ('' for empty cells), or None if
+            the sheet does not exist
+        
+        Raises:
+            TemplateInspectionError: If the file cannot be opened by openpyxl
+        """
+        if row is None:
+            row = EXCEL_CONFIG['header_row']
+        try:
+            workbook = openpyxl.load_workbook(self.template_path, read_only=True, data_only=True, keep_links=False)
+        except Exception as e:
+            raise TemplateInspectionError(str(e)) from e
+        try:
+            if sheet_name not in workbook.sheetnames:
+                return None
+            for values in workbook[sheet_name].iter_rows(min_row=row, max_row=row, values_only=True):
+                return ['' if value is None else str(value) for value in values]
+            return []
+        finally:
+            workbook.close()
+    
+    def _read_sheets(self) -> List[Tuple[str, str]]:
+        """Read (sheet name, relationship id) pairs from the workbook part, once."""
+        if self._sheets is None:
+            try:
+                with zipfile.ZipFile(self.template_path) as package:
+                    workbook_part = self._find_workbook_part(package)
+                    workbook_xml = package.read(workbook_part)
+                root = ET.fromstring(workbook_xml)
+            except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError) as e:
+                raise TemplateInspectionError(str(e)) from e
+            self._workbook_part = workbook_part
+            self._sheets = [
+                (element.get('name', ''), element.get(_RELATIONSHIP_ID) or element.get(_STRICT_RELATIONSHIP_ID))
+                for element in root.iter() if _local_name(element.tag) == 'sheet'
+            ]
+        return self._sheets
+    
+    def _find_workbook_part(self, package: zipfile.ZipFile) -> str:
+        """Find the workbook part through the package relationships."""
+        try:
+            rels = ET.fromstring(package.read('_rels/.rels'))
+        except (KeyError, ET.ParseError):
+            return _DEFAULT_WORKBOOK_PART
+        for relationship in rels:
+            if relationship.get('Type') in _OFFICE_DOCUMENT_TYPES:
+                return resolve_target('', relationship.get('Target', _DEFAULT_WORKBOOK_PART))
+        return _DEFAULT_WORKBOOK_PART
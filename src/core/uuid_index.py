@@ -0,0 +1,146 @@
+"""
+UUID index for detecting the same CFDI read more than once
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+import logging
+import sqlite3
+import threading
+import time
+
+# Import configuration
+from config.settings import DUPLICATE_CONFIG
+from .data_models import normalize_uuid
+
+DUPLICATE_MODES = ('drop', 'flag', 'off')
+
+
+class UUIDIndex:
+    """
+    Hash index of the TimbreFiscalDigital UUIDs seen, with the file each was first read from.
+    
+    Every UUID is looked up once in a dictionary, so finding the repeats
+    of a run costs one lookup per record instead of comparing records
+    with each other. Records without a UUID are never repeats. The index
+    also says whether repeats are dropped or only flagged.
+    
+    With a db_path the index is also kept in SQLite, so copies of files
+    read in earlier runs are caught as well; the UUIDs of each chunk are
+    looked up and stored in one transaction. A UUID from an earlier run is
+    only a repeat when it comes from a different file, so re-running a
+    month over the same files reports nothing. Such a repeat is only ever
+    flagged, never dropped: the earlier copy is not part of this run, so
+    dropping it would leave the invoice out of the month being rebuilt
+    (e.g. after the folder was renamed or the files were packed in a ZIP).
+    """
+    
+    def __init__(self, db_path: str = None, drop: bool = True):
+        """
+        Initialize the index.
+        
+        Args:
+            db_path: SQLite file to persist the index in (default: in memory, for one run)
+            drop: Leave repeats out of the written records (False: write them and only report them)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.db_path = db_path
+        self.drop = drop
+        self._seen: Dict[str, str] = {}      # Normalized UUID -> file path of the first copy in this run
+        self._earlier: Dict[str, str] = {}   # The same for the persisted UUIDs of the chunks looked up
+        
+        self._lock = threading.Lock()
+        self._connection = None
+        if db_path:
+            self._connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+            with self._lock, self._connection:
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS uuids ("
+                    " uuid TEXT PRIMARY KEY,"
+                    " file_path TEXT NOT NULL,"
+                    " first_seen REAL NOT NULL)"
+                )
+    
+    def check_many(self, uuids: Sequence[str],
+                   file_paths: Sequence[str]) -> List[Optional[Tuple[str, bool]]]:
+        """
+        Register records and find which of them repeat an invoice already seen.
+        
+        Args:
+            uuids: TimbreFiscalDigital UUID of each record ('' if it has none)
+            file_paths: File each record was read from
+        
+        Returns:
+            For each record, None if it is not a repeat, else (file path of the
+            earlier copy, whether that copy was read in this run)
+        """
+        uuids = [normalize_uuid(uuid) for uuid in uuids]
+        with self._lock:
+            if self._connection is not None:
+                self._load([uuid for uuid in set(uuids)
+                            if uuid and uuid not in self._seen and uuid not in self._earlier])
+            
+            earlier = []
+            new = []
+            for uuid, file_path in zip(uuids, file_paths):
+                if not uuid:
+                    earlier.append(None)
+                elif uuid in self._seen:
+                    earlier.append((self._seen[uuid], True))
+                elif self._earlier.get(uuid, file_path) != file_path:
+                    # Kept as this run's copy: later copies in the run repeat this one
+                    self._seen[uuid] = file_path
+                    earlier.append((self._earlier[uuid], False))
+                else:
+                    self._seen[uuid] = file_path
+                    if uuid not in self._earlier:
+                        new.append((uuid, file_path))
+                    earlier.append(None)
+            
+            if self._connection is not None and new:
+                now = time.time()
+                with self._connection:
+                    self._connection.executemany(
+                        "INSERT OR IGNORE INTO uuids (uuid, file_path, first_seen) VALUES (?, ?, ?)",
+                        [(uuid, file_path, now) for uuid, file_path in new]
+                    )
+        return earlier
+    
+    def _load(self, uuids: List[str]):
+        """Copy the persisted entries of some UUIDs into memory (caller holds the lock)."""
+        # Stay below SQLite's limit on query parameters
+        for start in range(0, len(uuids), 500):
+            chunk = uuids[start:start + 500]
+            self._earlier.update(self._connection.execute(
+                f"SELECT uuid, file_path FROM uuids WHERE uuid IN ({', '.join('?' * len(chunk))})", chunk
+            ))
+    
+    def __len__(self) -> int:
+        """Number of distinct UUIDs seen in this run."""
+        return len(self._seen)
+    
+    def close(self):
+        """Close the database connection, if the index is persisted."""
+        if self._connection is not None:
+            with self._lock:
+                self._connection.close()
+                self._connection = None
+
+
+def create_uuid_index(mode: str = None) -> Optional[UUIDIndex]:
+    """
+    Create the index for one run as configured in DUPLICATE_CONFIG.
+    
+    Args:
+        mode: "drop", "flag" or "off" (default: mode from DUPLICATE_CONFIG)
+    
+    Returns:
+        UUIDIndex, or None when duplicate detection is off
+    """
+    if mode is None:
+        mode = DUPLICATE_CONFIG.get('mode', 'drop')
+    if mode not in DUPLICATE_MODES:
+        raise ValueError(f"Unknown duplicate mode: {mode}")
+    if mode == 'off':
+        return None
+    db_path = DUPLICATE_CONFIG.get('db_path') if DUPLICATE_CONFIG.get('persist', False) else None
+    return UUIDIndex(db_path, drop=mode == 'drop')
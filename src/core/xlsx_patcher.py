@@ -0,0 +1,625 @@
+"""
+Sheet-level writer that replaces one month tab inside the template package
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from xml.sax.saxutils import escape, quoteattr, unescape
+import logging
+import os
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.styles.numbers import BUILTIN_FORMATS_REVERSE
+from openpyxl.utils import column_index_from_string, get_column_letter
+from openpyxl.utils.datetime import to_excel, CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900
+
+# Import configuration
+from config.settings import EXCEL_CONFIG
+from .data_models import CFDIData, CFDIBatch, CFDI_COLUMNS, MONEY_COLUMNS, FECHA_COLUMN, iter_typed_rows
+from .template_inspector import TemplateInspector, TemplateInspectionError, rels_part, resolve_target
+
+_SHEET_DATA = re.compile(rb'<sheetData\b[^>]*?(/?)>')
+_SHEET_DATA_END = b'</sheetData>'
+_DIMENSION = re.compile(rb'<dimension\b[^>]*/>')
+_ROW = re.compile(rb'<row\b([^>]*?)(?:/>|>(.*?)</row>)', re.S)
+_CELL = re.compile(rb'<c\b([^>]*?)(?:/>|>.*?</c>)', re.S)
+_ROW_NUMBER = re.compile(rb'\sr="(\d+)"')
+_CELL_COLUMN = re.compile(rb'\sr="([A-Z]+)\d+"')
+_STYLE = re.compile(rb'\ss="(\d+)"')
+_SPANS = re.compile(rb'\sspans="[^"]*"')
+_STYLE_SHEET = re.compile(rb'<styleSheet\b[^>]*>')
+_NUM_FMTS = re.compile(rb'<numFmts\b[^>]*?(?:/>|>(.*?)</numFmts>)', re.S)
+_NUM_FMT = re.compile(rb'<numFmt\b([^>]*?)/?>')
+_NUM_FMT_ID = re.compile(rb'\snumFmtId="(\d+)"')
+_FORMAT_CODE = re.compile(rb'\sformatCode="([^"]*)"')
+_CELL_XFS = re.compile(rb'<cellXfs\b([^>]*?)>(.*?)</cellXfs>', re.S)
+_XF = re.compile(rb'<xf\b[^>]*?(?:/>|>.*?</xf>)', re.S)
+_APPLY_NUMBER_FORMAT = re.compile(rb'\sapplyNumberFormat="[^"]*"')
+_COUNT = re.compile(rb'\scount="\d*"')
+_CALC_PR = re.compile(rb'<calcPr\b([^>]*?)(/?)>')
+_FULL_CALC_ON_LOAD = re.compile(rb'\sfullCalcOnLoad="[^"]*"')
+_DATE1904 = re.compile(rb'<workbookPr\b[^>]*\sdate1904="(?:1|true)"')
+_SHEET = re.compile(rb'<sheet\b[^>]*?/>')
+_SHEET_NAME = re.compile(rb'\sname="([^"]*)"')
+_SHEET_ID = re.compile(rb'\ssheetId="(\d+)"')
+_SHEET_RELATIONSHIP_ID = re.compile(rb'(\s[\w.-]+:id=")[^"]*(")')
+_SHEET_INDEX = re.compile(rb'(\s(?:localSheetId|activeTab|firstSheet)=")(\d+)(")')
+_TAB_SELECTED = re.compile(rb'\stabSelected="(?:1|true)"')
+# Tail elements of a worksheet that point at parts related to that worksheet only
+_RELATED_CONTAINERS = re.compile(rb'<(hyperlinks|oleObjects|controls|tableParts)\b(?:[^>]*/>|.*?</\1>)', re.S)
+_RELATED_ELEMENTS = re.compile(rb'<[\w:]+\b[^>]*\s[\w.-]+:id="[^"]*"[^>]*/>')
+# Elements that follow calcPr in the workbook part
+_AFTER_CALC_PR = re.compile(rb'<(?:oleSize|customWorkbookViews|pivotCaches|smartTagPr|smartTagTypes|'
+                            rb'webPublishing|fileRecoveryPr|webPublishObjects|extLst)\b|</workbook>')
+
+# Generated rows buffered before they are handed to the compressor
+ROWS_PER_WRITE = 1000
+
+WORKSHEET_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml'
+
+_STYLES_TYPE = '/styles'
+_CALC_CHAIN_TYPE = '/calcChain'
+
+
+class XlsxPatchError(Exception):
+    """The template cannot be patched at sheet level; use the workbook writer."""
+
+
+def _with_count(start_tag: bytes, count: int) -> bytes:
+    """Set the count attribute of a start tag."""
+    if _COUNT.search(start_tag):
+        return _COUNT.sub(b' count="%d"' % count, start_tag, count=1)
+    return start_tag[:-1] + b' count="%d">' % count
+
+
+def continuation_sheet_name(sheet_name: str, number: int, existing: Sequence[str]) -> str:
+    """
+    Name a continuation sheet of a month tab, e.g. "Ene2025 (2)".
+    
+    Args:
+        sheet_name: Name of the month tab
+        number: Shard number (2 for the first continuation sheet)
+        existing: Sheet names already in the workbook
+    
+    Returns:
+        Sheet name of at most 31 characters not used by any existing sheet
+    """
+    taken = {name.lower() for name in existing}
+    while True:
+        suffix = f" ({number})"
+        name = sheet_name[:31 - len(suffix)] + suffix
+        if name.lower() not in taken:
+            return name
+        number += 1
+
+
+def _inline_string(reference: bytes, value: str, style: Optional[bytes]) -> bytes:
+    """Build an inline string cell."""
+    value = ILLEGAL_CHARACTERS_RE.sub('', value)
+    text = escape(value).encode('utf-8')
+    space = b' xml:space="preserve"' if value != value.strip() else b''
+    style = b' s="' + style + b'"' if style else b''
+    return b'<c r="%s"%s t="inlineStr"><is><t%s>%s</t></is></c>' % (reference, style, space, text)
+
+
+class XlsxSheetPatcher:
+    """
+    Writes the month tab straight into a copy of the template package.
+    
+    Every part of the template xlsx except the month tab's worksheet is
+    copied unchanged, so formulas, pivot tables and charts on the other
+    tabs are untouched and the run time depends on the month's rows, not
+    on the size of the workbook. The worksheet keeps everything outside
+    the data rows (columns, merged cells, page setup, ...) and its rows
+    above data_start_row; the data rows are generated as the records
+    arrive, with inline strings, numeric amounts and Fecha as a date
+    serial, and go to the compressed ZIP entry every ROWS_PER_WRITE rows,
+    so memory use does not grow with the number of records. Cells of the old data rows only keep their formatting, as
+    ExcelProcessor.clear_month_data() does.
+    
+    Besides the worksheet, the styles part gets the cell formats for
+    amounts and dates: one per style the template gives the amount and
+    Fecha cells of the data rows, with only its number format changed,
+    and a plain one for unstyled cells. The workbook is flagged to
+    recalculate on load and the calculation chain is dropped, since it may
+    point at removed formula cells.
+    
+    When a sheet reaches max_rows_per_sheet rows, the remaining records
+    continue in new sheets ("Ene2025 (2)", ...) placed right after the
+    month tab, with the same header rows and columns. The new sheets are
+    registered in the workbook, its relationships and the content types,
+    which are therefore written at the end of the package. The names of
+    the sheets written are listed in the sheets attribute.
+    """
+    
+    def __init__(self, template_path: str, sheet_name: str, start_row: int = None, max_rows: int = None):
+        """
+        Initialize the patcher.
+        
+        Args:
+            template_path: Path to Excel template file (or a path-like TemplateSession)
+            sheet_name: Name of the tab to replace
+            start_row: First data row (default: data_start_row from config)
+            max_rows: Last row of a sheet before continuing in a new one
+                (default: max_rows_per_sheet from config)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.template_path = os.fspath(template_path)
+        self.sheet_name = sheet_name
+        self.start_row = start_row or EXCEL_CONFIG['data_start_row']
+        self.max_rows = max_rows or EXCEL_CONFIG['max_rows_per_sheet']
+        if self.max_rows < self.start_row:
+            raise ValueError(f"max_rows ({self.max_rows}) is above the first data row ({self.start_row})")
+        self.sheets = [sheet_name]
+        
+        # Column plan: (column index, column letter, position in CFDI_COLUMNS, position in MONEY_COLUMNS or None)
+        self._plan = sorted(
+            (column_index_from_string(column), column.encode('ascii'), position,
+             MONEY_COLUMNS.index(column) if column in MONEY_COLUMNS else None)
+            for position, column in enumerate(CFDI_COLUMNS)
+        )
+        self._fecha_position = CFDI_COLUMNS.index(FECHA_COLUMN)
+        self._prepared = False
+    
+    def prepare(self):
+        """
+        Read the template parts that change and patch them in memory.
+        
+        Called by write(); calling it first lets the caller pick another
+        writer before the output file is created.
+        
+        Raises:
+            XlsxPatchError: If the template is not in a layout the patcher handles
+        """
+        if self._prepared:
+            return
+        
+        inspector = TemplateInspector(self.template_path)
+        try:
+            workbook_part = inspector.workbook_part()
+            sheet_part = inspector.sheet_part(self.sheet_name)
+            self._existing_sheets = inspector.sheet_names()
+        except TemplateInspectionError as e:
+            raise XlsxPatchError(str(e)) from e
+        if sheet_part is None:
+            raise XlsxPatchError(f"sheet {self.sheet_name!r} not found")
+        
+        workbook_rels_part = rels_part(workbook_part)
+        try:
+            with zipfile.ZipFile(self.template_path) as package:
+                workbook_xml = package.read(workbook_part)
+                workbook_rels = package.read(workbook_rels_part)
+                targets = self._relationship_targets(workbook_part, workbook_rels)
+                if _STYLES_TYPE not in targets:
+                    raise XlsxPatchError("styles part not found")
+                styles_part = targets[_STYLES_TYPE]
+                styles_xml = package.read(styles_part)
+                sheet_xml = package.read(sheet_part)
+                content_types = package.read('[Content_Types].xml')
+                self._part_names = set(package.namelist())
+        except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError) as e:
+            raise XlsxPatchError(str(e)) from e
+        self._sheet_relationship_type = next(
+            (relationship.get('Type') for relationship in ET.fromstring(workbook_rels)
+             if resolve_target(workbook_part, relationship.get('Target', '')) == sheet_part),
+            'http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet')
+        
+        self._split_sheet(sheet_xml)
+        self._epoch = CALENDAR_MAC_1904 if _DATE1904.search(workbook_xml) else CALENDAR_WINDOWS_1900
+        
+        # Template styles of the amount and Fecha cells (None: unstyled cell)
+        amount_columns = {column for column, _, _, money_index in self._plan if money_index is not None}
+        fecha_column = next(column for column, _, position, _ in self._plan if position == self._fecha_position)
+        amount_bases = [None] + sorted({style for _, styles in self._template_rows.values()
+                                        for column, style in styles.items() if column in amount_columns})
+        fecha_bases = [None] + sorted({styles[fecha_column] for _, styles in self._template_rows.values()
+                                       if fecha_column in styles})
+        styles_xml, xf_indexes = self._add_cell_formats(
+            styles_xml, [(EXCEL_CONFIG['amount_format'], base) for base in amount_bases]
+            + [(EXCEL_CONFIG['date_format'], base) for base in fecha_bases])
+        xf_styles = [str(index).encode('ascii') for index in xf_indexes]
+        self._amount_styles = dict(zip(amount_bases, xf_styles[:len(amount_bases)]))
+        self._fecha_styles = dict(zip(fecha_bases, xf_styles[len(amount_bases):]))
+        
+        self._sheet_part = sheet_part
+        self._workbook_part = workbook_part
+        self._workbook_rels_part = workbook_rels_part
+        self._replaced = {
+            styles_part: styles_xml,
+            workbook_part: self._full_calc_on_load(workbook_xml),
+            workbook_rels_part: workbook_rels,
+            '[Content_Types].xml': content_types
+        }
+        self._dropped = set()
+        if _CALC_CHAIN_TYPE in targets:
+            calc_chain_part = targets[_CALC_CHAIN_TYPE]
+            self._dropped.add(calc_chain_part)
+            self._replaced[workbook_rels_part] = re.sub(
+                rb'<Relationship\b[^>]*\sType="[^"]*' + re.escape(_CALC_CHAIN_TYPE.encode('ascii')) + rb'"[^>]*/>',
+                b'', workbook_rels)
+            self._replaced['[Content_Types].xml'] = re.sub(
+                rb'<Override\b[^>]*\sPartName="/' + re.escape(calc_chain_part.encode('utf-8')) + rb'"[^>]*/>',
+                b'', content_types)
+        self._prepared = True
+    
+    def write(self, output_path: str, chunks: Iterable[Union[List[CFDIData], CFDIBatch]]) -> int:
+        """
+        Write the output workbook, streaming the records into the month tab.
+        
+        Args:
+            output_path: Output file path
+            chunks: Lists of CFDI data objects or CFDIBatch objects, consumed
+                lazily while the worksheet is written
+        
+        Returns:
+            Number of records written
+        
+        Raises:
+            XlsxPatchError: If the template is not in a layout the patcher handles
+        """
+        self.prepare()
+        self.sheets = [self.sheet_name]
+        self._shard_parts = []
+        # Parts that list the sheets are written last, once every continuation sheet is known
+        deferred = {self._workbook_part, self._workbook_rels_part, '[Content_Types].xml'}
+        records_written = 0
+        try:
+            with zipfile.ZipFile(self.template_path) as package, \
+                    zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as output:
+                entries = {}
+                for info in package.infolist():
+                    if info.filename in self._dropped:
+                        continue
+                    # Fresh entry with the original name, date and compression
+                    entry = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+                    entry.compress_type = info.compress_type
+                    entry.external_attr = info.external_attr
+                    if info.filename in deferred:
+                        entries[info.filename] = entry
+                    elif info.filename == self._sheet_part:
+                        records_written = self._write_sheets(output, entry, chunks)
+                    elif info.filename in self._replaced:
+                        output.writestr(entry, self._replaced[info.filename])
+                    else:
+                        output.writestr(entry, package.read(info.filename))
+                
+                for part_name, data in self._register_shards().items():
+                    output.writestr(entries.get(part_name, part_name), data)
+        except BaseException:
+            # Never leave a half-written workbook behind
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise
+        
+        self.logger.info(f"Patched sheet {self.sheet_name!r} with {records_written} records "
+                         f"in {len(self.sheets)} sheet(s): {output_path}")
+        return records_written
+    
+    def _relationship_targets(self, part_name: str, rels_xml: bytes) -> Dict[str, str]:
+        """Map relationship type suffixes (e.g. "/styles") to the target part names."""
+        targets = {}
+        for relationship in ET.fromstring(rels_xml):
+            relationship_type = relationship.get('Type', '')
+            suffix = relationship_type[relationship_type.rfind('/'):]
+            if relationship.get('TargetMode') != 'External':
+                targets.setdefault(suffix, resolve_target(part_name, relationship.get('Target', '')))
+        return targets
+    
+    def _split_sheet(self, sheet_xml: bytes):
+        """
+        Split the worksheet into the part before the data rows, the old data rows and the tail.
+        
+        Args:
+            sheet_xml: Worksheet part of the template
+        """
+        sheet_data = _SHEET_DATA.search(sheet_xml)
+        if sheet_data is None:
+            raise XlsxPatchError("sheetData not found")
+        if sheet_data.group(1):
+            head = sheet_xml[:sheet_data.start()] + b'<sheetData>'
+            body = b''
+            self._tail = _SHEET_DATA_END + sheet_xml[sheet_data.end():]
+        else:
+            end = sheet_xml.find(_SHEET_DATA_END, sheet_data.end())
+            if end < 0:
+                raise XlsxPatchError("sheetData is not closed")
+            head = sheet_xml[:sheet_data.end()]
+            body = sheet_xml[sheet_data.end():end]
+            self._tail = sheet_xml[end:]
+        
+        # The used range changes and is not known until the last row; the element is optional
+        head = _DIMENSION.sub(b'', head, count=1)
+        
+        header_rows = []
+        self._template_rows = {}  # Row number -> (row attributes, {column index: style index})
+        row_number = 0
+        for row in _ROW.finditer(body):
+            attributes, content = row.groups()
+            number = _ROW_NUMBER.search(attributes)
+            row_number = int(number.group(1)) if number else row_number + 1
+            if row_number < self.start_row:
+                header_rows.append(row.group(0))
+                continue
+            
+            styles = {}
+            column = 0
+            for cell in _CELL.finditer(content or b''):
+                reference = _CELL_COLUMN.search(cell.group(1))
+                column = column_index_from_string(reference.group(1).decode('ascii')) if reference else column + 1
+                style = _STYLE.search(cell.group(1))
+                if style:
+                    styles[column] = style.group(1)
+            row_attributes = _SPANS.sub(b'', _ROW_NUMBER.sub(b'', attributes)).strip()
+            if styles or row_attributes:
+                self._template_rows[row_number] = (row_attributes, styles)
+        
+        self._head = head + b''.join(header_rows)
+        
+        # Continuation sheets: same head without the tab selection, tail without
+        # references to parts related to the month tab (drawings, tables, ...)
+        self._continuation_head = _TAB_SELECTED.sub(b'', self._head)
+        self._continuation_tail = _RELATED_ELEMENTS.sub(b'', _RELATED_CONTAINERS.sub(b'', self._tail))
+    
+    def _add_cell_formats(self, styles_xml: bytes,
+                          cell_formats: Sequence[Tuple[str, Optional[bytes]]]) -> Tuple[bytes, List[int]]:
+        """
+        Add the cell formats of the given number formats to the styles part.
+        
+        A format based on a template cell format is a copy of it with the
+        number format changed, so the cell keeps its font, fill, border and
+        alignment; one that already has the number format is used as is.
+        
+        Args:
+            styles_xml: Styles part of the template
+            cell_formats: (number format code, index of the template cell
+                format it is based on or None for a plain one)
+        
+        Returns:
+            (patched styles part, index of the cell format of each entry)
+        """
+        cell_xfs = _CELL_XFS.search(styles_xml)
+        if cell_xfs is None:
+            raise XlsxPatchError("cellXfs not found in the styles part")
+        num_fmts = _NUM_FMTS.search(styles_xml)
+        
+        defined = {}  # Escaped format code -> numFmtId
+        for num_fmt in _NUM_FMT.finditer((num_fmts.group(1) or b'') if num_fmts else b''):
+            format_id = _NUM_FMT_ID.search(num_fmt.group(1))
+            format_code = _FORMAT_CODE.search(num_fmt.group(1))
+            if format_id and format_code:
+                defined[format_code.group(1)] = int(format_id.group(1))
+        
+        next_id = max([163] + list(defined.values())) + 1  # Custom formats start at 164
+        format_ids = []
+        new_num_fmts = []
+        for number_format, _ in cell_formats:
+            format_code = escape(number_format, {'"': '&quot;'}).encode('utf-8')
+            if number_format in BUILTIN_FORMATS_REVERSE:
+                format_ids.append(BUILTIN_FORMATS_REVERSE[number_format])
+            elif format_code in defined:
+                format_ids.append(defined[format_code])
+            else:
+                defined[format_code] = next_id
+                format_ids.append(next_id)
+                new_num_fmts.append(b'<numFmt numFmtId="%d" formatCode="%s"/>' % (next_id, format_code))
+                next_id += 1
+        
+        # cellXfs comes after numFmts, so patch it first and the numFmts offsets stay valid
+        template_xfs = _XF.findall(cell_xfs.group(2))
+        xf_indexes = []
+        xfs = []
+        for (_, base), format_id in zip(cell_formats, format_ids):
+            base_xf = template_xfs[int(base)] if base is not None and int(base) < len(template_xfs) else None
+            if base_xf is None:
+                xfs.append(b'<xf numFmtId="%d" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+                           % format_id)
+            else:
+                start_tag = base_xf[:base_xf.index(b'>')].rstrip(b'/')
+                current = _NUM_FMT_ID.search(start_tag)
+                if current and int(current.group(1)) == format_id:
+                    xf_indexes.append(int(base))
+                    continue
+                attributes = _APPLY_NUMBER_FORMAT.sub(b'', _NUM_FMT_ID.sub(b'', start_tag[len(b'<xf'):]))
+                xfs.append(b'<xf numFmtId="%d" applyNumberFormat="1"' % format_id + attributes
+                           + base_xf[len(start_tag):])
+            xf_indexes.append(len(template_xfs) + len(xfs) - 1)
+        styles_xml = (styles_xml[:cell_xfs.start()]
+                      + _with_count(b'<cellXfs' + cell_xfs.group(1) + b'>', len(template_xfs) + len(xfs))
+                      + cell_xfs.group(2) + b''.join(xfs) + b'</cellXfs>' + styles_xml[cell_xfs.end():])
+        
+        if new_num_fmts:
+            if num_fmts is None or num_fmts.group(1) is None:
+                element = b'<numFmts count="%d">%s</numFmts>' % (len(new_num_fmts), b''.join(new_num_fmts))
+                if num_fmts is not None:
+                    styles_xml = styles_xml[:num_fmts.start()] + element + styles_xml[num_fmts.end():]
+                else:
+                    style_sheet = _STYLE_SHEET.search(styles_xml)
+                    if style_sheet is None:
+                        raise XlsxPatchError("styleSheet not found in the styles part")
+                    styles_xml = styles_xml[:style_sheet.end()] + element + styles_xml[style_sheet.end():]
+            else:
+                start_tag_end = styles_xml.index(b'>', num_fmts.start()) + 1
+                count = len(_NUM_FMT.findall(num_fmts.group(1))) + len(new_num_fmts)
+                styles_xml = (styles_xml[:num_fmts.start()]
+                              + _with_count(styles_xml[num_fmts.start():start_tag_end], count)
+                              + num_fmts.group(1) + b''.join(new_num_fmts) + b'</numFmts>'
+                              + styles_xml[num_fmts.end():])
+        
+        return styles_xml, xf_indexes
+    
+    def _full_calc_on_load(self, workbook_xml: bytes) -> bytes:
+        """Flag the workbook so Excel recalculates formulas that read the month tab."""
+        calc_pr = _CALC_PR.search(workbook_xml)
+        if calc_pr is not None:
+            attributes = _FULL_CALC_ON_LOAD.sub(b'', calc_pr.group(1))
+            return (workbook_xml[:calc_pr.start()]
+                    + b'<calcPr' + attributes + b' fullCalcOnLoad="1"' + calc_pr.group(2) + b'>'
+                    + workbook_xml[calc_pr.end():])
+        following = _AFTER_CALC_PR.search(workbook_xml)
+        if following is None:
+            return workbook_xml
+        return workbook_xml[:following.start()] + b'<calcPr fullCalcOnLoad="1"/>' + workbook_xml[following.start():]
+    
+    def _write_sheets(self, output: zipfile.ZipFile, entry: zipfile.ZipInfo,
+                      chunks: Iterable[Union[List[CFDIData], CFDIBatch]]) -> int:
+        """
+        Stream the month tab and, past max_rows, its continuation sheets.
+        
+        Args:
+            output: Output package
+            entry: ZIP entry of the month tab's worksheet
+            chunks: Record chunks to write
+        
+        Returns:
+            Number of records written
+        """
+        template_rows = self._template_rows
+        sheet_file = output.open(entry, 'w', force_zip64=True)
+        try:
+            sheet_file.write(self._head)
+            row_number = self.start_row
+            records_written = 0
+            rows = []
+            for chunk in chunks:
+                for values, fecha_value, amounts in iter_typed_rows(chunk):
+                    if row_number > self.max_rows:
+                        # Sheet full: close it and continue in a new one, without a second pass
+                        sheet_file.write(b''.join(rows))
+                        rows = []
+                        self._finish_sheet(sheet_file, row_number, template_rows)
+                        sheet_file.close()
+                        sheet_file = self._open_shard(output, entry)
+                        template_rows = {}
+                        row_number = self.start_row
+                    rows.append(self._record_row(row_number, values, fecha_value, amounts, template_rows))
+                    row_number += 1
+                    records_written += 1
+                    if len(rows) == ROWS_PER_WRITE:
+                        sheet_file.write(b''.join(rows))
+                        rows = []
+            sheet_file.write(b''.join(rows))
+            self._finish_sheet(sheet_file, row_number, template_rows)
+        finally:
+            sheet_file.close()
+        return records_written
+    
+    def _finish_sheet(self, sheet_file, row_number: int, template_rows: Dict[int, tuple]):
+        """Write the rows kept from the template past the last record, and the worksheet tail."""
+        # Old data rows past the last record keep only their formatting
+        remaining = sorted(number for number in template_rows if number >= row_number)
+        sheet_file.write(b''.join(self._row(number, [], template_rows) for number in remaining))
+        sheet_file.write(self._tail if template_rows is self._template_rows else self._continuation_tail)
+    
+    def _open_shard(self, output: zipfile.ZipFile, entry: zipfile.ZipInfo):
+        """Add a continuation sheet to the package and open its worksheet for writing."""
+        self.sheets.append(continuation_sheet_name(self.sheet_name, len(self.sheets) + 1,
+                                                   self._existing_sheets + self.sheets))
+        folder = posixpath.dirname(self._sheet_part)
+        number = 1
+        while True:
+            part_name = posixpath.join(folder, f"sheet{number}.xml")
+            if part_name not in self._part_names and part_name not in self._shard_parts:
+                break
+            number += 1
+        self._shard_parts.append(part_name)
+        
+        shard_entry = zipfile.ZipInfo(part_name, date_time=entry.date_time)
+        shard_entry.compress_type = zipfile.ZIP_DEFLATED
+        sheet_file = output.open(shard_entry, 'w', force_zip64=True)
+        sheet_file.write(self._continuation_head)
+        self.logger.info(f"Sheet {self.sheet_name!r} is full, continuing in {self.sheets[-1]!r}")
+        return sheet_file
+    
+    def _register_shards(self) -> Dict[str, bytes]:
+        """
+        Add the continuation sheets to the workbook, its relationships and the content types.
+        
+        Returns:
+            Part name -> contents of the three parts
+        """
+        workbook_xml = self._replaced[self._workbook_part]
+        workbook_rels = self._replaced[self._workbook_rels_part]
+        content_types = self._replaced['[Content_Types].xml']
+        if not self._shard_parts:
+            return {self._workbook_part: workbook_xml, self._workbook_rels_part: workbook_rels,
+                    '[Content_Types].xml': content_types}
+        
+        sheet_elements = list(_SHEET.finditer(workbook_xml))
+        position = next(index for index, element in enumerate(sheet_elements)
+                        if unescape(_SHEET_NAME.search(element.group(0)).group(1).decode('utf-8'),
+                                    {'&quot;': '"', '&apos;': "'"}) == self.sheet_name)
+        original = sheet_elements[position]
+        next_sheet_id = max(int(_SHEET_ID.search(element.group(0)).group(1)) for element in sheet_elements) + 1
+        
+        content_type = re.search(
+            rb'<Override\b[^>]*\sPartName="/' + re.escape(self._sheet_part.encode('utf-8')) + rb'"[^>]*/>',
+            content_types)
+        content_type = re.search(rb'\sContentType="([^"]*)"', content_type.group(0)).group(1) if content_type \
+            else WORKSHEET_CONTENT_TYPE.encode('ascii')
+        
+        new_sheets, relationships, overrides = [], [], []
+        for offset, (sheet_name, part_name) in enumerate(zip(self.sheets[1:], self._shard_parts)):
+            relationship_id = f"rIdCfdi{offset + 2}".encode('ascii')
+            name = quoteattr(sheet_name).encode('utf-8')
+            element = _SHEET_NAME.sub(lambda match: b' name=' + name, original.group(0), count=1)
+            element = _SHEET_ID.sub(b' sheetId="%d"' % (next_sheet_id + offset), element, count=1)
+            element = _SHEET_RELATIONSHIP_ID.sub(lambda match: match.group(1) + relationship_id + match.group(2),
+                                                 element, count=1)
+            new_sheets.append(element)
+            target = posixpath.relpath(part_name, posixpath.dirname(self._workbook_part))
+            relationships.append(b'<Relationship Id="%s" Type="%s" Target="%s"/>'
+                                 % (relationship_id, self._sheet_relationship_type.encode('utf-8'),
+                                    target.encode('utf-8')))
+            overrides.append(b'<Override PartName="/%s" ContentType="%s"/>' % (part_name.encode('utf-8'), content_type))
+        
+        # Sheets after the month tab move right: shift index references to them
+        shift = len(new_sheets)
+        def shifted(match):
+            index = int(match.group(2))
+            return match.group(1) + str(index + shift if index > position else index).encode('ascii') + match.group(3)
+        
+        workbook_xml = (_SHEET_INDEX.sub(shifted, workbook_xml[:original.start()]) + original.group(0)
+                        + b''.join(new_sheets) + _SHEET_INDEX.sub(shifted, workbook_xml[original.end():]))
+        workbook_rels = workbook_rels.replace(b'</Relationships>', b''.join(relationships) + b'</Relationships>')
+        content_types = content_types.replace(b'</Types>', b''.join(overrides) + b'</Types>')
+        return {self._workbook_part: workbook_xml, self._workbook_rels_part: workbook_rels,
+                '[Content_Types].xml': content_types}
+    
+    def _record_row(self, row_number: int, values: Tuple[str, ...], fecha_value, amounts,
+                    template_rows: Dict[int, tuple]) -> bytes:
+        """Build the row element of one record."""
+        number = str(row_number).encode('ascii')
+        styles = template_rows.get(row_number, (b'', {}))[1]
+        cells = []
+        for column, letter, position, money_index in self._plan:
+            reference = letter + number
+            if money_index is not None and amounts[money_index] is not None:
+                cells.append((column, b'<c r="%s" s="%s"><v>%s</v></c>'
+                              % (reference, self._amount_styles[styles.get(column)],
+                                 str(amounts[money_index]).encode('ascii'))))
+            elif position == self._fecha_position and fecha_value is not None:
+                serial = repr(to_excel(fecha_value, self._epoch)).encode('ascii')
+                cells.append((column, b'<c r="%s" s="%s"><v>%s</v></c>'
+                              % (reference, self._fecha_styles[styles.get(column)], serial)))
+            elif values[position]:
+                cells.append((column, _inline_string(reference, values[position], styles.get(column))))
+        return self._row(row_number, cells, template_rows)
+    
+    def _row(self, row_number: int, cells: List[Tuple[int, bytes]], template_rows: Dict[int, tuple]) -> bytes:
+        """Build a row element, adding the formatting-only cells kept from the template row."""
+        attributes, styles = template_rows.get(row_number, (b'', {}))
+        if styles:
+            written = {column for column, _ in cells}
+            number = str(row_number).encode('ascii')
+            cells = cells + [
+                (column, b'<c r="%s%s" s="%s"/>' % (get_column_letter(column).encode('ascii'), number, style))
+                for column, style in styles.items() if column not in written
+            ]
+            cells.sort(key=lambda cell: cell[0])
+        attributes = b' ' + attributes if attributes else b''
+        if not cells:
+            return b'<row r="%d"%s/>' % (row_number, attributes)
+        return b'<row r="%d"%s>%s</row>' % (row_number, attributes, b''.join(cell for _, cell in cells))
@@ -0,0 +1,183 @@
+"""
+Pluggable XML parser backends for the CFDI XML parser
+"""
+
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Tuple, Any
+import logging
+import threading
+
+from .mapping_plan import MappingPlan, FieldGroup
+
+BACKENDS = ('etree', 'lxml')
+
+
+class ElementTreeBackend:
+    """Backend built on the standard library xml.etree.ElementTree."""
+    
+    name = 'etree'
+    
+    def __init__(self):
+        """Initialize the ElementTree backend."""
+        self.parse_errors = (ET.ParseError,)
+    
+    def parse(self, source) -> Any:
+        """
+        Parse a complete document.
+        
+        Args:
+            source: File path or binary file object
+        
+        Returns:
+            Root element
+        """
+        return ET.parse(source).getroot()
+    
+    def iterparse(self, source, events: Tuple[str, ...]):
+        """Incrementally parse a binary file object, yielding (event, element)."""
+        return ET.iterparse(source, events=events)
+    
+    def extract(self, root, plan: MappingPlan) -> Dict[str, str]:
+        """
+        Extract every mapped value from a parsed document.
+        
+        Args:
+            root: Root element returned by parse()
+            plan: Compiled mapping plan
+        
+        Returns:
+            Dictionary of Excel column -> extracted value
+        """
+        return plan.extract(root)
+
+
+class LxmlBackend:
+    """
+    Backend built on lxml with precompiled XPath for the mapping.
+    
+    lxml releases the GIL while parsing, so a thread pool gets real
+    parallelism without the cost of starting worker processes. lxml
+    parsers and XPath evaluators must not be shared between threads, so
+    both are kept per thread.
+    """
+    
+    name = 'lxml'
+    
+    def __init__(self):
+        """
+        Initialize the lxml backend.
+        
+        Raises:
+            ImportError: If lxml is not installed
+        """
+        from lxml import etree
+        self._etree = etree
+        self._local = threading.local()
+        self.parse_errors = (etree.XMLSyntaxError, ET.ParseError)
+    
+    def _parser(self):
+        """Per-thread parser with entity expansion and network access disabled."""
+        parser = getattr(self._local, 'parser', None)
+        if parser is None:
+            parser = self._etree.XMLParser(resolve_entities=False, no_network=True)
+            self._local.parser = parser
+        return parser
+    
+    def parse(self, source) -> Any:
+        """
+        Parse a complete document.
+        
+        Args:
+            source: File path or binary file object
+        
+        Returns:
+            Root element
+        """
+        return self._etree.parse(source, self._parser()).getroot()
+    
+    def iterparse(self, source, events: Tuple[str, ...]):
+        """Incrementally parse a binary file object, yielding (event, element)."""
+        return self._etree.iterparse(source, events=events, resolve_entities=False, no_network=True)
+    
+    def _compiled_xpaths(self, plan: MappingPlan) -> Dict[str, List[Tuple[FieldGroup, Any]]]:
+        """
+        Compile (once per thread and plan) an XPath per field group and CFDI namespace.
+        
+        Args:
+            plan: Compiled mapping plan
+        
+        Returns:
+            Dictionary of CFDI namespace -> [(field group, XPath)]
+        """
+        cache = getattr(self._local, 'xpaths', None)
+        if cache is None:
+            cache = self._local.xpaths = {}
+        
+        compiled = cache.get(id(plan))
+        if compiled is None:
+            compiled = {}
+            for namespace in plan.cfdi_namespaces:
+                compiled[namespace] = []
+                for group in plan.groups:
+                    prefixes = {}
+                    steps = []
+                    for index, clark_tag in enumerate(group.clark_paths[namespace]):
+                        step_namespace, _, local_name = clark_tag[1:].partition('}')
+                        prefixes[f"n{index}"] = step_namespace
+                        steps.append(f"n{index}:{local_name}")
+                    xpath = self._etree.XPath('/'.join(steps), namespaces=prefixes, smart_strings=False)
+                    compiled[namespace].append((group, xpath))
+            cache[id(plan)] = compiled
+        return compiled
+    
+    def extract(self, root, plan: MappingPlan) -> Dict[str, str]:
+        """
+        Extract every mapped value from a parsed document.
+        
+        Args:
+            root: Root element returned by parse()
+            plan: Compiled mapping plan
+        
+        Returns:
+            Dictionary of Excel column -> extracted value
+        """
+        record = plan.new_record()
+        for attr_name, excel_column in plan.root_fields:
+            record[excel_column] = root.get(attr_name, '')
+        
+        compiled = self._compiled_xpaths(plan)
+        namespaces = plan.candidate_namespaces(root.tag)
+        for index, group in enumerate(plan.groups):
+            for namespace in namespaces:
+                matches = compiled[namespace][index][1](root)
+                if matches:
+                    group.read(matches[0], record)
+                    break
+        return record
+
+
+def get_backend(name: str):
+    """
+    Create a parser backend by name.
+    
+    Falls back to ElementTree (with a warning) if lxml is requested but not
+    installed.
+    
+    Args:
+        name: "etree" or "lxml"
+    
+    Returns:
+        Backend instance
+    
+    Raises:
+        ValueError: If the backend name is unknown
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown XML backend: {name}")
+    
+    if name == 'lxml':
+        try:
+            return LxmlBackend()
+        except ImportError:
+            logging.getLogger(__name__).warning("lxml is not installed, falling back to xml.etree")
+    return ElementTreeBackend()
@@ -3,146 +3,642 @@ XML Parser for CFDI (Mexican electronic invoices)
 """
 
 import xml.etree.ElementTree as ET
-from pathlib import Path
-from typing import Dict, List, Optional, Any
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from decimal import Decimal
+from typing import Dict, List, Optional, Any, Tuple, Union, Iterable, Iterator
 import logging
+import multiprocessing
+import os
+import zipfile
 
 # Import configuration
-from config.settings import CFDI_MAPPING
+from config.settings import PROCESSING_CONFIG
+from .mapping_plan import MappingPlan, DEFAULT_PLAN
+from .xml_backends import get_backend
+from .parse_cache import ParseCache
+from .header_scanner import HeaderScanner
+from .xml_sources import FileSource, XMLSource, to_source, expand_sources, iter_batches
+from utils.helpers import parse_money, parse_cfdi_datetime
+from .data_models import (CFDIBatch, ParseOutcome, FAILURE_IO_ERROR, FAILURE_XML_SYNTAX, FAILURE_NOT_CFDI,
+                          FAILURE_UNSUPPORTED_VERSION, FAILURE_UNEXPECTED)
+
+EXTRACTION_MODES = ('stream', 'dom', 'fast')
+PARALLEL_MODES = ('auto', 'process', 'thread')
+
+# Namespace prefix shared by every CFDI version published by the SAT
+SAT_CFD_NAMESPACE_PREFIX = 'http://www.sat.gob.mx/cfd/'
+
+class CFDIStructureError(Exception):
+    """The document is well-formed XML but not a supported CFDI."""
+    
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+# Parser owned by each worker process of the parallel mode
+_worker_parser = None
+
+def _init_worker(extraction_mode: str, plan: MappingPlan, backend: str):
+    """Create the parser used by a worker process."""
+    global _worker_parser
+    _worker_parser = CFDIXMLParser(extraction_mode=extraction_mode, plan=plan, backend=backend)
+
+def _parse_in_worker(source: XMLSource) -> Tuple[bool, Union[Tuple[str, ...], str]]:
+    """Parse one file inside a worker process and return a compact record."""
+    return _worker_parser.parse_compact(source)
+
+class _ParsePool:
+    """
+    Worker pool for one parse_multiple_files()/iter_parse() run.
+    
+    The pool is started lazily, the first time a batch is large enough to
+    be worth parallelizing, and then reused for every following batch.
+    """
+    
+    def __init__(self, parser: 'CFDIXMLParser', workers: Optional[int], chunk_size: Optional[int],
+                 parallel_mode: Optional[str]):
+        """
+        Initialize the pool.
+        
+        Args:
+            parser: Parser the files are parsed with
+            workers: Parallel workers (None: from config)
+            chunk_size: Files per worker process task (None: from config)
+            parallel_mode: Parallel mode (None: from config)
+        """
+        self.parser = parser
+        self.workers = workers
+        self.chunk_size = chunk_size if chunk_size is not None else PROCESSING_CONFIG.get('parse_chunk_size', 64)
+        self.parallel_mode = parallel_mode
+        self.executor = None
+        self.uses_processes = False
+    
+    def _start(self, workers: int):
+        """Start the executor with the given number of workers."""
+        if self.parser._resolve_parallel_mode(self.parallel_mode) == 'thread':
+            self.parser.logger.info(f"Parsing with {workers} threads")
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+            return
+        
+        # "spawn" behaves the same on every platform and inside the PyInstaller
+        # build (see multiprocessing.freeze_support() in main.py)
+        self.parser.logger.info(f"Parsing with {workers} worker processes")
+        self.executor = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_worker,
+                                            initargs=(self.parser.extraction_mode, self.parser.plan,
+                                                      self.parser.backend.name))
+        self.uses_processes = True
+    
+    def map(self, sources: List[XMLSource]) -> Iterator[Tuple[bool, Union[Tuple[str, ...], str]]]:
+        """
+        Parse files and return their compact outcomes in input order.
+        
+        Args:
+            sources: XML sources
+        
+        Returns:
+            Iterator of parse_compact() outcomes
+        """
+        if self.executor is None:
+            workers = self.parser._resolve_workers(self.workers, len(sources))
+            if workers <= 1:
+                return map(self.parser.parse_compact, sources)
+            self._start(workers)
+        
+        if self.uses_processes:
+            return self.executor.map(_parse_in_worker, sources, chunksize=max(1, self.chunk_size))
+        return self.executor.map(self.parser.parse_compact, sources)
+    
+    def shutdown(self):
+        """Stop the workers, if any were started."""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
 
 class CFDIXMLParser:
     """Parser for CFDI XML files with predefined mapping."""
     
-    def __init__(self):
-        """Initialize the CFDI XML parser."""
+    def __init__(self, extraction_mode: str = None, plan: MappingPlan = None, backend: str = None,
+                 cache: ParseCache = None):
+        """
+        Initialize the CFDI XML parser.
+        
+        Args:
+            extraction_mode: "stream", "dom" or "fast" (default: xml_extraction_mode from config)
+            plan: Compiled mapping plan (default: plan compiled from CFDI_MAPPING)
+            backend: "lxml" or "etree" (default: xml_backend from config)
+            cache: Optional parse cache used by parse_multiple_files()
+        """
         self.logger = logging.getLogger(__name__)
         
-    def parse_cfdi_file(self, xml_file_path: str) -> Optional[Dict[str, Any]]:
+        if extraction_mode is None:
+            extraction_mode = PROCESSING_CONFIG.get('xml_extraction_mode', 'stream')
+        if extraction_mode not in EXTRACTION_MODES:
+            raise ValueError(f"Unknown extraction mode: {extraction_mode}")
+        self.extraction_mode = extraction_mode
+        
+        self.plan = plan or DEFAULT_PLAN
+        self.backend = get_backend(backend or PROCESSING_CONFIG.get('xml_backend', 'etree'))
+        
+        self.scanner = None
+        if extraction_mode == 'fast':
+            self.scanner = HeaderScanner(self.plan)
+            if not self.scanner.supported:
+                self.logger.warning("Mapping reaches below the header nodes, fast mode will use streaming")
+        
+        if cache is not None and cache.plan_signature != self.plan.signature:
+            raise ValueError("Parse cache was created for a different mapping plan")
+        self.cache = cache
+        
+        # Files that failed in the last parse_multiple_files() call
+        self.last_failures: List[Dict[str, str]] = []
+        
+        # Pool kept between runs by keep_pool(), shut down by close()
+        self._kept_pool: Optional[_ParsePool] = None
+    
+    def keep_pool(self, workers: int = None, chunk_size: int = None, parallel_mode: str = None):
+        """
+        Keep the parse workers alive between runs instead of starting them for each run.
+        
+        The pool is still started lazily by the first batch large enough to
+        be parallelized; from then on every run reuses it, and the workers,
+        chunk_size and parallel_mode arguments of the parse methods are ignored.
+        Call close() to stop it.
+        
+        Args:
+            workers: Parallel workers (default: parse_workers from config)
+            chunk_size: Files per worker process task (default: parse_chunk_size from config)
+            parallel_mode: "process", "thread" or "auto" (default: parallel_mode from config)
+        """
+        self.close()
+        self._kept_pool = _ParsePool(self, workers, chunk_size, parallel_mode)
+    
+    def close(self):
+        """Stop the pool kept by keep_pool(), if any."""
+        if self._kept_pool is not None:
+            self._kept_pool.shutdown()
+            self._kept_pool = None
+    
+    def parse_cfdi_file(self, xml_file_path: Union[str, XMLSource]) -> Optional[Dict[str, Any]]:
         """
         Parse a single CFDI XML file and extract data according to predefined mapping.
         
         Args:
-            xml_file_path: Path to the XML file
-            
+            xml_file_path: Path to the XML file or an XML source (e.g. a ZIP member)
+        
         Returns:
             Dictionary with extracted data or None if parsing fails
         """
+        source = to_source(xml_file_path)
+        xml_file_path = source.file_path
         try:
-            # Parse XML file
-            tree = ET.parse(xml_file_path)
-            root = tree.getroot()
-            
-            # Extract data using predefined mapping
-            extracted_data = {}
+            extracted_data = self._extract(source)
             
-            for xml_path, excel_column in CFDI_MAPPING.items():
-                value = self._extract_xml_value(root, xml_path)
-                extracted_data[excel_column] = value
-                
             # Add file information
-            extracted_data['file_path'] = xml_file_path
-            extracted_data['file_name'] = Path(xml_file_path).name
+            extracted_data['file_path'] = source.file_path
+            extracted_data['file_name'] = source.file_name
             
             self.logger.info(f"Successfully parsed CFDI file: {xml_file_path}")
             return extracted_data
-            
-        except ET.ParseError as e:
+        
+        except self.backend.parse_errors as e:
             self.logger.error(f"XML parsing error in {xml_file_path}: {e}")
             return None
         except Exception as e:
             self.logger.error(f"Unexpected error parsing {xml_file_path}: {e}")
             return None
     
-    def _extract_xml_value(self, root: ET.Element, xml_path: str) -> str:
+    def parse_compact(self, source: XMLSource) -> Tuple[bool, Union[Tuple[str, ...], str]]:
         """
-        Extract value from XML using XPath-like path.
+        Parse a file into a compact record (used by the worker processes).
         
         Args:
-            root: Root element of XML tree
-            xml_path: Path to extract (e.g., "cfdi:Comprobante/@Fecha")
-            
+            source: XML source to parse
+        
         Returns:
-            Extracted value or empty string if not found
+            (True, values in plan column order) or (False, error message)
         """
         try:
-            # Define namespace mappings for different CFDI versions
-            namespaces_v3 = {'cfdi': 'http://www.sat.gob.mx/cfd/3'}
-            namespaces_v4 = {'cfdi': 'http://www.sat.gob.mx/cfd/4'}
-            
-            # Split path into element and attribute
-            if '/@' in xml_path:
-                element_path, attr_name = xml_path.split('/@')
-                
-                # Handle root element attributes (cfdi:Comprobante)
-                if element_path == 'cfdi:Comprobante':
-                    return root.get(attr_name, '')
+            extracted_data = self._extract(source)
+            return True, tuple(extracted_data[column] for column in self.plan.columns)
+        except self.backend.parse_errors as e:
+            return False, f"XML inválido: {e}"
+        except Exception as e:
+            return False, f"Error inesperado: {e}"
+    
+    def parse_and_validate(self, xml_file_path: Union[str, XMLSource]) -> ParseOutcome:
+        """
+        Validate a CFDI and extract its data reading and parsing the file only once.
+        
+        The root element must be a Comprobante in the namespace of a
+        supported CFDI version; the check is made on the root as it is
+        parsed, in the same pass that extracts the mapping.
+        
+        Args:
+            xml_file_path: Path to the XML file or an XML source (e.g. a ZIP member)
+        
+        Returns:
+            ParseOutcome with the record, or with the failure reason and message
+        """
+        source = to_source(xml_file_path)
+        outcome = ParseOutcome(file_path=source.file_path)
+        try:
+            outcome.record = self._extract(source, validate=True)
+            outcome.record['file_path'] = source.file_path
+            outcome.record['file_name'] = source.file_name
+            return outcome
+        except CFDIStructureError as e:
+            outcome.failure, outcome.message = e.reason, str(e)
+        except self.backend.parse_errors as e:
+            outcome.failure, outcome.message = FAILURE_XML_SYNTAX, f"XML inválido: {e}"
+        except (OSError, KeyError, zipfile.BadZipFile) as e:
+            outcome.failure, outcome.message = FAILURE_IO_ERROR, f"No se pudo leer el archivo: {e}"
+        except Exception as e:
+            outcome.failure, outcome.message = FAILURE_UNEXPECTED, f"Error inesperado: {e}"
+        
+        self.logger.warning(f"Invalid CFDI file {source.file_path} ({outcome.failure}): {outcome.message}")
+        return outcome
+    
+    def _validate_root(self, root_tag: str):
+        """
+        Check that a root element is the Comprobante of a supported CFDI version.
+        
+        Args:
+            root_tag: Clark-notation tag of the root element
+        
+        Raises:
+            CFDIStructureError: If the root is not a supported CFDI Comprobante
+        """
+        namespace, _, local_name = root_tag[1:].rpartition('}') if root_tag[:1] == '{' else ('', '', root_tag)
+        if local_name != 'Comprobante':
+            raise CFDIStructureError(FAILURE_NOT_CFDI, f"El elemento raíz no es Comprobante: {local_name}")
+        if namespace in self.plan.cfdi_namespaces:
+            return
+        if namespace.startswith(SAT_CFD_NAMESPACE_PREFIX):
+            raise CFDIStructureError(FAILURE_UNSUPPORTED_VERSION, f"Versión de CFDI no soportada: {namespace}")
+        raise CFDIStructureError(FAILURE_NOT_CFDI, f"Comprobante fuera del espacio de nombres CFDI: {namespace}")
+    
+    def _extract(self, source: XMLSource, validate: bool = False) -> Dict[str, str]:
+        """
+        Extract the mapped values with the configured extraction mode.
+        
+        Args:
+            source: XML source to parse
+            validate: Check the root element (raises CFDIStructureError)
+        
+        Returns:
+            Dictionary of Excel column -> extracted value
+        """
+        if self.scanner is not None:
+            # Byte-level scan first; anything unusual goes through the streaming parser.
+            # The scanner only accepts a cfdi:Comprobante root in a known namespace.
+            extracted_data = self.scanner.scan_source(source)
+            if extracted_data is not None:
+                return extracted_data
+            return self._extract_streaming(source, validate)
+        if self.extraction_mode == 'stream':
+            return self._extract_streaming(source, validate)
+        return self._extract_dom(source, validate)
+    
+    def _extract_dom(self, source: XMLSource, validate: bool = False) -> Dict[str, str]:
+        """
+        Extract the mapped values after building the full document tree.
+        
+        Args:
+            source: XML source to parse
+            validate: Check the root element (raises CFDIStructureError)
+        
+        Returns:
+            Dictionary of Excel column -> extracted value
+        """
+        if isinstance(source, FileSource):
+            # Let the backend read the file itself (lxml then parses without the GIL)
+            root = self.backend.parse(source.path)
+        else:
+            with source.open() as xml_file:
+                root = self.backend.parse(xml_file)
+        if validate:
+            self._validate_root(root.tag)
+        return self.backend.extract(root, self.plan)
+    
+    def _extract_streaming(self, source: XMLSource, validate: bool = False) -> Dict[str, str]:
+        """
+        Extract the mapped values with iterparse, stopping after the last mapped node.
+        
+        Parsing stops once every mapped element has been seen (or the Addenda
+        starts). In a CFDI the top-level Impuestos and the stamp in the
+        Complemento follow the Conceptos, so the parser still reads every
+        Concepto and the cost stays linear in file size; subtrees without
+        mapped elements only have their depth tracked and are cleared as
+        they close, which keeps memory flat and the per-element work small
+        for invoices with thousands of Conceptos. The fast extraction mode
+        (HeaderScanner) skips the Conceptos bytes instead. Note that the
+        remainder of the document after the last mapped node is not checked
+        for well-formedness.
+        
+        Args:
+            source: XML source to parse
+            validate: Check the root element (raises CFDIStructureError)
+        
+        Returns:
+            Dictionary of Excel column -> extracted value
+        """
+        plan = self.plan
+        extracted_data = plan.new_record()
+        stack = []
+        index = prefixes = pending = None
+        text_groups = {}
+        skipped = 0  # Depth inside a subtree without mapped elements
+        
+        with source.open() as xml_file:
+            for event, element in self.backend.iterparse(xml_file, events=('start', 'end')):
+                if skipped:
+                    if event == 'start':
+                        skipped += 1
+                    else:
+                        element.clear()
+                        skipped -= 1
+                        if not skipped:
+                            stack.pop()
+                    continue
                 
-                # Handle child element attributes - try both namespaces
-                element = root.find(element_path, namespaces_v3)
-                if element is None:
-                    element = root.find(element_path, namespaces_v4)
+                if event == 'end':
+                    group = text_groups.pop(element, None)
+                    if group is not None:
+                        group.read(element, extracted_data)
+                        if not pending and not text_groups:
+                            break
+                    stack.pop()
+                    if stack:
+                        element.clear()
+                    continue
                 
-                if element is not None:
-                    return element.get(attr_name, '')
-            else:
-                # Just element path (no attribute) - try both namespaces
-                element = root.find(xml_path, namespaces_v3)
-                if element is None:
-                    element = root.find(xml_path, namespaces_v4)
+                stack.append(element.tag)
+                if index is None:
+                    # Root element: the CFDI version is detected once from its tag
+                    if validate:
+                        self._validate_root(element.tag)
+                    for attr_name, excel_column in plan.root_fields:
+                        extracted_data[excel_column] = element.get(attr_name, '')
+                    index = plan.stream_index(element.tag)
+                    prefixes = plan.stream_prefixes(element.tag)
+                    pending = set(plan.groups)
+                elif len(stack) == 2 and element.tag in plan.stop_tags:
+                    break
+                else:
+                    path = tuple(stack[1:])
+                    if path not in prefixes:
+                        skipped = 1
+                        continue
+                    group = index.get(path)
+                    if group in pending:
+                        pending.discard(group)
+                        if group.reads_text:
+                            text_groups[element] = group
+                        else:
+                            group.read(element, extracted_data)
                 
-                if element is not None:
-                    return element.text or ''
-                        
-        except Exception as e:
-            self.logger.warning(f"Error extracting {xml_path}: {e}")
-            
-        return ''
+                if not pending and not text_groups:
+                    break
+        
+        return extracted_data
     
-    def parse_multiple_files(self, xml_file_paths: List[str]) -> List[Dict[str, Any]]:
+    def parse_multiple_files(self, xml_file_paths: List[str], workers: int = None,
+                             chunk_size: int = None, parallel_mode: str = None,
+                             batch_size: int = None) -> List[Dict[str, Any]]:
         """
         Parse multiple CFDI XML files.
         
+        ZIP packages in the list are read member by member without extracting
+        them to disk, and DirectorySource objects are walked lazily. Unchanged
+        files are served from the parse cache when one is set.
+        Large batches are spread over a pool of worker processes, or of
+        threads when the lxml backend is used (lxml releases the GIL while
+        parsing). Results keep the input order; files that fail are skipped
+        and listed in self.last_failures.
+        
         Args:
-            xml_file_paths: List of XML file paths
-            
+            xml_file_paths: List of XML paths, ZIP package paths, folders (DirectorySource) or XML sources
+            workers: Parallel workers (default: parse_workers from config, 1 = serial)
+            chunk_size: Files per worker process task (default: parse_chunk_size from config)
+            parallel_mode: "process", "thread" or "auto" (default: parallel_mode from config)
+            batch_size: Files enumerated and parsed at a time (default: max_files_per_batch from config)
+        
         Returns:
             List of dictionaries with extracted data
         """
         results = []
+        for batch_results in self.iter_parse(xml_file_paths, workers, chunk_size, parallel_mode, batch_size):
+            results.extend(batch_results)
+        return results
+    
+    def iter_parse(self, xml_file_paths: Iterable[Any], workers: int = None, chunk_size: int = None,
+                   parallel_mode: str = None, batch_size: int = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Parse files batch by batch, yielding the results of each batch.
+        
+        Sources are enumerated lazily and at most batch_size of them are held
+        at a time, so a folder with millions of files can be processed with
+        bounded memory. The worker pool is started once and reused for every
+        batch. self.last_failures accumulates over the whole run.
+        
+        Args:
+            xml_file_paths: Iterable of XML paths, ZIP package paths, folders (DirectorySource) or XML sources
+            workers: Parallel workers (default: parse_workers from config, 1 = serial)
+            chunk_size: Files per worker process task (default: parse_chunk_size from config)
+            parallel_mode: "process", "thread" or "auto" (default: parallel_mode from config)
+            batch_size: Files per batch (default: max_files_per_batch from config)
+        
+        Yields:
+            List of dictionaries with extracted data for each batch
+        """
+        yield from self._iter_results(xml_file_paths, list, workers, chunk_size, parallel_mode, batch_size)
+    
+    def parse_to_batch(self, xml_file_paths: Iterable[Any], workers: int = None, chunk_size: int = None,
+                       parallel_mode: str = None, batch_size: int = None) -> CFDIBatch:
+        """
+        Parse files straight into a column-oriented CFDIBatch.
+        
+        Same as parse_multiple_files() but without building a dictionary per
+        file: compact parse outcomes are appended to the batch columns.
+        
+        Args:
+            xml_file_paths: Iterable of XML paths, ZIP package paths, folders (DirectorySource) or XML sources
+            workers: Parallel workers (default: parse_workers from config, 1 = serial)
+            chunk_size: Files per worker process task (default: parse_chunk_size from config)
+            parallel_mode: "process", "thread" or "auto" (default: parallel_mode from config)
+            batch_size: Files enumerated and parsed at a time (default: max_files_per_batch from config)
+        
+        Returns:
+            CFDIBatch with the successfully parsed files, in input order
+        """
+        batch = CFDIBatch(self.plan.columns)
+        for _ in self._iter_results(xml_file_paths, lambda: batch, workers, chunk_size, parallel_mode, batch_size):
+            pass
+        return batch
+    
+    def iter_parse_batches(self, xml_file_paths: Iterable[Any], workers: int = None, chunk_size: int = None,
+                           parallel_mode: str = None, batch_size: int = None) -> Iterator[CFDIBatch]:
+        """
+        Parse files batch by batch, yielding one CFDIBatch per batch.
+        
+        Args:
+            xml_file_paths: Iterable of XML paths, ZIP package paths, folders (DirectorySource) or XML sources
+            workers: Parallel workers (default: parse_workers from config, 1 = serial)
+            chunk_size: Files per worker process task (default: parse_chunk_size from config)
+            parallel_mode: "process", "thread" or "auto" (default: parallel_mode from config)
+            batch_size: Files per batch (default: max_files_per_batch from config)
+        
+        Yields:
+            CFDIBatch with the successfully parsed files of each batch
+        """
+        yield from self._iter_results(xml_file_paths, lambda: CFDIBatch(self.plan.columns),
+                                      workers, chunk_size, parallel_mode, batch_size)
+    
+    def _iter_results(self, xml_file_paths: Iterable[Any], new_results, workers: Optional[int],
+                      chunk_size: Optional[int], parallel_mode: Optional[str], batch_size: Optional[int]):
+        """
+        Parse files batch by batch, collecting each batch into new_results().
+        
+        Args:
+            xml_file_paths: Iterable of XML paths, ZIP package paths, folders (DirectorySource) or XML sources
+            new_results: Callable returning the list or CFDIBatch a batch is collected into
+            workers: Parallel workers (None: from config)
+            chunk_size: Files per worker process task (None: from config)
+            parallel_mode: Parallel mode (None: from config)
+            batch_size: Files per batch (None: from config)
+        
+        Yields:
+            The collected results of each batch
+        """
+        if batch_size is None:
+            batch_size = PROCESSING_CONFIG['max_files_per_batch']
         
-        for file_path in xml_file_paths:
-            data = self.parse_cfdi_file(file_path)
-            if data:
+        self.last_failures = []
+        pool = self._kept_pool or _ParsePool(self, workers, chunk_size, parallel_mode)
+        try:
+            for batch in iter_batches(expand_sources(xml_file_paths), batch_size):
+                results = new_results()
+                self._collect(batch, self._cached_outcomes(batch, pool), results)
+                yield results
+        finally:
+            if pool is not self._kept_pool:
+                pool.shutdown()
+        
+        if self.cache is not None:
+            self.logger.info(f"Parse cache: {self.cache.hits} hits, {self.cache.misses} misses")
+    
+    def _cached_outcomes(self, sources: List[XMLSource],
+                         pool: '_ParsePool') -> Iterator[Tuple[bool, Union[Tuple[str, ...], str]]]:
+        """
+        Yield one compact outcome per file, serving unchanged files from the cache.
+        
+        Only cache misses are parsed; their records are written back to the
+        cache once the batch is done.
+        
+        Args:
+            sources: XML sources
+            pool: Pool the cache misses are parsed with
+        
+        Yields:
+            parse_compact() style outcomes in input order
+        """
+        if self.cache is None:
+            yield from pool.map(sources)
+            return
+        
+        keys = [self.cache.make_key(source) for source in sources]
+        cached = [self.cache.get(key) for key in keys]
+        misses = [index for index, values in enumerate(cached) if values is None]
+        parsed = pool.map([sources[index] for index in misses])
+        
+        fresh = []
+        for key, values in zip(keys, cached):
+            if values is not None:
+                yield True, values
+                continue
+            outcome = next(parsed)
+            if outcome[0] and key is not None:
+                fresh.append((key, outcome[1]))
+            yield outcome
+        
+        self.cache.put_many(fresh)
+    
+    def _collect(self, sources: List[XMLSource], outcomes, results: Union[List[Dict[str, Any]], CFDIBatch]):
+        """
+        Turn compact parse outcomes back into result dictionaries or batch rows.
+        
+        Args:
+            sources: Parsed XML sources, in the same order as outcomes
+            outcomes: Iterable of parse_compact() results
+            results: List or CFDIBatch the successful records are appended to
+        """
+        columnar = isinstance(results, CFDIBatch)
+        # Iterate the outcomes (not the paths) so generators run to completion
+        for index, (success, payload) in enumerate(outcomes):
+            source = sources[index]
+            file_path = source.file_path
+            if success and columnar:
+                results.append_values(payload, file_path, source.file_name)
+            elif success:
+                data = dict(zip(self.plan.columns, payload))
+                data['file_path'] = file_path
+                data['file_name'] = source.file_name
                 results.append(data)
             else:
-                self.logger.warning(f"Failed to parse file: {file_path}")
-                
-        return results
+                self.last_failures.append({'file_path': file_path, 'error': payload})
+                self.logger.warning(f"Failed to parse file {file_path}: {payload}")
+    
+    def _resolve_parallel_mode(self, parallel_mode: Optional[str]) -> str:
+        """
+        Decide between worker processes and threads.
+        
+        Args:
+            parallel_mode: Requested mode (None: from config)
+        
+        Returns:
+            "process" or "thread"
+        """
+        if parallel_mode is None:
+            parallel_mode = PROCESSING_CONFIG.get('parallel_mode', 'auto')
+        if parallel_mode not in PARALLEL_MODES:
+            raise ValueError(f"Unknown parallel mode: {parallel_mode}")
+        if parallel_mode == 'auto':
+            return 'thread' if self.backend.name == 'lxml' else 'process'
+        return parallel_mode
+    
+    def _resolve_workers(self, workers: Optional[int], file_count: int) -> int:
+        """
+        Decide how many worker processes to use for a batch.
+        
+        Args:
+            workers: Requested worker count (None: from config)
+            file_count: Number of files in the batch
+        
+        Returns:
+            Worker count, 1 meaning the serial loop
+        """
+        if workers is None:
+            if file_count < PROCESSING_CONFIG.get('parallel_min_files', 200):
+                return 1
+            workers = PROCESSING_CONFIG.get('parse_workers') or os.cpu_count() or 1
+        return max(1, min(workers, file_count))
     
     def validate_cfdi_structure(self, xml_file_path: str) -> bool:
         """
         Basic validation of CFDI XML structure.
         
+        Callers that also need the data should use parse_and_validate(),
+        which returns both from a single parse.
+        
         Args:
             xml_file_path: Path to the XML file
-            
+        
         Returns:
             True if valid CFDI structure, False otherwise
         """
-        try:
-            tree = ET.parse(xml_file_path)
-            root = tree.getroot()
-            
-            # Check if root element is Comprobante
-            if 'Comprobante' in root.tag:
-                return True
-            else:
-                self.logger.warning(f"Root element is not Comprobante: {root.tag}")
-                return False
-                
-        except Exception as e:
-            self.logger.error(f"Error validating CFDI structure: {e}")
-            return False
+        return self.parse_and_validate(xml_file_path).success
     
     def get_processing_summary(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
@@ -150,7 +646,7 @@ class CFDIXMLParser:
         
         Args:
             results: List of parsed CFDI data
-            
+        
         Returns:
             Summary dictionary with statistics
         """
@@ -159,33 +655,31 @@ class CFDIXMLParser:
                 'total_files': 0,
                 'successful_files': 0,
                 'failed_files': 0,
-                'total_amount': 0.0,
+                'total_amount': Decimal('0'),
                 'currency': '',
                 'date_range': {'start': '', 'end': ''}
             }
         
         # Calculate statistics
-        total_amount = 0.0
+        total_amount = Decimal('0')
         currencies = set()
         dates = []
         
         for result in results:
             # Sum total amounts
-            total_str = result.get('G', '0')
-            try:
-                total_amount += float(total_str)
-            except ValueError:
-                pass
+            total = parse_money(result.get('G', ''))
+            if total is not None:
+                total_amount += total
             
             # Collect currencies
             currency = result.get('F', '')
             if currency:
                 currencies.add(currency)
             
-            # Collect dates
-            date = result.get('B', '')
-            if date:
-                dates.append(date)
+            # Collect dates (compared as datetimes, reported as in the XML)
+            date = parse_cfdi_datetime(result.get('B', ''))
+            if date is not None:
+                dates.append((date, result['B']))
         
         return {
             'total_files': len(results),
@@ -194,7 +688,7 @@ class CFDIXMLParser:
             'total_amount': total_amount,
             'currency': list(currencies)[0] if currencies else '',
             'date_range': {
-                'start': min(dates) if dates else '',
-                'end': max(dates) if dates else ''
+                'start': min(dates)[1] if dates else '',
+                'end': max(dates)[1] if dates else ''
             }
         } 
\ No newline at end of file
@@ -0,0 +1,341 @@
+"""
+XML sources for the CFDI parser: plain files and members of ZIP packages
+"""
+
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Sequence, Sized, Tuple, Union
+from collections import OrderedDict
+from itertools import islice
+from pathlib import Path
+import fnmatch
+import os
+import threading
+import zipfile
+
+# Open archives kept per thread (and therefore per worker process)
+MAX_OPEN_ARCHIVES = 4
+
+_archive_handles = threading.local()
+
+
+def _open_archive(archive_path: str) -> zipfile.ZipFile:
+    """
+    Get this thread's open handle for an archive.
+    
+    ZipFile objects are not safe to read from several threads at once, so
+    every thread keeps its own small LRU of open archives. A handle is only
+    reused while the file keeps its size and mtime; a ZIP replaced under the
+    same name is reopened and the old handle closed.
+    
+    Args:
+        archive_path: Path to the ZIP file
+    
+    Returns:
+        Open ZipFile
+    """
+    handles = getattr(_archive_handles, 'handles', None)
+    if handles is None:
+        handles = _archive_handles.handles = OrderedDict()
+    
+    stat = os.stat(archive_path)
+    stamp = (stat.st_size, stat.st_mtime_ns)
+    entry = handles.get(archive_path)
+    if entry is not None:
+        if entry[0] == stamp:
+            handles.move_to_end(archive_path)
+            return entry[1]
+        del handles[archive_path]
+        entry[1].close()
+    
+    archive = zipfile.ZipFile(archive_path)
+    handles[archive_path] = (stamp, archive)
+    if len(handles) > MAX_OPEN_ARCHIVES:
+        _, (_, oldest) = handles.popitem(last=False)
+        oldest.close()
+    return archive
+
+
+def close_archives():
+    """Close the archives this thread keeps open, so the ZIP files are not held between runs."""
+    handles = getattr(_archive_handles, 'handles', None)
+    while handles:
+        _, (_, archive) = handles.popitem()
+        archive.close()
+
+
+class FileSource:
+    """An XML file on disk."""
+    
+    __slots__ = ('path',)
+    
+    def __init__(self, path: str):
+        """
+        Initialize the file source.
+        
+        Args:
+            path: Path to the XML file
+        """
+        self.path = str(path)
+    
+    @property
+    def file_path(self) -> str:
+        """Path reported in the extracted data."""
+        return self.path
+    
+    @property
+    def file_name(self) -> str:
+        """File name reported in the extracted data."""
+        return Path(self.path).name
+    
+    def open(self) -> BinaryIO:
+        """Open the XML document for binary reading."""
+        return open(self.path, 'rb')
+    
+    def fingerprint(self) -> Tuple[int, int]:
+        """(size, mtime_ns) identifying the current version of the file."""
+        stat = os.stat(self.path)
+        return stat.st_size, stat.st_mtime_ns
+    
+    def __repr__(self) -> str:
+        return f"FileSource({self.path!r})"
+
+
+class ZipMemberSource:
+    """
+    An XML document stored inside a ZIP package.
+    
+    The member is decompressed straight into the extractor; nothing is
+    written to disk. Only the archive path and member name are stored, so
+    the source is cheap to send to worker processes.
+    """
+    
+    __slots__ = ('archive_path', 'member_name')
+    
+    def __init__(self, archive_path: str, member_name: str):
+        """
+        Initialize the ZIP member source.
+        
+        Args:
+            archive_path: Path to the ZIP file
+            member_name: Name of the XML member inside the archive
+        """
+        self.archive_path = str(archive_path)
+        self.member_name = member_name
+    
+    @property
+    def file_path(self) -> str:
+        """Path reported in the extracted data (archive path joined with the member name)."""
+        return os.path.join(self.archive_path, self.member_name)
+    
+    @property
+    def file_name(self) -> str:
+        """File name reported in the extracted data (member name without folders)."""
+        return self.member_name.rsplit('/', 1)[-1]
+    
+    def open(self) -> BinaryIO:
+        """Open the member for binary reading (decompressed on the fly)."""
+        return _open_archive(self.archive_path).open(self.member_name)
+    
+    def fingerprint(self) -> Tuple[int, int]:
+        """(size, CRC-32) of the member, read from the archive directory."""
+        info = _open_archive(self.archive_path).getinfo(self.member_name)
+        return info.file_size, info.CRC
+    
+    def __repr__(self) -> str:
+        return f"ZipMemberSource({self.archive_path!r}, {self.member_name!r})"
+
+
+XMLSource = Union[FileSource, ZipMemberSource]
+
+
+class DirectorySource:
+    """
+    XML files (and optionally ZIP packages) found under a folder.
+    
+    The folder tree is walked lazily with os.scandir, so iterating a
+    folder with a million files never builds a list of all of them.
+    Patterns are matched case-insensitively against the file name;
+    exclude patterns are also matched against the path relative to the
+    root and prune whole folders.
+    """
+    
+    def __init__(self, root: str, include: Sequence[str] = ('*.xml', '*.zip'), exclude: Sequence[str] = (),
+                 recursive: bool = True):
+        """
+        Initialize the directory source.
+        
+        Args:
+            root: Folder to walk
+            include: Glob patterns of files to include (ZIP packages are expanded)
+            exclude: Glob patterns of files or folders to skip
+            recursive: Walk sub-folders as well
+        """
+        self.root = str(root)
+        self.include = tuple(pattern.lower() for pattern in include)
+        self.exclude = tuple(pattern.lower() for pattern in exclude)
+        self.recursive = recursive
+    
+    def _excluded(self, name: str, relative_path: str) -> bool:
+        """Check a file or folder against the exclude patterns."""
+        name = name.lower()
+        relative_path = relative_path.replace(os.sep, '/').lower()
+        return any(fnmatch.fnmatchcase(name, pattern) or fnmatch.fnmatchcase(relative_path, pattern)
+                   for pattern in self.exclude)
+    
+    def iter_paths(self) -> Iterator[str]:
+        """
+        Iterate over the matching file paths.
+        
+        Yields:
+            Paths of included files, folder by folder in scandir order
+        """
+        pending = [self.root]
+        while pending:
+            folder = pending.pop()
+            try:
+                entries = os.scandir(folder)
+            except OSError:
+                continue
+            subfolders = []
+            with entries:
+                for entry in entries:
+                    relative_path = os.path.relpath(entry.path, self.root)
+                    if self._excluded(entry.name, relative_path):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        if self.recursive:
+                            subfolders.append(entry.path)
+                    elif any(fnmatch.fnmatchcase(entry.name.lower(), pattern) for pattern in self.include):
+                        yield entry.path
+            # Keep a depth-first walk in the order the folders were listed
+            pending.extend(reversed(subfolders))
+    
+    def __iter__(self) -> Iterator[XMLSource]:
+        """Iterate over the XML sources, expanding ZIP packages into their members."""
+        return expand_sources(self.iter_paths())
+    
+    def __repr__(self) -> str:
+        return f"DirectorySource({self.root!r})"
+
+
+def is_zip_path(path: str) -> bool:
+    """Check whether a path names a ZIP package by its extension."""
+    return str(path).lower().endswith('.zip')
+
+
+def iter_zip_members(archive_path: str) -> Iterator[ZipMemberSource]:
+    """
+    Iterate over the XML members of a ZIP package.
+    
+    Args:
+        archive_path: Path to the ZIP file
+    
+    Yields:
+        ZipMemberSource for every member ending in .xml
+    """
+    with zipfile.ZipFile(archive_path) as archive:
+        for info in archive.infolist():
+            if not info.is_dir() and info.filename.lower().endswith('.xml'):
+                yield ZipMemberSource(archive_path, info.filename)
+
+
+def count_zip_members(archive_path: str) -> int:
+    """
+    Count the XML members of a ZIP package from its central directory, without reading them.
+    
+    Args:
+        archive_path: Path to the ZIP file
+    
+    Returns:
+        Number of members ending in .xml (1 if the package cannot be read: it is reported as one failed file)
+    """
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            return sum(1 for info in archive.infolist()
+                       if not info.is_dir() and info.filename.lower().endswith('.xml'))
+    except (OSError, zipfile.BadZipFile):
+        return 1
+
+
+def count_sources(items: Iterable[Union[str, os.PathLike, XMLSource, DirectorySource]],
+                  limit: int = None) -> Optional[int]:
+    """
+    Count the XML documents expand_sources() would yield, without parsing any of them.
+    
+    Folders are walked by file name only and ZIP packages are counted from
+    their central directory.
+    
+    Args:
+        items: XML paths, ZIP paths, source objects or DirectorySource objects
+        limit: Stop counting once this many documents are found
+    
+    Returns:
+        Number of documents (at least limit if counting stopped early), or None
+        if items can only be iterated once
+    """
+    if not isinstance(items, Sized):
+        return None
+    count = 0
+    for item in items:
+        if isinstance(item, DirectorySource):
+            paths = item.iter_paths()
+        else:
+            paths = (item,)
+        for path in paths:
+            if limit is not None and count >= limit:
+                return count
+            if isinstance(path, (FileSource, ZipMemberSource)) or not is_zip_path(path):
+                count += 1
+            else:
+                count += count_zip_members(str(path))
+    return count
+
+
+def to_source(item: Union[str, os.PathLike, XMLSource]) -> XMLSource:
+    """Wrap a plain path in a FileSource; sources are returned unchanged."""
+    if isinstance(item, (FileSource, ZipMemberSource)):
+        return item
+    return FileSource(item)
+
+
+def expand_sources(items: Iterable[Union[str, os.PathLike, XMLSource, DirectorySource]]) -> Iterator[XMLSource]:
+    """
+    Turn paths and sources into XML sources, expanding ZIP packages and folders.
+    
+    Args:
+        items: XML paths, ZIP paths, source objects or DirectorySource objects
+    
+    Yields:
+        XML sources
+    """
+    for item in items:
+        if isinstance(item, DirectorySource):
+            yield from item
+            continue
+        if isinstance(item, (FileSource, ZipMemberSource)) or not is_zip_path(item):
+            yield to_source(item)
+            continue
+        try:
+            members = list(iter_zip_members(str(item)))
+        except (OSError, zipfile.BadZipFile):
+            # Unreadable package: let the parser report it as a failed file
+            members = [FileSource(item)]
+        yield from members
+
+
+def iter_batches(sources: Iterable[XMLSource], batch_size: int) -> Iterator[List[XMLSource]]:
+    """
+    Split a stream of sources into lists of at most batch_size items.
+    
+    Args:
+        sources: Any iterable of sources (consumed lazily)
+        batch_size: Maximum items per batch
+    
+    Yields:
+        Lists of sources
+    """
+    iterator = iter(sources)
+    while True:
+        batch = list(islice(iterator, max(1, batch_size)))
+        if not batch:
+            return
+        yield batch
@@ -9,6 +9,7 @@ import sys
 import os
 import threading
 import logging
+from typing import Optional
 
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -16,7 +17,16 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 # Import our core modules
 from core.xml_parser import CFDIXMLParser
 from core.data_models import CFDIDataProcessor
-from core.excel_processor import ExcelProcessor
+from core.excel_processor import ExcelProcessor, TemplateSession
+from core.pipeline import CFDIPipeline
+from core.template_inspector import TemplateInspector, TemplateInspectionError
+from core.parse_cache import ParseCache
+from core.mapping_plan import DEFAULT_PLAN
+from core.xml_sources import DirectorySource
+from config.settings import CACHE_CONFIG, EXCEL_CONFIG
+
+# Month option that fills every month tab of the selected year
+WHOLE_YEAR_OPTION = "Todo el año"
 
 class CFDIApplication:
     """Main application class for CFDI Control."""
@@ -27,15 +37,31 @@ class CFDIApplication:
         self.setup_window()
         self.create_widgets()
         
-        # Initialize processors
-        self.xml_parser = CFDIXMLParser()
-        self.data_processor = CFDIDataProcessor()
-        self.excel_processor = ExcelProcessor()
-        
         # Initialize logging
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
         
+        # Initialize processors
+        self.xml_parser = CFDIXMLParser(cache=self._create_parse_cache())
+        self.data_processor = CFDIDataProcessor()
+        self.excel_processor = ExcelProcessor()
+        self.pipeline = CFDIPipeline(self.xml_parser, self.data_processor, self.excel_processor)
+    
+    def _create_parse_cache(self):
+        """
+        Open the on-disk parse cache if it is enabled.
+        
+        Returns:
+            ParseCache or None if disabled or unavailable
+        """
+        if not CACHE_CONFIG.get('enabled'):
+            return None
+        try:
+            return ParseCache(plan_signature=DEFAULT_PLAN.signature)
+        except Exception as e:
+            self.logger.warning(f"Parse cache unavailable, parsing every file: {e}")
+            return None
+    
     def setup_window(self):
         """Configure the main window properties."""
         self.root.title("Aplicación de Control CFDI")
@@ -44,7 +70,7 @@ class CFDIApplication:
         
         # Center the window
         self.center_window()
-        
+    
     def center_window(self):
         """Center the window on the screen."""
         self.root.update_idletasks()
@@ -53,7 +79,7 @@ class CFDIApplication:
         x = (self.root.winfo_screenwidth() // 2) - (width // 2)
         y = (self.root.winfo_screenheight() // 2) - (height // 2)
         self.root.geometry(f"{width}x{height}+{x}+{y}")
-        
+    
     def create_widgets(self):
         """Create and arrange all GUI widgets."""
         # Main frame
@@ -90,7 +116,7 @@ class CFDIApplication:
         month_names = ["", "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", 
                       "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
         month_combo = ttk.Combobox(year_frame, textvariable=self.month_var,
-                                   values=month_names, width=10, state="readonly")
+                                   values=month_names + [WHOLE_YEAR_OPTION], width=12, state="readonly")
         month_combo.grid(row=0, column=3)
         
         # File Selection Section
@@ -115,6 +141,7 @@ class CFDIApplication:
         
         ttk.Label(xml_frame, textvariable=self.xml_files_var).grid(row=0, column=0, sticky=(tk.W, tk.E))
         ttk.Button(xml_frame, text="Seleccionar Archivos", command=self.select_xml_files).grid(row=0, column=1, padx=(5, 0))
+        ttk.Button(xml_frame, text="Seleccionar Carpeta", command=self.select_xml_folder).grid(row=0, column=2, padx=(5, 0))
         xml_frame.columnconfigure(0, weight=1)
         
         # Processing Section
@@ -148,17 +175,17 @@ class CFDIApplication:
         self.year_var.trace_add('write', self._validate_inputs)
         self.month_var.trace_add('write', self._validate_inputs)
         self.excel_path_var.trace_add('write', self._validate_inputs)
-        
-    def _process_files_worker(self, year: int, month: int):
+    
+    def _process_files_worker(self, year: int, month: Optional[int], excel_template: TemplateSession):
         """
         Worker method to process files in background thread.
         
         Args:
             year: Selected year
-            month: Selected month
+            month: Selected month, or None to fill every month tab of the year
+            excel_template: Template session for this run
         """
         try:
-            excel_template = self.excel_path_var.get()
             xml_files = self.selected_xml_files
             
             # Update progress
@@ -177,31 +204,19 @@ class CFDIApplication:
             self.root.after(0, lambda: self.status_var.set("Procesando archivos XML..."))
             self.root.after(0, lambda: self.progress_var.set(30))
             
-            # Parse XML files
-            raw_data_list = self.xml_parser.parse_multiple_files(xml_files)
-            if not raw_data_list:
-                self.root.after(0, lambda: messagebox.showerror("Error", "No se pudieron procesar los archivos XML."))
-                self.root.after(0, self._reset_ui)
-                return
-            
-            # Update progress
-            self.root.after(0, lambda: self.status_var.set("Validando datos CFDI..."))
-            self.root.after(0, lambda: self.progress_var.set(60))
-            
-            # Process and validate CFDI data
-            processing_result = self.data_processor.process_raw_data(raw_data_list)
-            
-            # Update progress
-            self.root.after(0, lambda: self.status_var.set("Llenando plantilla Excel..."))
-            self.root.after(0, lambda: self.progress_var.set(80))
+            # Parse, validate and write chunk by chunk (bounded memory for any month size)
+            def report_progress(files_handled: int):
+                self.root.after(0, lambda: self.status_var.set(
+                    f"Procesando archivos XML... ({files_handled} procesados)"))
             
-            # Fill Excel template
-            excel_result = self.excel_processor.process_cfdi_to_excel(
+            excel_result = self.pipeline.run(
                 template_path=excel_template,
-                cfdi_data_list=processing_result.processed_data,
+                xml_sources=xml_files,
                 year=year,
-                month=month
+                month=month,
+                progress=report_progress
             )
+            processing_result = excel_result['processing_result']
             
             if not excel_result['success']:
                 self.root.after(0, lambda: messagebox.showerror("Error", excel_result['error_message']))
@@ -219,14 +234,25 @@ class CFDIApplication:
             success_msg = f"Procesamiento completado exitosamente!\n\n"
             success_msg += f"Archivos procesados: {processing_result.successful_files}\n"
             success_msg += f"Archivos con errores: {processing_result.failed_files}\n"
+            if processing_result.duplicate_files:
+                success_msg += f"CFDI duplicados (mismo UUID): {processing_result.duplicate_files}\n"
             success_msg += f"Registros llenados: {excel_result['records_processed']}\n"
+            if month is None:
+                month_names = ["", "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
+                              "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
+                success_msg += "Meses llenados: " + ", ".join(
+                    f"{month_names[filled]} ({count})" for filled, count in excel_result['months'].items()) + "\n"
+                if excel_result['skipped_records']:
+                    success_msg += f"Registros sin pestaña de mes en {year}: {excel_result['skipped_records']}\n"
+            if len(excel_result['sheets']) > 1:
+                success_msg += f"Pestañas llenadas: {', '.join(excel_result['sheets'])}\n"
             success_msg += f"Archivo de salida: {Path(excel_result['output_path']).name}\n\n"
             success_msg += f"Use el botón 'Abrir Ubicación del Archivo' para encontrar el archivo procesado."
             
             self.root.after(0, lambda: messagebox.showinfo("Éxito", success_msg))
             self.root.after(0, self._enable_download)
             self.root.after(0, self._reset_ui)
-            
+        
         except Exception as e:
             error_msg = f"Error inesperado durante el procesamiento: {str(e)}"
             self.logger.error(error_msg)
@@ -257,29 +283,42 @@ class CFDIApplication:
         else:
             self.process_button.config(state="disabled")
     
-    def _validate_month_tab_exists(self, year: int, month: int) -> bool:
+    def _validate_month_tab_exists(self, year: int, month: Optional[int]) -> bool:
         """
         Validate that the selected month tab exists in the Excel template.
         
+        Only the sheet names and the header row of the month tab are read,
+        so the check is instant even for large templates.
+        
         Args:
             year: Selected year
-            month: Selected month (1-12)
-            
+            month: Selected month (1-12), or None to require at least one month tab of the year
+        
         Returns:
             True if month tab exists, False otherwise
         """
         try:
-            excel_template = self.excel_path_var.get()
-            
-            # Load the Excel workbook
-            workbook = self.excel_processor.load_template(excel_template)
-            if not workbook:
+            inspector = TemplateInspector(self.excel_path_var.get())
+            try:
+                sheet_names = inspector.sheet_names()
+            except TemplateInspectionError:
                 messagebox.showerror("Error", "No se pudo cargar la plantilla Excel.")
                 return False
             
+            if month is None:
+                if not any(self.excel_processor.match_month_tab_name(sheet_names, candidate, year)
+                           for candidate in range(1, 13)):
+                    messagebox.showerror(
+                        "Error",
+                        f"La plantilla Excel no tiene pestañas de meses del año {year}.\n\n"
+                        f"Pestañas disponibles: {', '.join(sheet_names)}"
+                    )
+                    return False
+                return True
+            
             # Try to find the month tab
-            month_worksheet = self.excel_processor.find_month_tab(workbook, month, year)
-            if not month_worksheet:
+            month_tab_name = self.excel_processor.match_month_tab_name(sheet_names, month, year)
+            if not month_tab_name:
                 # Get the expected tab name format
                 expected_tab_name = self.excel_processor.get_month_tab_name(month, year)
                 month_names = ["", "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
@@ -288,14 +327,21 @@ class CFDIApplication:
                 
                 error_msg = f"La pestaña '{selected_month_name}' no existe en la plantilla Excel.\n\n"
                 error_msg += f"Se esperaba encontrar: '{expected_tab_name}'\n"
-                error_msg += f"Pestañas disponibles: {', '.join(workbook.sheetnames)}\n\n"
+                error_msg += f"Pestañas disponibles: {', '.join(sheet_names)}\n\n"
                 error_msg += f"Por favor seleccione un mes que exista en la plantilla."
                 
                 messagebox.showerror("Error", error_msg)
                 return False
             
-            return True
+            # An empty header row usually means the wrong tab or template
+            if not any(inspector.header_row(month_tab_name) or []):
+                messagebox.showwarning(
+                    "Advertencia",
+                    f"La fila de encabezados ({EXCEL_CONFIG['header_row']}) de la pestaña '{month_tab_name}' está vacía."
+                )
             
+            return True
+        
         except Exception as e:
             messagebox.showerror("Error", f"Error al validar la plantilla Excel: {str(e)}")
             return False
@@ -319,12 +365,12 @@ class CFDIApplication:
                 else:  # Linux
                     # Open folder in default file manager
                     subprocess.run(["xdg-open", str(file_path.parent)])
-                    
+            
             except Exception as e:
                 messagebox.showerror("Error", f"No se pudo abrir la ubicación del archivo: {str(e)}")
         else:
             messagebox.showerror("Error", "No hay archivo procesado disponible para descargar.")
-        
+    
     def select_excel_file(self):
         """Open file dialog to select Excel template."""
         filename = filedialog.askopenfilename(
@@ -332,14 +378,22 @@ class CFDIApplication:
             filetypes=[("Archivos Excel", "*.xlsx *.xls"), ("Todos los archivos", "*.*")]
         )
         if filename:
+            # Quick look at the package: sheet names only, no cell data
+            try:
+                sheet_names = TemplateInspector(filename).sheet_names()
+            except TemplateInspectionError:
+                messagebox.showerror("Error", "El archivo seleccionado no es una plantilla Excel (.xlsx) válida.")
+                return
             self.excel_path_var.set(filename)
+            self.status_var.set(f"Plantilla seleccionada: {len(sheet_names)} pestañas")
             self._validate_inputs()  # Trigger validation
-            
+    
     def select_xml_files(self):
-        """Open file dialog to select multiple XML files."""
+        """Open file dialog to select multiple XML files or ZIP packages of XML files."""
         filenames = filedialog.askopenfilenames(
             title="Seleccionar Archivos XML",
-            filetypes=[("Archivos XML", "*.xml"), ("Todos los archivos", "*.*")]
+            filetypes=[("Archivos XML o paquetes ZIP", "*.xml *.zip"), ("Archivos XML", "*.xml"),
+                       ("Paquetes ZIP del SAT", "*.zip"), ("Todos los archivos", "*.*")]
         )
         if filenames:
             count = len(filenames)
@@ -349,14 +403,26 @@ class CFDIApplication:
             self.xml_files_var.set("No se han seleccionado archivos")
             self.selected_xml_files = []
         self._validate_inputs()  # Trigger validation
-            
+    
+    def select_xml_folder(self):
+        """Open folder dialog to process every XML file (and ZIP package) under a folder."""
+        folder = filedialog.askdirectory(title="Seleccionar Carpeta con Archivos XML")
+        if folder:
+            # The folder is walked lazily while processing, not listed here
+            self.xml_files_var.set(f"Carpeta: {folder}")
+            self.selected_xml_files = [DirectorySource(folder)]
+        else:
+            self.xml_files_var.set("No se han seleccionado archivos")
+            self.selected_xml_files = []
+        self._validate_inputs()  # Trigger validation
+    
     def process_files(self):
         """Process the selected files."""
         # Validate inputs
         if not self.excel_path_var.get():
             messagebox.showerror("Error", "Por favor seleccione un archivo de plantilla Excel.")
             return
-            
+        
         if not hasattr(self, 'selected_xml_files') or not self.selected_xml_files:
             messagebox.showerror("Error", "Por favor seleccione archivos XML para procesar.")
             return
@@ -365,17 +431,20 @@ class CFDIApplication:
         if not self.year_var.get().strip() or not self.month_var.get().strip():
             messagebox.showerror("Error", "Por favor seleccione un año y mes válidos.")
             return
-            
+        
         try:
             year = int(self.year_var.get())
             # Convert month name to number
             month_name = self.month_var.get().strip()
             month_names = ["", "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", 
                           "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
-            if month_name not in month_names:
+            if month_name == WHOLE_YEAR_OPTION:
+                month = None
+            elif month_name not in month_names:
                 messagebox.showerror("Error", "Por favor seleccione un mes válido.")
                 return
-            month = month_names.index(month_name)
+            else:
+                month = month_names.index(month_name)
         except ValueError:
             messagebox.showerror("Error", "Por favor seleccione un año y mes válidos.")
             return
@@ -384,6 +453,9 @@ class CFDIApplication:
         if not self._validate_month_tab_exists(year, month):
             return
         
+        # The worker loads the template once and shares it between validation and filling
+        excel_template = TemplateSession(self.excel_path_var.get(), self.excel_processor)
+        
         # Update UI
         self.process_button.config(state="disabled")
         self.download_button.config(state="disabled")
@@ -393,11 +465,11 @@ class CFDIApplication:
         # Start processing in a separate thread to avoid blocking the GUI
         processing_thread = threading.Thread(
             target=self._process_files_worker,
-            args=(year, month)
+            args=(year, month, excel_template)
         )
         processing_thread.daemon = True
         processing_thread.start()
-        
+    
     def run(self):
         """Start the application."""
         self.root.mainloop()
@@ -3,7 +3,9 @@
 CFDI Control Application - Main Entry Point
 
 This module serves as the main entry point for the CFDI Control Application.
-It initializes the GUI application and handles any startup errors.
+It initializes the GUI application and handles any startup errors. When
+arguments are given (e.g. "python -m src.main process ..."), it runs the
+command-line mode in cli.py instead, without importing the GUI.
 
 Author: CFDI Control Team
 Version: 1.0.0
@@ -12,6 +14,7 @@ Version: 1.0.0
 import sys
 import os
 import logging
+import multiprocessing
 from pathlib import Path
 
 # Configure logging for the application
@@ -117,4 +120,10 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
+    # Required for the parser's worker processes in the PyInstaller build
+    multiprocessing.freeze_support()
+    # Command-line mode: batch servers and cron jobs have no display, so tkinter is never imported
+    if len(sys.argv) > 1:
+        from cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
     main() 
\ No newline at end of file
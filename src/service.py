@@ -0,0 +1,318 @@
+"""
+Local processing service for CFDI Control
+
+A long-running HTTP server on the local machine that keeps the parser
+(and its worker pool), the compiled mapping plan and prepared templates
+warm, so repeated jobs skip Python startup, imports and template loading.
+
+Every request must carry the per-install token (created on first start
+in token_path from SERVICE_CONFIG) in the X-CFDI-Token header and a
+Host header naming the local machine; jobs must be sent as
+application/json. Web pages open in a browser can therefore not submit
+jobs, not even through DNS rebinding.
+
+Endpoints:
+    POST /jobs    Run a job and answer with its JSON summary. Body:
+                  {"template": "plantilla.xlsx", "xml_dirs": ["xml/"], "xml_files": [],
+                   "year": 2025, "month": 1, "output_dir": null, "output_mode": null}
+                  ("month": null fills every month tab of the year)
+    GET  /status  Uptime, jobs run and cache statistics
+
+Example:
+    python -m src.main serve --port 8765 --workers 4
+    curl -H "X-CFDI-Token: $(cat cfdi_control_service.token)" -H "Content-Type: application/json" \
+         -d '{"template": "plantilla.xlsx", "xml_dirs": ["xml/"], "year": 2025, "month": 1}' \
+         http://127.0.0.1:8765/jobs
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+import hmac
+import json
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+
+# Add src to Python path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).parent))
+
+from config.settings import SERVICE_CONFIG
+from core.batch_runner import BatchRunner
+from core.template_cache import TemplateCache
+from core.xml_sources import DirectorySource
+
+OUTPUT_MODES = ('workbook', 'patch', 'auto')
+
+# Header carrying the per-install token
+TOKEN_HEADER = 'X-CFDI-Token'
+
+# Host names a local client may use; anything else is a DNS-rebinding page or a remote client
+LOCAL_HOSTS = ('127.0.0.1', 'localhost', '[::1]')
+
+
+class JobRequestError(ValueError):
+    """The job description is invalid."""
+
+
+def parse_job(payload: Any) -> Dict[str, Any]:
+    """
+    Validate a job description and turn it into BatchRunner.run() arguments.
+    
+    Args:
+        payload: Decoded JSON body of a POST /jobs request
+    
+    Returns:
+        Keyword arguments for BatchRunner.run()
+    
+    Raises:
+        JobRequestError: If a field is missing or invalid (message in Spanish, for the client)
+    """
+    if not isinstance(payload, dict):
+        raise JobRequestError("El trabajo debe ser un objeto JSON")
+    
+    template = payload.get('template')
+    if not isinstance(template, str) or not template:
+        raise JobRequestError("Falta 'template'")
+    
+    xml_dirs = payload.get('xml_dirs') or []
+    xml_files = payload.get('xml_files') or []
+    if not isinstance(xml_dirs, list) or not isinstance(xml_files, list) or \
+            not all(isinstance(item, str) for item in xml_dirs + xml_files):
+        raise JobRequestError("'xml_dirs' y 'xml_files' deben ser listas de rutas")
+    if not xml_dirs and not xml_files:
+        raise JobRequestError("Indique 'xml_dirs' o 'xml_files'")
+    
+    year = payload.get('year')
+    if not isinstance(year, int) or isinstance(year, bool):
+        raise JobRequestError("'year' debe ser un número")
+    month = payload.get('month')
+    if month is not None and (not isinstance(month, int) or isinstance(month, bool) or not 1 <= month <= 12):
+        raise JobRequestError("'month' debe estar entre 1 y 12 (o null para todo el año)")
+    
+    output_mode = payload.get('output_mode') or SERVICE_CONFIG.get('output_mode')
+    if output_mode not in OUTPUT_MODES:
+        raise JobRequestError(f"'output_mode' debe ser uno de: {', '.join(OUTPUT_MODES)}")
+    
+    return {
+        'template_path': template,
+        'xml_sources': [DirectorySource(folder) for folder in xml_dirs] + list(xml_files),
+        'year': year,
+        'month': month,
+        'output_dir': payload.get('output_dir'),
+        'output_mode': output_mode
+    }
+
+
+def load_service_token(token_path: str = None) -> str:
+    """
+    Read the per-install service token, creating it on first use.
+    
+    Args:
+        token_path: File holding the token (default: token_path from SERVICE_CONFIG)
+    
+    Returns:
+        The token
+    """
+    token_path = token_path or SERVICE_CONFIG.get('token_path', 'cfdi_control_service.token')
+    try:
+        with open(token_path, 'r', encoding='utf-8') as token_file:
+            token = token_file.read().strip()
+        if token:
+            return token
+    except FileNotFoundError:
+        pass
+    
+    token = secrets.token_urlsafe(32)
+    # Readable by the owner only
+    descriptor = os.open(token_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, 'w', encoding='utf-8') as token_file:
+        token_file.write(token + '\n')
+    return token
+
+
+class ProcessingService:
+    """
+    HTTP front end for a warm BatchRunner.
+    
+    Requests are served by threads, but jobs run one at a time on the
+    shared runner (its parser and cached patchers hold per-run state);
+    a job submitted while another is running waits for it.
+    """
+    
+    def __init__(self, host: str = None, port: int = None, workers: int = None, use_cache: bool = None,
+                 token: str = None):
+        """
+        Initialize the service and bind its socket.
+        
+        Args:
+            host: Address to listen on (default: host from SERVICE_CONFIG)
+            port: Port to listen on, 0 for any free port (default: port from SERVICE_CONFIG)
+            workers: Parallel parse workers (default: parse_workers from config)
+            use_cache: Use the on-disk parse cache (default: enabled from CACHE_CONFIG)
+            token: Token clients must send (default: per-install token, see load_service_token())
+        """
+        self.logger = logging.getLogger(__name__)
+        self.token = token or load_service_token()
+        self.template_cache = TemplateCache()
+        self.runner = BatchRunner(workers=workers, use_cache=use_cache,
+                                  template_cache=self.template_cache, keep_workers=True)
+        self.jobs_run = 0
+        self.started = time.time()
+        self._job_lock = threading.Lock()
+        
+        if host is None:
+            host = SERVICE_CONFIG.get('host', '127.0.0.1')
+        if port is None:
+            port = SERVICE_CONFIG.get('port', 8765)
+        self.server = ThreadingHTTPServer((host, port), _ServiceRequestHandler)
+        self.server.daemon_threads = True
+        self.server.service = self
+    
+    @property
+    def address(self) -> Tuple[str, int]:
+        """Host and port the service listens on."""
+        return self.server.server_address[:2]
+    
+    def run_job(self, payload: Any) -> Dict[str, Any]:
+        """
+        Run one job on the warm runner.
+        
+        Args:
+            payload: Decoded job description
+        
+        Returns:
+            Summary as returned by BatchRunner.run()
+        
+        Raises:
+            JobRequestError: If the job description is invalid
+        """
+        job = parse_job(payload)
+        with self._job_lock:
+            summary = self.runner.run(**job)
+            self.jobs_run += 1
+        self.logger.info(f"Job {self.jobs_run} finished in {summary['elapsed_seconds']}s "
+                         f"(success: {summary['success']})")
+        return summary
+    
+    def status(self) -> Dict[str, Any]:
+        """Get the uptime, jobs run and cache statistics."""
+        status = {
+            'uptime_seconds': round(time.time() - self.started, 3),
+            'jobs_run': self.jobs_run,
+            'busy': self._job_lock.locked(),
+            'template_cache': self.template_cache.get_stats()
+        }
+        if self.runner.cache is not None:
+            status['parse_cache'] = self.runner.cache.get_stats()
+        return status
+    
+    def serve_forever(self):
+        """Serve requests until shutdown() is called (or the process is interrupted)."""
+        host, port = self.address
+        self.logger.info(f"Processing service listening on http://{host}:{port}")
+        self.server.serve_forever()
+    
+    def shutdown(self):
+        """Stop serving (from another thread) and release the runner."""
+        self.server.shutdown()
+        self.close()
+    
+    def close(self):
+        """Close the socket, the parse workers and the parse cache."""
+        self.server.server_close()
+        self.runner.close()
+    
+    def check_request(self, headers, method: str) -> Optional[Tuple[int, str]]:
+        """
+        Check that a request comes from an authorized local client.
+        
+        Args:
+            headers: Request headers
+            method: HTTP method
+        
+        Returns:
+            (status, message) to reject the request with, or None if it is accepted
+        """
+        bound_host, port = self.address
+        allowed_hosts = set(LOCAL_HOSTS)
+        if bound_host not in ('0.0.0.0', '::'):
+            allowed_hosts.add(f"[{bound_host}]" if ':' in bound_host else bound_host)
+        host = (headers.get('Host') or '').strip().lower()
+        if host not in {f"{name}:{port}" for name in allowed_hosts}:
+            return 403, "Host no permitido"
+        
+        if method == 'POST':
+            content_type = (headers.get('Content-Type') or '').split(';')[0].strip().lower()
+            if content_type != 'application/json':
+                return 415, "El trabajo debe enviarse como application/json"
+        
+        token = headers.get(TOKEN_HEADER) or ''
+        if not hmac.compare_digest(token.encode('utf-8'), self.token.encode('utf-8')):
+            return 401, f"Falta el encabezado {TOKEN_HEADER} o no es válido"
+        return None
+
+
+class _ServiceRequestHandler(BaseHTTPRequestHandler):
+    """Request handler of ProcessingService (the service is server.service)."""
+    
+    def do_GET(self):
+        if self._rejected('GET'):
+            return
+        if self.path.rstrip('/') == '/status':
+            self._send_json(200, self.server.service.status())
+        else:
+            self._send_json(404, {'error_message': "Ruta no encontrada"})
+    
+    def do_POST(self):
+        if self._rejected('POST'):
+            return
+        if self.path.rstrip('/') != '/jobs':
+            self._send_json(404, {'error_message': "Ruta no encontrada"})
+            return
+        
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > SERVICE_CONFIG.get('max_request_bytes', 1048576):
+            self._send_json(413, {'error_message': "Trabajo demasiado grande"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(length) or b'null')
+            summary = self.server.service.run_job(payload)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            self._send_json(400, {'error_message': "El cuerpo no es JSON válido"})
+            return
+        except JobRequestError as e:
+            self._send_json(400, {'error_message': str(e)})
+            return
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Job failed: {e}")
+            self._send_json(500, {'error_message': f"Error inesperado: {str(e)}"})
+            return
+        # The job ran: 200 if the workbook was written, 422 if it could not be
+        self._send_json(200 if summary['success'] else 422, summary)
+    
+    def _rejected(self, method: str) -> bool:
+        """Answer requests that fail ProcessingService.check_request(); True if rejected."""
+        rejection = self.server.service.check_request(self.headers, method)
+        if rejection is None:
+            return False
+        status, message = rejection
+        logging.getLogger(__name__).warning(f"Rejected {method} {self.path} from {self.address_string()}: {message}")
+        self._send_json(status, {'error_message': message})
+        return True
+    
+    def _send_json(self, status: int, body: Dict[str, Any]):
+        """Send a JSON response."""
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, format: str, *args):
+        """Send access logs to the logging module instead of stderr."""
+        logging.getLogger(__name__).debug(f"{self.address_string()} - {format % args}")
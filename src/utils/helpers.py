@@ -0,0 +1,53 @@
+"""
+Helpers for converting CFDI attribute values
+"""
+
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+
+# Format of the CFDI Fecha attribute (local time, no offset)
+CFDI_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def parse_money(value: str) -> Optional[Decimal]:
+    """
+    Convert a CFDI amount (SubTotal, Total, ...) into an exact Decimal.
+    
+    Args:
+        value: Attribute value such as "1160.00"
+    
+    Returns:
+        Decimal value, or None if the value is empty or not a finite number
+    """
+    if not value:
+        return None
+    try:
+        amount = Decimal(value.strip())
+    except (InvalidOperation, ValueError):
+        return None
+    return amount if amount.is_finite() else None
+
+
+def parse_cfdi_datetime(value: str) -> Optional[datetime]:
+    """
+    Convert a CFDI Fecha attribute into a datetime.
+    
+    Args:
+        value: Attribute value such as "2024-01-15T10:30:00"
+    
+    Returns:
+        Naive datetime, or None if the value is empty or not a valid date
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return datetime.strptime(value, CFDI_DATETIME_FORMAT)
+    except ValueError:
+        pass
+    try:
+        # Lenient path for dates without seconds, with fractions or an offset
+        return datetime.fromisoformat(value).replace(tzinfo=None)
+    except ValueError:
+        return None
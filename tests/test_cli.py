@@ -0,0 +1,183 @@
+"""
+Unit tests for the command-line entry point
+"""
+
+import unittest
+import tempfile
+import os
+import io
+import json
+import subprocess
+from contextlib import redirect_stdout, redirect_stderr
+from pathlib import Path
+import sys
+from openpyxl import Workbook, load_workbook
+
+# Add src to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import cli
+from core.job_queue import JobQueue
+from config.settings import CFDI_MAPPING
+
+SRC_DIR = Path(__file__).parent.parent / "src"
+
+
+class TestCLI(unittest.TestCase):
+    """Test cases for the process command."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.xml_dir = os.path.join(self.temp_dir, "xml")
+        os.makedirs(self.xml_dir)
+        
+        sample_xml = '''<?xml version="1.0" encoding="UTF-8"?>
+<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" Fecha="2025-01-15T10:30:00" FormaPago="01"
+                   SubTotal="1000.00" Moneda="MXN" Total="1160.00" TipoDeComprobante="I" MetodoPago="PUE">
+    <cfdi:Emisor Rfc="AAA010101AAA" Nombre="EMPRESA EJEMPLO S.A. DE C.V." RegimenFiscal="601"/>
+    <cfdi:Receptor Rfc="XEXX010101000" RegimenFiscalReceptor="601" UsoCFDI="G01"/>
+</cfdi:Comprobante>'''
+        for i, fecha in enumerate(['2025-01-15', '2025-01-20', '2025-02-03']):
+            with open(os.path.join(self.xml_dir, f"cfdi_{i}.xml"), 'w', encoding='utf-8') as f:
+                f.write(sample_xml.replace('2025-01-15', fecha))
+        with open(os.path.join(self.xml_dir, "roto.xml"), 'w', encoding='utf-8') as f:
+            f.write("Invalid XML content")
+        
+        self.template_path = os.path.join(self.temp_dir, "plantilla.xlsx")
+        wb = Workbook()
+        wb.active.title = "Ene2025"
+        wb.create_sheet("Feb2025")
+        for ws in wb.worksheets:
+            for xml_path, column in CFDI_MAPPING.items():
+                ws[f"{column}3"] = xml_path
+        wb.save(self.template_path)
+    
+    def tearDown(self):
+        """Clean up test fixtures."""
+        import shutil
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+    
+    def run_cli(self, *argv):
+        """Run the command line in-process and return (exit code, stdout)."""
+        stdout = io.StringIO()
+        with redirect_stdout(stdout), redirect_stderr(io.StringIO()):
+            code = cli.main(list(argv))
+        return code, stdout.getvalue()
+    
+    def test_process_month(self):
+        """Test that a month fill prints a JSON summary and exits with 0."""
+        code, output = self.run_cli("process", "--template", self.template_path, "--xml-dir", self.xml_dir,
+                                    "--year", "2025", "--month", "1", "--workers", "1", "--no-cache",
+                                    "--output-dir", self.temp_dir)
+        
+        self.assertEqual(code, cli.EXIT_OK)
+        summary = json.loads(output)
+        self.assertTrue(summary['success'])
+        self.assertEqual(summary['records_processed'], 3)
+        self.assertEqual(summary['failed_files'], 1)
+        self.assertEqual(summary['total_amount'], "3480.00")
+        self.assertIn('elapsed_seconds', summary)
+        self.assertEqual(load_workbook(summary['output_path'])["Ene2025"]["J6"].value, "AAA010101AAA")
+    
+    def test_process_all_months(self):
+        """Test the whole-year mode from individual files."""
+        files = [os.path.join(self.xml_dir, f"cfdi_{i}.xml") for i in range(3)]
+        code, output = self.run_cli("process", "--template", self.template_path, "--xml", *files,
+                                    "--year", "2025", "--all-months", "--no-cache")
+        
+        self.assertEqual(code, cli.EXIT_OK)
+        summary = json.loads(output)
+        self.assertEqual(summary['months'], {"1": 2, "2": 1})
+        self.assertEqual(summary['sheets'], ["Ene2025", "Feb2025"])
+    
+    def test_process_failure_and_usage_errors(self):
+        """Test the exit codes of a failed run and of invalid arguments."""
+        code, output = self.run_cli("process", "--template", self.template_path, "--xml-dir", self.xml_dir,
+                                    "--year", "2025", "--month", "3", "--no-cache")
+        self.assertEqual(code, cli.EXIT_FAILED)
+        self.assertFalse(json.loads(output)['success'])
+        
+        self.assertEqual(self.run_cli("process", "--template", self.template_path, "--year", "2025",
+                                      "--month", "1")[0], cli.EXIT_USAGE)
+        self.assertEqual(self.run_cli("process", "--template", self.template_path, "--xml-dir", self.xml_dir,
+                                      "--year", "2025")[0], cli.EXIT_USAGE)
+        self.assertEqual(self.run_cli("process", "--template", self.template_path, "--xml-dir", self.xml_dir,
+                                      "--year", "2025", "--month", "1", "--workers", "0")[0], cli.EXIT_USAGE)
+    
+    def test_queue_add_and_status(self):
+        """Test queueing a job and reading the queue state."""
+        queue_db = os.path.join(self.temp_dir, "jobs.sqlite3")
+        code, output = self.run_cli("queue", "--queue-db", queue_db, "add", "--template", self.template_path,
+                                    "--xml-dir", self.xml_dir, "--year", "2025", "--all-months")
+        self.assertEqual(code, cli.EXIT_OK)
+        job_id = json.loads(output)['id']
+        
+        code, output = self.run_cli("queue", "--queue-db", queue_db, "status")
+        self.assertEqual(code, cli.EXIT_OK)
+        status = json.loads(output)
+        self.assertEqual(status['counts']['pending'], 1)
+        self.assertEqual(status['jobs'][0]['id'], job_id)
+        self.assertIsNone(status['jobs'][0]['month'])
+        
+        self.assertEqual(self.run_cli("queue", "--queue-db", queue_db, "add", "--template", self.template_path,
+                                      "--year", "2025", "--month", "1")[0], cli.EXIT_USAGE)
+    
+    def test_queue_work_exit_code(self):
+        """Test that queue work only fails for jobs that failed in that run."""
+        queue_db = os.path.join(self.temp_dir, "jobs.sqlite3")
+        job_queue = JobQueue(queue_db)
+        try:
+            failed_id = job_queue.submit(os.path.join(self.temp_dir, "no_existe.xlsx"), 2025, 1,
+                                         xml_dirs=[self.xml_dir], max_attempts=1)
+        finally:
+            job_queue.close()
+        code, output = self.run_cli("queue", "--queue-db", queue_db, "work", "--workers", "1", "--no-cache")
+        self.assertEqual(code, cli.EXIT_FAILED)
+        self.assertEqual(json.loads(output)['failed'], [failed_id])
+        
+        self.run_cli("queue", "--queue-db", queue_db, "add", "--template", self.template_path,
+                     "--xml-dir", self.xml_dir, "--year", "2025", "--month", "1", "--output-dir", self.temp_dir)
+        code, output = self.run_cli("queue", "--queue-db", queue_db, "work", "--workers", "1", "--no-cache")
+        self.assertEqual(code, cli.EXIT_OK)
+        summary = json.loads(output)
+        self.assertEqual(summary['failed'], [])
+        self.assertEqual(summary['counts']['failed'], 1)
+    
+    def test_ledger_store_and_query(self):
+        """Test storing a run in the ledger, querying it and filling from it."""
+        ledger_db = os.path.join(self.temp_dir, "ledger.sqlite3")
+        code, _ = self.run_cli("process", "--template", self.template_path, "--xml-dir", self.xml_dir,
+                               "--year", "2025", "--month", "1", "--no-cache", "--ledger", "--ledger-db", ledger_db,
+                               "--output-dir", self.temp_dir)
+        self.assertEqual(code, cli.EXIT_OK)
+        
+        code, output = self.run_cli("ledger", "--ledger-db", ledger_db, "--emisor", "AAA010101AAA",
+                                    "--desde", "2025-01-01", "--hasta", "2025-01-31")
+        self.assertEqual(code, cli.EXIT_OK)
+        self.assertEqual(json.loads(output)['count'], 2)
+        self.assertEqual(self.run_cli("ledger", "--desde", "31/01/2025")[0], cli.EXIT_USAGE)
+        
+        code, output = self.run_cli("process", "--template", self.template_path, "--from-ledger",
+                                    "--ledger-db", ledger_db, "--year", "2025", "--all-months",
+                                    "--output-dir", self.temp_dir)
+        self.assertEqual(code, cli.EXIT_OK)
+        self.assertEqual(json.loads(output)['months'], {"1": 2, "2": 1})
+    
+    def test_main_runs_without_gui(self):
+        """Test that main.py with arguments runs the command line without importing tkinter."""
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", str(SRC_DIR / "main.py"), "process",
+             "--template", self.template_path, "--xml-dir", self.xml_dir,
+             "--year", "2025", "--month", "1", "--no-cache"],
+            cwd=self.temp_dir, capture_output=True, text=True, timeout=60
+        )
+        
+        self.assertEqual(completed.returncode, 0, completed.stderr)
+        self.assertTrue(json.loads(completed.stdout)['success'])
+        self.assertNotIn("tkinter", completed.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,11 +7,13 @@ import tempfile
 import os
 from pathlib import Path
 import sys
+from datetime import datetime
+from decimal import Decimal
 
 # Add src to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
-from core.data_models import CFDIDataProcessor, ProcessingResult, CFDIData
+from core.data_models import CFDIDataProcessor, ProcessingResult, CFDIData, CFDIBatch, CFDI_COLUMNS, group_by_month
 
 
 class TestCFDIDataProcessor(unittest.TestCase):
@@ -92,6 +94,21 @@ class TestCFDIDataProcessor(unittest.TestCase):
         self.assertEqual(result.failed_files, 0)
         self.assertEqual(len(result.processed_data), 0)
     
+    def test_process_raw_data_exact_totals_and_date_range(self):
+        """Test that totals are summed exactly and dates are compared as datetimes."""
+        raw_data_list = []
+        for fecha, total in [('2024-01-15T10:30:00', '0.10'), ('2024-01-02T08:00:00', '0.20'),
+                             ('2024-01-31T23:59:59', '0.30')]:
+            data = self.sample_raw_data.copy()
+            data['B'] = fecha
+            data['G'] = total
+            raw_data_list.append(data)
+        
+        result = self.processor.process_raw_data(raw_data_list)
+        
+        self.assertEqual(result.total_amount, Decimal('0.60'))
+        self.assertEqual(result.date_range, {'start': '2024-01-02T08:00:00', 'end': '2024-01-31T23:59:59'})
+    
     def test_process_raw_data_with_missing_required_fields(self):
         """Test processing with missing required fields."""
         incomplete_data = {
@@ -144,6 +161,17 @@ class TestCFDIData(unittest.TestCase):
         self.assertEqual(cfdi_data.receptor_rfc, 'XEXX010101000')
         self.assertEqual(cfdi_data.file_name, 'test.xml')
     
+    def test_typed_values(self):
+        """Test that amounts and the date are parsed once when the record is created."""
+        cfdi_data = CFDIData.from_dict(self.sample_data)
+        
+        self.assertEqual(cfdi_data.fecha_value, datetime(2024, 1, 15, 10, 30))
+        self.assertEqual(cfdi_data.subtotal_value, Decimal('1000.00'))
+        self.assertEqual(cfdi_data.total_value, Decimal('1160.00'))
+        self.assertEqual(cfdi_data.total_impuestos_value, Decimal('160.00'))
+        self.assertEqual(cfdi_data.money_values()['E'], Decimal('0.00'))
+        self.assertIsNone(CFDIData(total='not-a-number').total_value)
+    
     def test_to_excel_row(self):
         """Test conversion to Excel row format."""
         cfdi_data = CFDIData.from_dict(self.sample_data)
@@ -262,5 +290,94 @@ class TestProcessingResult(unittest.TestCase):
         self.assertIn("Error 1", summary)  # Error message
 
 
+
+class TestCFDIBatch(unittest.TestCase):
+    """Test cases for the CFDIBatch columnar container."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.processor = CFDIDataProcessor()
+        self.sample_raw_data = {
+            'B': '2024-01-15T10:30:00', 'C': '01', 'D': '1000.00', 'E': '0.00', 'F': 'MXN', 'G': '1160.00',
+            'H': 'I', 'I': 'PUE', 'J': 'AAA010101AAA', 'K': 'EMPRESA EJEMPLO S.A. DE C.V.', 'L': '601',
+            'M': 'XEXX010101000', 'N': '', 'O': '601', 'P': '160.00',
+            'file_path': '/test/path.xml', 'file_name': 'test.xml'
+        }
+    
+    def test_append_values_in_source_order(self):
+        """Test that values are placed by the source column order."""
+        batch = CFDIBatch(source_columns=('G', 'B', 'J'))
+        batch.append_values(('1160.00', '2024-01-15T10:30:00', 'AAA010101AAA'), '/test/path.xml', 'test.xml')
+        
+        self.assertEqual(len(batch), 1)
+        self.assertEqual(batch.column('G'), ['1160.00'])
+        self.assertEqual(batch.column('M'), [''])
+        self.assertEqual(batch.amounts('G'), [Decimal('1160.00')])
+        self.assertEqual(batch[0].fecha, '2024-01-15T10:30:00')
+        self.assertEqual(batch[0].file_name, 'test.xml')
+    
+    def test_rows_match_cfdi_data(self):
+        """Test that batch rows match the CFDIData built from the same record."""
+        batch = CFDIBatch()
+        batch.append_dict(self.sample_raw_data)
+        cfdi_data = CFDIData.from_dict(self.sample_raw_data)
+        
+        self.assertEqual(list(batch.iter_rows()), [cfdi_data.excel_values()])
+        self.assertEqual(list(batch.iter_money_rows()), [cfdi_data.money_row()])
+        self.assertEqual(batch[0], cfdi_data)
+        self.assertEqual(len(cfdi_data.excel_values()), len(CFDI_COLUMNS))
+    
+    def test_cfdi_data_is_slotted(self):
+        """Test that records do not carry a per-instance __dict__."""
+        self.assertFalse(hasattr(CFDIData(), '__dict__'))
+    
+    def test_process_batch_matches_list(self):
+        """Test that processing a batch gives the same result as processing dictionaries."""
+        raw_data_list = []
+        for i in range(3):
+            data = self.sample_raw_data.copy()
+            data['B'] = f'2024-01-{20 - i:02d}T10:30:00'
+            data['file_name'] = f'test_{i}.xml'
+            raw_data_list.append(data)
+        raw_data_list[1]['G'] = 'not-a-number'
+        batch = CFDIBatch()
+        for data in raw_data_list:
+            batch.append_dict(data)
+        
+        list_result = self.processor.process_raw_data(raw_data_list)
+        batch_result = self.processor.process_raw_data(batch)
+        
+        self.assertIsInstance(batch_result.processed_data, CFDIBatch)
+        self.assertEqual(list(batch_result.processed_data), list_result.processed_data)
+        self.assertEqual(batch_result.errors, list_result.errors)
+        self.assertEqual(batch_result.total_amount, list_result.total_amount)
+        self.assertEqual(batch_result.date_range, list_result.date_range)
+        self.assertEqual(batch_result.currency, 'MXN')
+    
+    def test_group_by_month(self):
+        """Test that records are split by the month of Fecha keeping their order."""
+        raw_data_list = []
+        for i, fecha in enumerate(['2024-03-02T10:00:00', '2024-01-15T10:30:00', 'no-es-fecha',
+                                   '2024-03-01T09:00:00', '2023-12-31T23:59:59']):
+            data = self.sample_raw_data.copy()
+            data['B'] = fecha
+            data['file_name'] = f'test_{i}.xml'
+            raw_data_list.append(data)
+        batch = CFDIBatch()
+        for data in raw_data_list:
+            batch.append_dict(data)
+        records = [CFDIData.from_dict(data) for data in raw_data_list]
+        
+        groups = group_by_month(batch)
+        
+        self.assertEqual(list(groups), [(2024, 3), (2024, 1), None, (2023, 12)])
+        self.assertIsInstance(groups[(2024, 3)], CFDIBatch)
+        self.assertEqual(groups[(2024, 3)].file_names, ['test_0.xml', 'test_3.xml'])
+        self.assertEqual(groups[(2024, 3)].fecha_values[1], datetime(2024, 3, 1, 9, 0))
+        self.assertEqual(groups[None].file_names, ['test_2.xml'])
+        self.assertEqual({key: list(group) for key, group in groups.items()},
+                         group_by_month(records))
+
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
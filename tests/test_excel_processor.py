@@ -7,15 +7,17 @@ import tempfile
 import os
 from pathlib import Path
 import sys
-from openpyxl import Workbook
+from datetime import datetime
+from decimal import Decimal
+from openpyxl import Workbook, load_workbook
 from openpyxl.utils import get_column_letter
 
 # Add src to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
-from core.excel_processor import ExcelProcessor
-from core.data_models import CFDIData
-from config.settings import CFDI_MAPPING, EXCEL_CONFIG
+from core.excel_processor import ExcelProcessor, MonthTabWriter, YearTabWriter, TemplateSession
+from core.data_models import CFDIData, CFDIBatch
+from config.settings import CFDI_MAPPING, EXCEL_CONFIG, PROCESSING_CONFIG
 
 
 class TestExcelProcessor(unittest.TestCase):
@@ -146,6 +148,28 @@ class TestExcelProcessor(unittest.TestCase):
         self.assertIsNone(worksheet["A4"].value)
         self.assertIsNone(worksheet["B4"].value)
     
+    def test_clear_month_data_touches_only_existing_cells(self):
+        """Test that clearing keeps headers and styles and does not create empty cells."""
+        template_path = os.path.join(self.temp_dir, "test_template.xlsx")
+        self.create_test_excel_template(template_path)
+        workbook = self.processor.load_template(template_path)
+        worksheet = workbook["Ene2025"]
+        
+        worksheet["B4"] = "Old Data"
+        worksheet["G5"] = "1160.00"
+        worksheet["G5"].number_format = '#,##0.00'
+        worksheet.cell(row=5000, column=200).number_format = '0.00'  # Stray formatting far down the sheet
+        header_value = worksheet["B3"].value
+        
+        self.processor.clear_month_data(worksheet)
+        
+        self.assertEqual(worksheet["B3"].value, header_value)
+        self.assertIsNone(worksheet["G5"].value)
+        self.assertEqual(worksheet["G5"].number_format, '#,##0.00')
+        self.assertEqual(worksheet.cell(row=5000, column=200).number_format, '0.00')
+        self.assertNotIn((4, 2), worksheet._cells)
+        self.assertLess(len(worksheet._cells), 100)
+    
     def test_fill_month_tab(self):
         """Test filling month tab with CFDI data."""
         template_path = os.path.join(self.temp_dir, "test_template.xlsx")
@@ -159,16 +183,112 @@ class TestExcelProcessor(unittest.TestCase):
         self.assertTrue(success)
         
         # Verify data was filled correctly
-        self.assertEqual(worksheet["B4"].value, "2025-01-15T10:30:00")  # Date
-        self.assertEqual(worksheet["G4"].value, "1160.00")  # Total
+        self.assertEqual(worksheet["B4"].value, datetime(2025, 1, 15, 10, 30))  # Date
+        self.assertEqual(worksheet["G4"].value, Decimal("1160.00"))  # Total
         self.assertEqual(worksheet["J4"].value, "AAA010101AAA")  # Emisor RFC
     
+    def test_fill_month_tab_typed_values(self):
+        """Test that amounts and dates use shared named styles and unparsable values stay as text."""
+        template_path = os.path.join(self.temp_dir, "test_template.xlsx")
+        self.create_test_excel_template(template_path)
+        workbook = self.processor.load_template(template_path)
+        worksheet = workbook["Ene2025"]
+        broken = CFDIData.from_dict(dict(self.sample_cfdi_data.to_excel_row(), B="sin fecha", E="", G="N/A"))
+        
+        self.processor.fill_month_tab(worksheet, [self.sample_cfdi_data, broken], 1)
+        
+        self.assertEqual(worksheet["G4"].style, "cfdi_amount")
+        self.assertEqual(worksheet["G4"].number_format, EXCEL_CONFIG['amount_format'])
+        self.assertEqual(worksheet["B4"].style, "cfdi_fecha")
+        self.assertEqual(worksheet["B5"].value, "sin fecha")
+        self.assertEqual(worksheet["G5"].value, "N/A")
+        self.assertEqual(worksheet["G5"].style, "Normal")
+        self.assertNotIn((5, 5), worksheet._cells)  # Empty Descuento
+        
+        output_path = os.path.join(self.temp_dir, "typed.xlsx")
+        self.assertTrue(self.processor.save_workbook(workbook, output_path))
+        reloaded = load_workbook(output_path)["Ene2025"]
+        self.assertEqual(reloaded["G4"].value, 1160)
+        self.assertEqual(reloaded["B4"].value, datetime(2025, 1, 15, 10, 30))
+    
+    def test_fill_keeps_template_cell_formatting(self):
+        """Test that typed cells keep the template row's font, fill and border and only get a number format."""
+        from openpyxl.styles import Border, Font, Side
+        template_path = os.path.join(self.temp_dir, "test_template.xlsx")
+        self.create_test_excel_template(template_path)
+        workbook = self.processor.load_template(template_path)
+        worksheet = workbook["Ene2025"]
+        for column in ("B", "C", "D", "G"):
+            worksheet[f"{column}4"].font = Font(name="Arial", bold=True)
+            worksheet[f"{column}4"].border = Border(left=Side(style="thin"))
+        
+        self.processor.fill_month_tab(worksheet, [self.sample_cfdi_data], 1)
+        output_path = os.path.join(self.temp_dir, "formato.xlsx")
+        self.assertTrue(self.processor.save_workbook(workbook, output_path))
+        
+        reloaded = load_workbook(output_path)["Ene2025"]
+        for column in ("B", "C", "D", "G"):
+            cell = reloaded[f"{column}4"]
+            self.assertEqual((cell.font.name, cell.font.bold, cell.border.left.style), ("Arial", True, "thin"),
+                             column)
+        self.assertEqual(reloaded["G4"].number_format, EXCEL_CONFIG['amount_format'])
+        self.assertEqual(reloaded["D4"].number_format, EXCEL_CONFIG['amount_format'])
+        self.assertEqual(reloaded["B4"].number_format, EXCEL_CONFIG['date_format'])
+        self.assertEqual(reloaded["G4"].value, 1160)
+    
+    def test_fill_month_tab_from_batch(self):
+        """Test filling month tab from a column-oriented batch."""
+        template_path = os.path.join(self.temp_dir, "test_template.xlsx")
+        self.create_test_excel_template(template_path)
+        workbook = self.processor.load_template(template_path)
+        batch = CFDIBatch()
+        for _ in range(2):
+            batch.append_values(self.sample_cfdi_data.excel_values(), "/test/path.xml", "test.xml")
+        
+        success = self.processor.fill_month_tab(workbook["Ene2025"], batch, 1)
+        
+        self.assertTrue(success)
+        worksheet = workbook["Ene2025"]
+        self.assertEqual(worksheet["B5"].value, datetime(2025, 1, 15, 10, 30))
+        self.assertEqual(worksheet["G5"].value, Decimal("1160.00"))
+        self.assertEqual(worksheet["G5"].number_format, '#,##0.00')
+    
+    def test_month_tab_writer_continuation_sheets(self):
+        """Test that records past the row limit continue in sheets with the same headers."""
+        template_path = os.path.join(self.temp_dir, "test_template.xlsx")
+        self.create_test_excel_template(template_path)
+        workbook = self.processor.load_template(template_path)
+        worksheet = workbook["Ene2025"]
+        worksheet["A1"] = "Control"
+        worksheet.column_dimensions["J"].width = 20
+        batch = CFDIBatch()
+        for i in range(5):
+            batch.append_values(self.sample_cfdi_data.excel_values()[:8] + (f"RFC{i}",) +
+                                self.sample_cfdi_data.excel_values()[9:], "/test/path.xml", "test.xml")
+        writer = MonthTabWriter(self.processor, worksheet, max_rows=5)  # Rows 4 and 5: 2 records per sheet
+        
+        writer.write([self.sample_cfdi_data])
+        writer.write(batch)
+        
+        self.assertEqual(writer.sheets, ["Ene2025", "Ene2025 (2)", "Ene2025 (3)"])
+        self.assertEqual(workbook.sheetnames.index("Ene2025 (2)"), workbook.sheetnames.index("Ene2025") + 1)
+        self.assertEqual(worksheet["J5"].value, "RFC0")
+        self.assertIsNone(worksheet["J6"].value)
+        continuation = workbook["Ene2025 (2)"]
+        self.assertEqual(continuation["A1"].value, "Control")
+        self.assertEqual(continuation["B3"].value, worksheet["B3"].value)
+        self.assertEqual(continuation.column_dimensions["J"].width, 20)
+        self.assertEqual([continuation["J4"].value, continuation["J5"].value], ["RFC1", "RFC2"])
+        self.assertEqual(workbook["Ene2025 (3)"]["J5"].value, "RFC4")
+    
     def test_create_output_filename(self):
         """Test output filename creation."""
         filename = self.processor.create_output_filename(2025, 1, "/path/to/template.xlsx")
         
         self.assertIn("template_CFDI_2025_01_", filename)
         self.assertTrue(filename.endswith(".xlsx"))
+        self.assertRegex(self.processor.create_output_filename(2025, None, "template.xlsx"),
+                         r"^template_CFDI_2025_\d{8}_\d{6}\.xlsx$")
     
     def test_save_workbook(self):
         """Test saving workbook."""
@@ -284,6 +404,106 @@ class TestExcelProcessor(unittest.TestCase):
         
         self.assertFalse(result['success'])
         self.assertIn('error_message', result)
+    
+    
+    def test_process_cfdi_year_to_excel(self):
+        """Test filling every month tab of a year from unsorted records in one save."""
+        template_path = os.path.join(self.temp_dir, "test_template.xlsx")
+        self.create_test_excel_template(template_path)
+        workbook = load_workbook(template_path)
+        workbook.remove(workbook["Abr2025"])
+        workbook["Mar2025"]["B4"] = "dato anterior"
+        workbook["Jun2025"]["B4"] = "sin registros"
+        workbook.save(template_path)
+        
+        records = []
+        for fecha in ['2025-03-20T08:00:00', '2025-01-05T10:30:00', '2025-03-02T09:15:00',
+                      '2024-12-31T23:00:00', '2025-04-10T12:00:00', '2025-01-06T11:00:00']:
+            records.append(CFDIData.from_dict(dict(self.sample_cfdi_data.to_excel_row(), B=fecha)))
+        batch = CFDIBatch()
+        for record in records:
+            batch.append_dict(record.to_excel_row())
+        
+        result = self.processor.process_cfdi_year_to_excel(template_path, batch, 2025, output_dir=self.temp_dir)
+        
+        self.assertTrue(result['success'], result['error_message'])
+        self.assertRegex(result['output_path'], r"_CFDI_2025_\d{8}_\d{6}\.xlsx$")
+        self.assertEqual(result['records_processed'], 4)
+        self.assertEqual(result['months'], {1: 2, 3: 2})
+        self.assertEqual(result['missing_months'], [4])
+        self.assertEqual(result['skipped_records'], 2)
+        self.assertEqual(result['sheets'], ["Ene2025", "Mar2025"])
+        output = load_workbook(result['output_path'])
+        self.assertEqual([output["Mar2025"]["B4"].value, output["Mar2025"]["B5"].value],
+                         [datetime(2025, 3, 20, 8, 0), datetime(2025, 3, 2, 9, 15)])
+        self.assertEqual(output["Ene2025"]["B5"].value, datetime(2025, 1, 6, 11, 0))
+        self.assertIsNone(output["Ene2025"]["B6"].value)
+        self.assertEqual(output["Jun2025"]["B4"].value, "sin registros")
+        
+        other_year = self.processor.process_cfdi_year_to_excel(template_path, records[3:4], 2025)
+        self.assertFalse(other_year['success'])
+        self.assertEqual(other_year['skipped_records'], 1)
+    
+    def test_year_tab_writer_across_chunks(self):
+        """Test that a month split across chunks continues after its previous rows."""
+        template_path = os.path.join(self.temp_dir, "test_template.xlsx")
+        self.create_test_excel_template(template_path)
+        workbook = load_workbook(template_path)
+        february = CFDIData.from_dict(dict(self.sample_cfdi_data.to_excel_row(), B='2025-02-01T00:00:00'))
+        
+        writer = YearTabWriter(self.processor, workbook, 2025)
+        written = writer.write([self.sample_cfdi_data, february]) + writer.write([february, self.sample_cfdi_data])
+        
+        self.assertEqual(written, 4)
+        self.assertEqual(writer.months, {1: 2, 2: 2})
+        self.assertEqual([workbook["Feb2025"]["B4"].value, workbook["Feb2025"]["B5"].value],
+                         [datetime(2025, 2, 1), datetime(2025, 2, 1)])
+        self.assertEqual(workbook["Ene2025"]["B5"].value, datetime(2025, 1, 15, 10, 30))
+    
+    def test_resolve_output_mode(self):
+        """Test that "auto" streams only large or unknown-size months."""
+        threshold = PROCESSING_CONFIG['streaming_min_rows']
+        
+        self.assertEqual(self.processor.resolve_output_mode('auto', threshold - 1), 'workbook')
+        self.assertEqual(self.processor.resolve_output_mode('auto', threshold), 'patch')
+        self.assertEqual(self.processor.resolve_output_mode('auto', None), 'patch')
+        self.assertEqual(self.processor.resolve_output_mode('workbook', threshold), 'workbook')
+        with self.assertRaises(ValueError):
+            self.processor.resolve_output_mode('stream')
+    
+    def test_template_session_loads_once(self):
+        """Test that validation, tab lookup and filling share one loaded workbook."""
+        template_path = os.path.join(self.temp_dir, "test_template.xlsx")
+        self.create_test_excel_template(template_path)
+        loads = []
+        
+        class CountingProcessor(ExcelProcessor):
+            def load_template(self, template_path):
+                if not isinstance(template_path, TemplateSession):
+                    loads.append(template_path)
+                return super().load_template(template_path)
+        
+        processor = CountingProcessor()
+        session = TemplateSession(template_path, processor)
+        
+        processor.validate_template_structure(session)
+        self.assertIsNotNone(processor.find_month_tab(processor.load_template(session), 1, 2025))
+        result = processor.process_cfdi_to_excel(session, [self.sample_cfdi_data], 2025, 1,
+                                                 output_dir=self.temp_dir)
+        
+        self.assertTrue(result['success'], result['error_message'])
+        self.assertEqual(loads, [template_path])
+        self.assertTrue(Path(result['output_path']).name.startswith("test_template_CFDI_2025_01_"))
+        self.assertEqual(session.workbook["Ene2025"]["J4"].value, "AAA010101AAA")
+    
+    def test_template_session_missing_template(self):
+        """Test that a session for a missing template reports the load failure."""
+        session = TemplateSession(os.path.join(self.temp_dir, "missing.xlsx"), self.processor)
+        
+        self.assertIsNone(session.workbook)
+        result = self.processor.process_cfdi_to_excel(session, [self.sample_cfdi_data], 2025, 1)
+        self.assertFalse(result['success'])
+        self.assertEqual(result['error_message'], "No se pudo cargar la plantilla Excel")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,140 @@
+"""
+Unit tests for the byte-level CFDI header scanner
+"""
+
+import unittest
+import tempfile
+import os
+import zipfile
+from pathlib import Path
+import sys
+
+# Add src to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.header_scanner import HeaderScanner
+from core.mapping_plan import DEFAULT_PLAN, compile_mapping
+from core.xml_parser import CFDIXMLParser
+from core.xml_sources import FileSource, ZipMemberSource
+
+
+class TestHeaderScanner(unittest.TestCase):
+    """Test cases for HeaderScanner and the fast extraction mode."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.scanner = HeaderScanner(DEFAULT_PLAN)
+        self.temp_dir = tempfile.mkdtemp()
+        
+        conceptos = ''.join(
+            f'<cfdi:Concepto Importe="{i}.00"><cfdi:Impuestos TotalImpuestosTrasladados="999.00"/></cfdi:Concepto>'
+            for i in range(200)
+        )
+        self.sample_xml = f'''<?xml version="1.0" encoding="UTF-8"?>
+<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" xmlns:tfd="http://www.sat.gob.mx/TimbreFiscalDigital"
+                   Fecha="2024-01-15T10:30:00" FormaPago="01" SubTotal="1000.00" Descuento="0.00"
+                   Moneda="MXN" Total="1160.00" TipoDeComprobante="I" MetodoPago="PUE">
+    <cfdi:CfdiRelacionados TipoRelacion="04"><cfdi:CfdiRelacionado UUID="X"/></cfdi:CfdiRelacionados>
+    <cfdi:Emisor Rfc="AAA010101AAA" Nombre="PAN &amp; CAF&#201; S.A.&#10;DE C.V." RegimenFiscal="601"/>
+    <cfdi:Receptor Rfc='XEXX010101000' RegimenFiscalReceptor="601" UsoCFDI="G01"></cfdi:Receptor>
+    <cfdi:Conceptos>{conceptos}</cfdi:Conceptos>
+    <cfdi:Impuestos TotalImpuestosTrasladados="160.00"><cfdi:Traslados/></cfdi:Impuestos>
+    <cfdi:Complemento><tfd:TimbreFiscalDigital UUID="ABC"/></cfdi:Complemento>
+</cfdi:Comprobante>
+'''
+    
+    def tearDown(self):
+        """Clean up test fixtures."""
+        import shutil
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+    
+    def _write(self, content, name="cfdi.xml"):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+    
+    def test_scan_matches_streaming(self):
+        """Test that the scanner extracts exactly what the streaming parser does."""
+        path = self._write(self.sample_xml)
+        
+        fast_result = CFDIXMLParser(extraction_mode='fast').parse_cfdi_file(path)
+        stream_result = CFDIXMLParser(extraction_mode='stream').parse_cfdi_file(path)
+        
+        self.assertEqual(fast_result, stream_result)
+        self.assertEqual(fast_result['K'], "PAN & CAFÉ S.A.\nDE C.V.")
+        self.assertEqual(fast_result['P'], "160.00")
+        self.assertEqual(fast_result['UUID'], "ABC")
+        self.assertIsNotNone(self.scanner.scan(self.sample_xml.encode('utf-8')))
+    
+    def test_scan_stamp_declaring_its_prefix(self):
+        """Test the usual layout where TimbreFiscalDigital declares the tfd prefix itself."""
+        content = self.sample_xml.replace(' xmlns:tfd="http://www.sat.gob.mx/TimbreFiscalDigital"', '').replace(
+            '<tfd:TimbreFiscalDigital UUID="ABC"/>',
+            '<tfd:TimbreFiscalDigital xmlns:tfd="http://www.sat.gob.mx/TimbreFiscalDigital" Version="1.1" '
+            'UUID="5F1C2A3B-0000-4D4E-8F9A-ABCDEF012345"/>')
+        
+        record = self.scanner.scan(content.encode('utf-8'))
+        
+        self.assertEqual(record['UUID'], "5F1C2A3B-0000-4D4E-8F9A-ABCDEF012345")
+    
+    def test_scan_zip_member(self):
+        """Test scanning a member of a ZIP package."""
+        zip_path = os.path.join(self.temp_dir, "paquete.zip")
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("cfdi.xml", self.sample_xml)
+        
+        result = self.scanner.scan_source(ZipMemberSource(zip_path, "cfdi.xml"))
+        
+        self.assertEqual(result['J'], "AAA010101AAA")
+    
+    def test_unusual_documents_fall_back(self):
+        """Test that documents outside the canonical layout are left to the full parser."""
+        unusual = {
+            'other prefix': self.sample_xml.replace('cfdi:', 'c4:').replace('xmlns:cfdi', 'xmlns:c4'),
+            'unknown namespace': self.sample_xml.replace('http://www.sat.gob.mx/cfd/4', 'urn:otro'),
+            'comment': self.sample_xml.replace('<cfdi:Emisor', '<!-- x --><cfdi:Emisor'),
+            'doctype': self.sample_xml.replace('?>\n', '?>\n<!DOCTYPE cfdi:Comprobante>\n', 1),
+            'encoding': self.sample_xml.replace('UTF-8', 'ISO-8859-1'),
+            'missing element': self.sample_xml.replace(
+                '<cfdi:Impuestos TotalImpuestosTrasladados="160.00"><cfdi:Traslados/></cfdi:Impuestos>', ''),
+            'redeclared prefix': self.sample_xml.replace(
+                '<cfdi:Receptor', '<cfdi:Receptor xmlns:cfdi="http://www.sat.gob.mx/cfd/3"'),
+            'unknown entity': self.sample_xml.replace('&amp;', '&nbsp;'),
+            'stamp namespace': self.sample_xml.replace('http://www.sat.gob.mx/TimbreFiscalDigital', 'urn:otro'),
+        }
+        for reason, content in unusual.items():
+            with self.subTest(reason=reason):
+                self.assertIsNone(self.scanner.scan(content.encode('utf-8')))
+    
+    def test_fast_mode_falls_back_to_streaming(self):
+        """Test that the fast mode still parses unusual documents."""
+        path = self._write(self.sample_xml.replace('<cfdi:Emisor', '<!-- x --><cfdi:Emisor'))
+        
+        result = CFDIXMLParser(extraction_mode='fast').parse_cfdi_file(path)
+        
+        self.assertEqual(result['J'], "AAA010101AAA")
+        self.assertEqual(result['P'], "160.00")
+    
+    def test_fast_mode_reports_invalid_xml(self):
+        """Test that malformed files still fail in fast mode."""
+        path = self._write("Invalid XML content")
+        
+        success, error = CFDIXMLParser(extraction_mode='fast').parse_compact(FileSource(path))
+        
+        self.assertFalse(success)
+        self.assertTrue(error.startswith("XML inválido"))
+    
+    def test_deep_mapping_is_not_supported(self):
+        """Test that mappings below the children of the header nodes disable the scanner."""
+        plan = compile_mapping({"cfdi:Comprobante/@Total": "A",
+                                "cfdi:Complemento/pago20:Pagos/pago20:Pago/@Monto": "B"},
+                               {"pago20": "http://www.sat.gob.mx/Pagos20"})
+        
+        self.assertFalse(HeaderScanner(plan).supported)
+        self.assertTrue(HeaderScanner(DEFAULT_PLAN).supported)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+"""
+Unit tests for the value conversion helpers
+"""
+
+import unittest
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+import sys
+
+# Add src to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from utils.helpers import parse_money, parse_cfdi_datetime
+
+
+class TestHelpers(unittest.TestCase):
+    """Test cases for the helpers module."""
+    
+    def test_parse_money(self):
+        """Test exact conversion of CFDI amounts."""
+        self.assertEqual(parse_money("1160.00"), Decimal("1160.00"))
+        self.assertEqual(parse_money(" 0.10 "), Decimal("0.10"))
+        self.assertEqual(parse_money("-5"), Decimal("-5"))
+    
+    def test_parse_money_invalid(self):
+        """Test that empty and invalid amounts give None."""
+        for value in ("", None, "abc", "1,000.00", "NaN", "Infinity"):
+            with self.subTest(value=value):
+                self.assertIsNone(parse_money(value))
+    
+    def test_parse_cfdi_datetime(self):
+        """Test conversion of the CFDI Fecha attribute."""
+        self.assertEqual(parse_cfdi_datetime("2024-01-15T10:30:00"), datetime(2024, 1, 15, 10, 30))
+        self.assertEqual(parse_cfdi_datetime("2024-01-15T10:30"), datetime(2024, 1, 15, 10, 30))
+        self.assertEqual(parse_cfdi_datetime("2024-01-15T10:30:00-06:00"), datetime(2024, 1, 15, 10, 30))
+    
+    def test_parse_cfdi_datetime_invalid(self):
+        """Test that empty and invalid dates give None."""
+        for value in ("", None, "15/01/2024", "2024-13-01T00:00:00"):
+            with self.subTest(value=value):
+                self.assertIsNone(parse_cfdi_datetime(value))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+"""
+Unit tests for the persistent job queue and its worker pool
+"""
+
+import unittest
+import tempfile
+import os
+from pathlib import Path
+import sys
+from openpyxl import Workbook, load_workbook
+
+# Add src to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.job_queue import JobQueue, JobWorkerPool, run_worker
+from config.settings import CFDI_MAPPING
+
+
+class TestJobQueue(unittest.TestCase):
+    """Test cases for JobQueue, run_worker and JobWorkerPool."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, "jobs.sqlite3")
+        self.queue = JobQueue(self.db_path)
+        
+        sample_xml = '''<?xml version="1.0" encoding="UTF-8"?>
+<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" Fecha="2025-01-15T10:30:00" FormaPago="01"
+                   SubTotal="1000.00" Moneda="MXN" Total="1160.00" TipoDeComprobante="I" MetodoPago="PUE">
+    <cfdi:Emisor Rfc="AAA010101AAA" Nombre="EMPRESA EJEMPLO S.A. DE C.V." RegimenFiscal="601"/>
+    <cfdi:Receptor Rfc="XEXX010101000" RegimenFiscalReceptor="601" UsoCFDI="G01"/>
+</cfdi:Comprobante>'''
+        self.xml_dirs = []
+        self.templates = []
+        for company in ("cliente_a", "cliente_b"):
+            xml_dir = os.path.join(self.temp_dir, company)
+            os.makedirs(xml_dir)
+            for i in range(2):
+                with open(os.path.join(xml_dir, f"cfdi_{i}.xml"), 'w', encoding='utf-8') as f:
+                    f.write(sample_xml.replace('2025-01-15', f'2025-01-{10 + i:02d}'))
+            self.xml_dirs.append(xml_dir)
+            
+            template_path = os.path.join(self.temp_dir, f"{company}.xlsx")
+            wb = Workbook()
+            wb.active.title = "Ene2025"
+            for xml_path, column in CFDI_MAPPING.items():
+                wb.active[f"{column}3"] = xml_path
+            wb.save(template_path)
+            self.templates.append(template_path)
+    
+    def tearDown(self):
+        """Clean up test fixtures."""
+        import shutil
+        self.queue.close()
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+    
+    def test_submit_and_claim(self):
+        """Test that jobs are claimed once each, oldest first."""
+        first = self.queue.submit(self.templates[0], 2025, 1, xml_dirs=[self.xml_dirs[0]])
+        second = self.queue.submit(self.templates[1], 2025, None, xml_dirs=[self.xml_dirs[1]])
+        
+        job = self.queue.claim("worker-1")
+        self.assertEqual(job['id'], first)
+        self.assertEqual(job['status'], 'running')
+        self.assertEqual(job['worker'], "worker-1")
+        self.assertEqual(job['attempts'], 1)
+        self.assertEqual(job['xml_dirs'], [os.path.abspath(self.xml_dirs[0])])
+        self.assertEqual(job['month'], 1)
+        
+        job = self.queue.claim("worker-2")
+        self.assertEqual(job['id'], second)
+        self.assertIsNone(job['month'])
+        self.assertIsNone(self.queue.claim("worker-3"))
+        self.assertEqual(self.queue.counts(), {'pending': 0, 'running': 2, 'done': 0, 'failed': 0})
+        
+        with self.assertRaises(ValueError):
+            self.queue.submit(self.templates[0], 2025, 1)
+    
+    def test_failed_attempts_are_retried_then_failed(self):
+        """Test that a failed job goes back to the queue until it runs out of attempts."""
+        job_id = self.queue.submit(self.templates[0], 2025, 1, xml_dirs=[self.xml_dirs[0]], max_attempts=2)
+        
+        self.queue.claim("worker-1")
+        self.queue.complete(job_id, {'success': False, 'output_path': '', 'error_message': "sin datos"})
+        job = self.queue.get(job_id)
+        self.assertEqual(job['status'], 'pending')
+        self.assertEqual(job['error_message'], "sin datos")
+        self.assertIsNone(self.queue.claim("worker-1"))  # Waiting for the retry delay
+        
+        # Make the retry available now
+        with self.queue._connection:
+            self.queue._connection.execute("UPDATE jobs SET available_at = 0")
+        self.assertEqual(self.queue.claim("worker-1")['attempts'], 2)
+        self.queue.fail(job_id, "sigue sin datos")
+        job = self.queue.get(job_id)
+        self.assertEqual(job['status'], 'failed')
+        self.assertEqual(job['error_message'], "sigue sin datos")
+        self.assertIsNotNone(job['elapsed_seconds'])
+        self.assertEqual([job['id'] for job in self.queue.list_jobs('failed')], [job_id])
+    
+    def test_requeue_stale(self):
+        """Test that jobs abandoned by a dead worker are put back in the queue."""
+        job_id = self.queue.submit(self.templates[0], 2025, 1, xml_dirs=[self.xml_dirs[0]])
+        self.queue.claim("worker-1")
+        self.assertEqual(self.queue.requeue_stale(3600), 0)
+        self.assertEqual(self.queue.requeue_stale(-1), 1)
+        self.assertEqual(self.queue.get(job_id)['status'], 'pending')
+    
+    def test_heartbeat_decides_staleness(self):
+        """Test that a long job with a live heartbeat is kept and a silent one is requeued."""
+        job_id = self.queue.submit(self.templates[0], 2025, 1, xml_dirs=[self.xml_dirs[0]])
+        self.queue.claim("worker-1")
+        with self.queue._connection:
+            self.queue._connection.execute("UPDATE jobs SET started_at = 0")
+        
+        self.assertTrue(self.queue.heartbeat(job_id, "worker-1"))
+        self.assertEqual(self.queue.requeue_stale(60), 0)
+        
+        with self.queue._connection:
+            self.queue._connection.execute("UPDATE jobs SET heartbeat_at = 0")
+        self.assertEqual(self.queue.requeue_stale(60), 1)
+        self.assertFalse(self.queue.heartbeat(job_id, "worker-1"))
+    
+    def test_release_stopped_pool(self):
+        """Test that only the jobs of the stopped pool go back, without using up an attempt."""
+        for template_path, xml_dir in zip(self.templates, self.xml_dirs):
+            self.queue.submit(template_path, 2025, 1, xml_dirs=[xml_dir])
+        self.queue.submit(self.templates[0], 2025, 2, xml_dirs=[self.xml_dirs[0]])
+        first = self.queue.claim("host_a-1-1")['id']
+        self.queue.claim("host_a-11-1")
+        self.queue.claim("host-a-1-2")
+        
+        self.assertEqual(self.queue.release("host_a-1"), 1)
+        job = self.queue.get(first)
+        self.assertEqual(job['status'], 'pending')
+        self.assertEqual(job['attempts'], 0)
+        self.assertEqual(self.queue.counts()['running'], 2)
+    
+    def test_idle_worker_recovers_abandoned_jobs(self):
+        """Test that a draining worker does not stop while a job is left running by a dead worker."""
+        job_id = self.queue.submit(self.templates[0], 2025, 1, xml_dirs=[self.xml_dirs[0]], output_mode="workbook")
+        self.queue.claim("otro-host-1-1")
+        with self.queue._connection:
+            self.queue._connection.execute("UPDATE jobs SET heartbeat_at = 0")
+        
+        self.assertEqual(run_worker(self.db_path, "worker-1", use_cache=False, poll_interval=0.01), 1)
+        job = self.queue.get(job_id)
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['worker'], "worker-1")
+    
+    def test_run_worker_drains_queue(self):
+        """Test that a worker runs every job and records its output."""
+        for template_path, xml_dir in zip(self.templates, self.xml_dirs):
+            self.queue.submit(template_path, 2025, 1, xml_dirs=[xml_dir], output_mode="workbook")
+        
+        self.assertEqual(run_worker(self.db_path, "worker-1", use_cache=False), 2)
+        self.assertEqual(self.queue.counts()['done'], 2)
+        for job in self.queue.list_jobs():
+            self.assertTrue(os.path.exists(job['output_path']))
+            self.assertEqual(job['summary']['records_processed'], 2)
+            self.assertEqual(load_workbook(job['output_path'])["Ene2025"].max_row, 5)
+    
+    def test_worker_pool(self):
+        """Test that a pool of worker processes drains the queue."""
+        for template_path, xml_dir in zip(self.templates, self.xml_dirs):
+            self.queue.submit(template_path, 2025, 1, xml_dirs=[xml_dir])
+        self.queue.submit(os.path.join(self.temp_dir, "no_existe.xlsx"), 2025, 1,
+                          xml_dirs=[self.xml_dirs[0]], max_attempts=1)
+        
+        pool = JobWorkerPool(self.db_path, workers=2, use_cache=False)
+        counts = pool.run()
+        self.assertEqual(counts, {'pending': 0, 'running': 0, 'done': 2, 'failed': 1})
+        self.assertEqual([job['template'] for job in pool.last_failures],
+                         [os.path.join(self.temp_dir, "no_existe.xlsx")])
+        for job in self.queue.list_jobs('done'):
+            self.assertTrue(job['worker'].endswith(("-1", "-2")))
+            self.assertTrue(os.path.exists(job['output_path']))
+        
+        # A later run does not report the failures of earlier ones
+        self.assertEqual(pool.run()['failed'], 1)
+        self.assertEqual(pool.last_failures, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+"""
+Unit tests for the CFDI ledger
+"""
+
+import unittest
+import tempfile
+import os
+from datetime import datetime
+from pathlib import Path
+import sys
+from openpyxl import Workbook, load_workbook
+
+# Add src to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.ledger import CFDILedger, month_range, normalize_uuid
+from core.batch_runner import BatchRunner
+from core.xml_parser import CFDIXMLParser
+from core.xml_sources import DirectorySource
+from config.settings import CFDI_MAPPING
+
+
+class TestCFDILedger(unittest.TestCase):
+    """Test cases for CFDILedger and month fills from the ledger."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.xml_dir = os.path.join(self.temp_dir, "xml")
+        os.makedirs(self.xml_dir)
+        self.ledger_path = os.path.join(self.temp_dir, "ledger.sqlite3")
+        self.ledger = CFDILedger(self.ledger_path)
+        
+        self.sample_xml = '''<?xml version="1.0" encoding="UTF-8"?>
+<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" Fecha="{fecha}" FormaPago="01"
+                   SubTotal="1000.00" Moneda="MXN" Total="1160.00" TipoDeComprobante="I" MetodoPago="PUE">
+    <cfdi:Emisor Rfc="{emisor}" Nombre="EMPRESA EJEMPLO S.A. DE C.V." RegimenFiscal="601"/>
+    <cfdi:Receptor Rfc="XEXX010101000" RegimenFiscalReceptor="601" UsoCFDI="G01"/>
+    <cfdi:Complemento>
+        <tfd:TimbreFiscalDigital xmlns:tfd="http://www.sat.gob.mx/TimbreFiscalDigital" UUID="{uuid}"/>
+    </cfdi:Complemento>
+</cfdi:Comprobante>'''
+        invoices = [
+            ("2025-01-10T10:00:00", "AAA010101AAA", "11111111-1111-1111-1111-111111111111"),
+            ("2025-01-20T10:00:00", "BBB010101BBB", "22222222-2222-2222-2222-222222222222"),
+            ("2025-04-15T10:00:00", "AAA010101AAA", "33333333-3333-3333-3333-333333333333"),
+            ("2025-06-30T23:59:59", "AAA010101AAA", "44444444-4444-4444-4444-444444444444"),
+        ]
+        for i, (fecha, emisor, uuid) in enumerate(invoices):
+            self._write(f"cfdi_{i}.xml", fecha, emisor, uuid)
+        
+        self.template_path = os.path.join(self.temp_dir, "plantilla.xlsx")
+        wb = Workbook()
+        wb.active.title = "Ene2025"
+        wb.create_sheet("Abr2025")
+        for ws in wb.worksheets:
+            for xml_path, column in CFDI_MAPPING.items():
+                ws[f"{column}3"] = xml_path
+        wb.save(self.template_path)
+    
+    def tearDown(self):
+        """Clean up test fixtures."""
+        import shutil
+        self.ledger.close()
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+    
+    def _write(self, name, fecha, emisor, uuid):
+        with open(os.path.join(self.xml_dir, name), 'w', encoding='utf-8') as f:
+            f.write(self.sample_xml.format(fecha=fecha, emisor=emisor, uuid=uuid))
+    
+    def _load(self):
+        batch = CFDIXMLParser().parse_to_batch([DirectorySource(self.xml_dir)])
+        return self.ledger.add(batch)
+    
+    def test_add_and_query(self):
+        """Test queries by UUID, RFC and Fecha range."""
+        self.assertEqual(self._load(), 4)
+        self.assertEqual(len(self.ledger), 4)
+        
+        second_quarter = self.ledger.query(emisor_rfc="aaa010101aaa", start=datetime(2025, 4, 1),
+                                           end=datetime(2025, 7, 1))
+        self.assertEqual(second_quarter.uuids, ["33333333-3333-3333-3333-333333333333",
+                                                "44444444-4444-4444-4444-444444444444"])
+        self.assertEqual(second_quarter[0].emisor_nombre, "EMPRESA EJEMPLO S.A. DE C.V.")
+        self.assertEqual(second_quarter[0].total_value, 1160)
+        
+        self.assertEqual(self.ledger.count(rfc="XEXX010101000"), 4)
+        self.assertEqual(self.ledger.count(rfc="BBB010101BBB"), 1)
+        self.assertEqual(len(self.ledger.query(uuid=" 22222222-2222-2222-2222-222222222222")), 1)
+        self.assertEqual(len(self.ledger.query(limit=3)), 3)
+        
+        self.assertTrue(self.ledger.contains("11111111-1111-1111-1111-111111111111".lower()))
+        self.assertFalse(self.ledger.contains("99999999-9999-9999-9999-999999999999"))
+        self.assertEqual(self.ledger.known_uuids(["33333333-3333-3333-3333-333333333333", "X", ""]),
+                         {"33333333-3333-3333-3333-333333333333"})
+    
+    def test_same_invoice_is_stored_once(self):
+        """Test that the first file of an invoice keeps it and only that file refreshes it."""
+        self._load()
+        self._write("copia.xml", "2025-01-11T10:00:00", "AAA010101AAA", "11111111-1111-1111-1111-111111111111")
+        self._write("cfdi_1.xml", "2025-01-21T10:00:00", "BBB010101BBB", "22222222-2222-2222-2222-222222222222")
+        self._load()
+        
+        self.assertEqual(len(self.ledger), 4)
+        first = self.ledger.query(uuid="11111111-1111-1111-1111-111111111111")
+        self.assertEqual((first.file_names, first[0].fecha), (["cfdi_0.xml"], "2025-01-10T10:00:00"))
+        self.assertEqual(self.ledger.query(uuid="22222222-2222-2222-2222-222222222222")[0].fecha,
+                         "2025-01-21T10:00:00")
+    
+    def test_pipeline_stores_valid_first_copies(self):
+        """Test that a run stores only valid records, and the copy of a repeated invoice read first."""
+        self._write("copia.xml", "2025-01-11T10:00:00", "AAA010101AAA", "11111111-1111-1111-1111-111111111111")
+        self._write("sin_rfc.xml", "2025-01-12T10:00:00", "", "55555555-5555-5555-5555-555555555555")
+        runner = BatchRunner(workers=1, use_cache=False, use_ledger=True, ledger_path=self.ledger_path,
+                             duplicate_mode="drop")
+        try:
+            # cfdi_0.xml is read before its copy
+            xml_files = sorted(os.path.join(self.xml_dir, name) for name in os.listdir(self.xml_dir))
+            summary = runner.run(self.template_path, xml_files, 2025, 1, output_dir=self.temp_dir,
+                                 output_mode="workbook")
+        finally:
+            runner.close()
+        
+        self.assertTrue(summary['success'], summary['error_message'])
+        self.assertEqual(summary['duplicate_files'], 1)
+        self.assertEqual(len(self.ledger), 4)
+        self.assertFalse(self.ledger.contains("55555555-5555-5555-5555-555555555555"))
+        self.assertEqual(self.ledger.query(uuid="11111111-1111-1111-1111-111111111111").file_names, ["cfdi_0.xml"])
+    
+    def test_records_persist_and_read_in_chunks(self):
+        """Test that records survive reopening the ledger and are read chunk by chunk."""
+        self._load()
+        self.ledger.close()
+        self.ledger = CFDILedger(self.ledger_path)
+        
+        start, end = month_range(2025, None)
+        chunks = list(self.ledger.iter_batches(start=start, end=end, batch_size=3))
+        
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 1])
+        self.assertEqual(month_range(2025, 12), (datetime(2025, 12, 1), datetime(2026, 1, 1)))
+        self.assertEqual(normalize_uuid(" abc "), "ABC")
+    
+    def test_month_fill_from_ledger(self):
+        """Test that a month fill can run from the ledger without the XML files."""
+        runner = BatchRunner(workers=1, use_cache=False, use_ledger=True, ledger_path=self.ledger_path)
+        try:
+            summary = runner.run(self.template_path, [DirectorySource(self.xml_dir)], 2025, 1,
+                                 output_dir=self.temp_dir, output_mode="workbook")
+            self.assertTrue(summary['success'])
+            self.assertEqual(self.ledger.count(), 4)
+            
+            import shutil
+            shutil.rmtree(self.xml_dir)
+            summary = runner.run(self.template_path, [], 2025, 4, output_dir=self.temp_dir, from_ledger=True)
+            self.assertTrue(summary['success'], summary['error_message'])
+            self.assertEqual(summary['records_processed'], 1)
+            self.assertEqual(load_workbook(summary['output_path'])["Abr2025"]["J4"].value, "AAA010101AAA")
+        finally:
+            runner.close()
+        
+        runner = BatchRunner(workers=1, use_cache=False, use_ledger=False)
+        try:
+            self.assertFalse(runner.run(self.template_path, [], 2025, 4, from_ledger=True)['success'])
+        finally:
+            runner.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+"""
+Unit tests for the compiled mapping plan
+"""
+
+import unittest
+import xml.etree.ElementTree as ET
+from pathlib import Path
+import sys
+
+# Add src to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.mapping_plan import compile_mapping, DEFAULT_PLAN
+from config.settings import CFDI_MAPPING
+
+
+class TestMappingPlan(unittest.TestCase):
+    """Test cases for compile_mapping and MappingPlan."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.sample_xml_v4 = '''<?xml version="1.0" encoding="UTF-8"?>
+<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" Version="4.0"
+                   Fecha="2024-02-01T09:00:00" Total="116.00" Moneda="MXN">
+    <cfdi:Emisor Rfc="AAA010101AAA" Nombre="EMISOR" RegimenFiscal="601"/>
+    <cfdi:Receptor Rfc="XEXX010101000" RegimenFiscalReceptor="616" UsoCFDI="S01"/>
+    <cfdi:Impuestos TotalImpuestosTrasladados="16.00"/>
+    <cfdi:Complemento>
+        <tfd:TimbreFiscalDigital xmlns:tfd="http://www.sat.gob.mx/TimbreFiscalDigital" UUID="ABC-123"/>
+    </cfdi:Complemento>
+</cfdi:Comprobante>'''
+    
+    def test_groups_fields_by_element(self):
+        """Test that each mapped element is resolved only once."""
+        self.assertEqual(len(DEFAULT_PLAN.groups), 4)  # Emisor, Receptor, Impuestos, TimbreFiscalDigital
+        self.assertEqual(len(DEFAULT_PLAN.root_fields), 8)
+        self.assertEqual(DEFAULT_PLAN.columns, tuple(CFDI_MAPPING.values()) + ('UUID',))
+    
+    def test_extract_cfdi_v4(self):
+        """Test extraction from a CFDI 4.0 document."""
+        record = DEFAULT_PLAN.extract(ET.fromstring(self.sample_xml_v4.encode('utf-8')))
+        
+        self.assertEqual(record['B'], '2024-02-01T09:00:00')
+        self.assertEqual(record['J'], 'AAA010101AAA')
+        self.assertEqual(record['N'], '616')
+        self.assertEqual(record['P'], '16.00')
+        self.assertEqual(record['UUID'], 'ABC-123')
+        self.assertEqual(record['C'], '')  # Missing attribute
+    
+    def test_detect_namespace(self):
+        """Test CFDI version detection from the root tag."""
+        self.assertEqual(DEFAULT_PLAN.detect_namespace('{http://www.sat.gob.mx/cfd/4}Comprobante'),
+                         'http://www.sat.gob.mx/cfd/4')
+        self.assertIsNone(DEFAULT_PLAN.detect_namespace('{urn:other}Comprobante'))
+        self.assertIsNone(DEFAULT_PLAN.detect_namespace('Comprobante'))
+    
+    def test_text_and_extra_namespace_paths(self):
+        """Test element text paths and prefixes outside the cfdi namespace."""
+        plan = compile_mapping(
+            {"cfdi:Emisor/x:Nota": "A", "cfdi:Comprobante/@Total": "B"},
+            namespaces={'x': 'urn:test'}
+        )
+        root = ET.fromstring(
+            '<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/3" xmlns:x="urn:test" Total="5">'
+            '<cfdi:Emisor><x:Nota>hola</x:Nota></cfdi:Emisor></cfdi:Comprobante>'
+        )
+        record = plan.extract(root)
+        
+        self.assertEqual(record, {'A': 'hola', 'B': '5'})
+        self.assertTrue(plan.groups[0].reads_text)
+    
+    def test_unknown_prefix(self):
+        """Test that unknown namespace prefixes are rejected at compile time."""
+        with self.assertRaises(ValueError):
+            compile_mapping({"tfd:TimbreFiscalDigital/@UUID": "A"})
+
+
+if __name__ == '__main__':
+    unittest.main()
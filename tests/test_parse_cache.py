@@ -0,0 +1,136 @@
+"""
+Unit tests for the persistent parse cache
+"""
+
+import unittest
+import tempfile
+import os
+from pathlib import Path
+import sys
+
+# Add src to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.parse_cache import ParseCache
+from core.xml_parser import CFDIXMLParser
+from core.mapping_plan import DEFAULT_PLAN
+
+
+class TestParseCache(unittest.TestCase):
+    """Test cases for ParseCache class."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, "cache.sqlite3")
+        self.cache = ParseCache(self.db_path, plan_signature=DEFAULT_PLAN.signature)
+        
+        self.sample_xml = '''<?xml version="1.0" encoding="UTF-8"?>
+<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/3" Fecha="2024-01-15T10:30:00" Total="1160.00" Moneda="MXN">
+    <cfdi:Emisor Rfc="AAA010101AAA" Nombre="EMPRESA EJEMPLO S.A. DE C.V." RegimenFiscal="601"/>
+    <cfdi:Receptor Rfc="XEXX010101000" RegimenFiscalReceptor="601" UsoCFDI="G01"/>
+</cfdi:Comprobante>'''
+    
+    def tearDown(self):
+        """Clean up test fixtures."""
+        import shutil
+        self.cache.close()
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+    
+    def create_xml_file(self, name, content=None):
+        """Create an XML file in the temporary directory."""
+        file_path = os.path.join(self.temp_dir, name)
+        with open(file_path, 'w') as f:
+            f.write(content or self.sample_xml)
+        return file_path
+    
+    def test_put_and_get(self):
+        """Test storing and retrieving a record."""
+        file_path = self.create_xml_file("a.xml")
+        key = self.cache.make_key(file_path)
+        
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put_many([(key, ('x', 'y'))])
+        
+        self.assertEqual(self.cache.get(self.cache.make_key(file_path)), ('x', 'y'))
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+    
+    def test_modified_file_is_a_miss(self):
+        """Test that a change in size or mtime invalidates the entry."""
+        file_path = self.create_xml_file("a.xml")
+        self.cache.put_many([(self.cache.make_key(file_path), ('x',))])
+        
+        self.create_xml_file("a.xml", self.sample_xml.replace('1160.00', '2160.00'))
+        os.utime(file_path, ns=(0, 10 ** 9))
+        
+        self.assertIsNone(self.cache.get(self.cache.make_key(file_path)))
+    
+    def test_content_hash_key(self):
+        """Test that the content hash is part of the key when enabled."""
+        cache = ParseCache(os.path.join(self.temp_dir, "hashed.sqlite3"), hash_contents=True)
+        try:
+            file_path = self.create_xml_file("a.xml")
+            stat = os.stat(file_path)
+            cache.put_many([(cache.make_key(file_path), ('x',))])
+            
+            # Same size and mtime, different contents
+            self.create_xml_file("a.xml", self.sample_xml.replace('1160.00', '2160.00'))
+            os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            
+            self.assertIsNone(cache.get(cache.make_key(file_path)))
+        finally:
+            cache.close()
+    
+    def test_eviction(self):
+        """Test that the least recently used entries are evicted above max_entries."""
+        cache = ParseCache(os.path.join(self.temp_dir, "small.sqlite3"), max_entries=2)
+        try:
+            keys = [cache.make_key(self.create_xml_file(f"{i}.xml")) for i in range(3)]
+            cache.put_many([(keys[0], ('0',))])
+            cache.put_many([(keys[1], ('1',))])
+            cache.put_many([(keys[2], ('2',))])
+            
+            self.assertEqual(len(cache), 2)
+            self.assertEqual(cache.evictions, 1)
+            self.assertIsNone(cache.get(keys[0]))
+            self.assertEqual(cache.get(keys[2]), ('2',))
+        finally:
+            cache.close()
+    
+    def test_plan_change_clears_entries(self):
+        """Test that entries written for another mapping plan are discarded."""
+        file_path = self.create_xml_file("a.xml")
+        self.cache.put_many([(self.cache.make_key(file_path), ('x',))])
+        self.cache.close()
+        
+        self.cache = ParseCache(self.db_path, plan_signature='other')
+        self.assertEqual(len(self.cache), 0)
+    
+    def test_parser_serves_unchanged_files_from_cache(self):
+        """Test that a second run only parses new files."""
+        files = [self.create_xml_file(f"{i}.xml") for i in range(3)]
+        parser = CFDIXMLParser(cache=self.cache)
+        
+        first = parser.parse_multiple_files(files)
+        files.append(self.create_xml_file("late.xml"))
+        second = parser.parse_multiple_files(files)
+        
+        self.assertEqual(second[:3], first)
+        self.assertEqual(len(second), 4)
+        self.assertEqual(self.cache.hits, 3)
+        self.assertEqual(self.cache.misses, 4)
+    
+    def test_parser_rejects_cache_for_other_plan(self):
+        """Test that a cache created for another plan cannot be used."""
+        cache = ParseCache(os.path.join(self.temp_dir, "other.sqlite3"), plan_signature='other')
+        try:
+            with self.assertRaises(ValueError):
+                CFDIXMLParser(cache=cache)
+        finally:
+            cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+"""
+Unit tests for the streaming CFDI pipeline
+"""
+
+import unittest
+import tempfile
+import os
+from decimal import Decimal
+from pathlib import Path
+import sys
+from datetime import datetime
+from openpyxl import Workbook, load_workbook
+
+# Add src to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.pipeline import CFDIPipeline
+from core.xml_parser import CFDIXMLParser
+from core.xml_sources import DirectorySource
+from config.settings import CFDI_MAPPING
+
+
+class TestCFDIPipeline(unittest.TestCase):
+    """Test cases for CFDIPipeline class."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.xml_dir = os.path.join(self.temp_dir, "xml")
+        os.makedirs(self.xml_dir)
+        
+        self.sample_xml = '''<?xml version="1.0" encoding="UTF-8"?>
+<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" Fecha="2025-01-15T10:30:00" FormaPago="01"
+                   SubTotal="1000.00" Moneda="MXN" Total="1160.00" TipoDeComprobante="I" MetodoPago="PUE">
+    <cfdi:Emisor Rfc="AAA010101AAA" Nombre="EMPRESA EJEMPLO S.A. DE C.V." RegimenFiscal="601"/>
+    <cfdi:Receptor Rfc="XEXX010101000" RegimenFiscalReceptor="601" UsoCFDI="G01"/>
+    <cfdi:Impuestos TotalImpuestosTrasladados="160.00"/>
+</cfdi:Comprobante>'''
+        
+        for i in range(7):
+            with open(os.path.join(self.xml_dir, f"cfdi_{i}.xml"), 'w', encoding='utf-8') as f:
+                f.write(self.sample_xml.replace('2025-01-15', f'2025-01-{10 + i:02d}'))
+        with open(os.path.join(self.xml_dir, "roto.xml"), 'w', encoding='utf-8') as f:
+            f.write("Invalid XML content")
+        with open(os.path.join(self.xml_dir, "sin_rfc.xml"), 'w', encoding='utf-8') as f:
+            f.write(self.sample_xml.replace('Rfc="XEXX010101000"', 'Rfc=""'))
+        
+        self.template_path = os.path.join(self.temp_dir, "plantilla.xlsx")
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "Ene2025"
+        for xml_path, column in CFDI_MAPPING.items():
+            ws[f"{column}3"] = xml_path
+        ws["B4"] = "dato anterior"
+        wb.save(self.template_path)
+    
+    def tearDown(self):
+        """Clean up test fixtures."""
+        import shutil
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+    
+    def test_run_writes_all_chunks(self):
+        """Test that every chunk is validated and written with incremental statistics."""
+        progress = []
+        pipeline = CFDIPipeline(CFDIXMLParser(), batch_size=3, queue_size=1)
+        
+        result = pipeline.run(self.template_path, [DirectorySource(self.xml_dir)], 2025, 1,
+                              output_dir=self.temp_dir, progress=progress.append, output_mode='workbook')
+        
+        self.assertTrue(result['success'], result['error_message'])
+        self.assertEqual(result['records_processed'], 7)
+        processing_result = result['processing_result']
+        self.assertEqual(processing_result.successful_files, 7)
+        self.assertEqual(processing_result.failed_files, 2)
+        self.assertEqual(processing_result.total_amount, Decimal('8120.00'))
+        self.assertEqual(processing_result.date_range, {'start': '2025-01-10T10:30:00', 'end': '2025-01-16T10:30:00'})
+        self.assertEqual(progress[-1], 9)
+        
+        worksheet = load_workbook(result['output_path'])["Ene2025"]
+        written = sorted(worksheet.cell(row=row, column=2).value for row in range(4, 11))
+        self.assertEqual(written[0], datetime(2025, 1, 10, 10, 30))
+        self.assertIsNone(worksheet["B11"].value)
+    
+    def test_run_patch_mode(self):
+        """Test that patch mode streams the chunks into a copy of the template package."""
+        progress = []
+        pipeline = CFDIPipeline(CFDIXMLParser(), batch_size=3, queue_size=1)
+        
+        result = pipeline.run(self.template_path, [DirectorySource(self.xml_dir)], 2025, 1,
+                              output_dir=self.temp_dir, progress=progress.append, output_mode='patch')
+        
+        self.assertTrue(result['success'], result['error_message'])
+        self.assertEqual(result['records_processed'], 7)
+        self.assertEqual(progress[-1], 9)
+        worksheet = load_workbook(result['output_path'])["Ene2025"]
+        written = sorted(worksheet.cell(row=row, column=2).value for row in range(4, 11))
+        self.assertEqual(written, [datetime(2025, 1, 10 + i, 10, 30) for i in range(7)])
+        self.assertEqual(worksheet["G4"].value, 1160)
+        self.assertIsNone(worksheet["B11"].value)
+    
+    def test_run_whole_year(self):
+        """Test that month=None fills the tab of each record's month from one pass over the sources."""
+        workbook = load_workbook(self.template_path)
+        february = workbook.create_sheet("Feb2025")
+        for xml_path, column in CFDI_MAPPING.items():
+            february[f"{column}3"] = xml_path
+        workbook.save(self.template_path)
+        for i in range(2):
+            with open(os.path.join(self.xml_dir, f"febrero_{i}.xml"), 'w', encoding='utf-8') as f:
+                f.write(self.sample_xml.replace('2025-01-15', f'2025-02-0{i + 1}'))
+        with open(os.path.join(self.xml_dir, "marzo.xml"), 'w', encoding='utf-8') as f:
+            f.write(self.sample_xml.replace('2025-01-15', '2025-03-01'))
+        pipeline = CFDIPipeline(CFDIXMLParser(), batch_size=3, queue_size=1)
+        
+        result = pipeline.run(self.template_path, [DirectorySource(self.xml_dir)], 2025, None,
+                              output_dir=self.temp_dir, output_mode='patch')
+        
+        self.assertTrue(result['success'], result['error_message'])
+        self.assertEqual(result['processing_result'].successful_files, 10)
+        self.assertEqual(result['records_processed'], 9)
+        self.assertEqual(result['months'], {1: 7, 2: 2})
+        self.assertEqual(result['missing_months'], [3])
+        self.assertEqual(result['skipped_records'], 1)
+        output = load_workbook(result['output_path'])
+        self.assertEqual(sorted(output["Feb2025"].cell(row=row, column=2).value for row in (4, 5)),
+                         [datetime(2025, 2, 1, 10, 30), datetime(2025, 2, 2, 10, 30)])
+        self.assertIsNone(output["Ene2025"]["B11"].value)
+    
+    def test_auto_mode_counts_folders(self):
+        """Test that "auto" only streams folders holding at least streaming_min_rows documents."""
+        pipeline = CFDIPipeline(CFDIXMLParser())
+        
+        small = pipeline._count_sources([DirectorySource(self.xml_dir)])
+        self.assertEqual(small, 9)
+        self.assertEqual(pipeline.excel_processor.resolve_output_mode('auto', small), 'workbook')
+        self.assertEqual(pipeline._count_sources(iter([DirectorySource(self.xml_dir)])), None)
+        
+        result = pipeline.run(self.template_path, [DirectorySource(self.xml_dir)], 2025, 1,
+                              output_dir=self.temp_dir, output_mode='auto')
+        self.assertTrue(result['success'], result['error_message'])
+        self.assertEqual(result['records_processed'], 7)
+    
+    def test_run_patch_mode_without_valid_files(self):
+        """Test that a streamed workbook is removed when no file can be processed."""
+        pipeline = CFDIPipeline(CFDIXMLParser())
+        
+        result = pipeline.run(self.template_path, [os.path.join(self.xml_dir, "roto.xml")], 2025, 1,
+                              output_dir=self.temp_dir, output_mode='patch')
+        
+        self.assertFalse(result['success'])
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ["plantilla.xlsx", "xml"])
+    
+    def test_run_without_valid_files(self):
+        """Test that nothing is saved when no file can be processed."""
+        pipeline = CFDIPipeline(CFDIXMLParser())
+        
+        result = pipeline.run(self.template_path, [os.path.join(self.xml_dir, "roto.xml")], 2025, 1,
+                              output_dir=self.temp_dir)
+        
+        self.assertFalse(result['success'])
+        self.assertEqual(result['processing_result'].failed_files, 1)
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ["plantilla.xlsx", "xml"])
+    
+    def test_run_missing_month_tab(self):
+        """Test that a missing month tab fails before any file is parsed."""
+        pipeline = CFDIPipeline(CFDIXMLParser())
+        
+        result = pipeline.run(self.template_path, [DirectorySource(self.xml_dir)], 2025, 2)
+        
+        self.assertFalse(result['success'])
+        self.assertIn("pestaña", result['error_message'])
+    
+    def test_stage_error_stops_pipeline(self):
+        """Test that an error in a stage stops the other stages and is reported."""
+        pipeline = CFDIPipeline(CFDIXMLParser(), batch_size=1, queue_size=1)
+        
+        def failing_process_chunk(batch, result, uuid_index=None):
+            raise RuntimeError("fallo de prueba")
+        pipeline.data_processor.process_chunk = failing_process_chunk
+        
+        result = pipeline.run(self.template_path, [DirectorySource(self.xml_dir)], 2025, 1, output_dir=self.temp_dir)
+        
+        self.assertFalse(result['success'])
+        self.assertIn("fallo de prueba", result['error_message'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+"""
+Unit tests for the local processing service and its template cache
+"""
+
+import unittest
+import tempfile
+import os
+import json
+import threading
+import urllib.request
+import urllib.error
+from datetime import datetime
+from pathlib import Path
+import sys
+from openpyxl import Workbook, load_workbook
+
+# Add src to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from service import ProcessingService, JobRequestError, load_service_token, parse_job
+from core.template_cache import TemplateCache
+from core.xml_parser import CFDIXMLParser
+from config.settings import CFDI_MAPPING
+
+
+class TestProcessingService(unittest.TestCase):
+    """Test cases for ProcessingService and TemplateCache."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.xml_dir = os.path.join(self.temp_dir, "xml")
+        os.makedirs(self.xml_dir)
+        
+        sample_xml = '''<?xml version="1.0" encoding="UTF-8"?>
+<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" Fecha="2025-01-15T10:30:00" FormaPago="01"
+                   SubTotal="1000.00" Moneda="MXN" Total="1160.00" TipoDeComprobante="I" MetodoPago="PUE">
+    <cfdi:Emisor Rfc="AAA010101AAA" Nombre="EMPRESA EJEMPLO S.A. DE C.V." RegimenFiscal="601"/>
+    <cfdi:Receptor Rfc="XEXX010101000" RegimenFiscalReceptor="601" UsoCFDI="G01"/>
+</cfdi:Comprobante>'''
+        for i in range(3):
+            with open(os.path.join(self.xml_dir, f"cfdi_{i}.xml"), 'w', encoding='utf-8') as f:
+                f.write(sample_xml.replace('2025-01-15', f'2025-01-{10 + i:02d}'))
+        
+        self.template_path = os.path.join(self.temp_dir, "plantilla.xlsx")
+        wb = Workbook()
+        wb.active.title = "Ene2025"
+        wb.create_sheet("Feb2025")
+        for ws in wb.worksheets:
+            for xml_path, column in CFDI_MAPPING.items():
+                ws[f"{column}3"] = xml_path
+        wb.save(self.template_path)
+        
+        self.service = ProcessingService("127.0.0.1", 0, workers=1, use_cache=False, token="token-de-prueba")
+        self.thread = threading.Thread(target=self.service.serve_forever, daemon=True)
+        self.thread.start()
+        host, port = self.service.address
+        self.base_url = f"http://{host}:{port}"
+    
+    def tearDown(self):
+        """Clean up test fixtures."""
+        import shutil
+        self.service.shutdown()
+        self.thread.join()
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+    
+    def request(self, method, path, body=None, headers=None):
+        """Send a request as an authorized client and return (status, decoded JSON body)."""
+        data = body if isinstance(body, bytes) or body is None else json.dumps(body).encode('utf-8')
+        request_headers = {'X-CFDI-Token': "token-de-prueba", 'Content-Type': "application/json"}
+        request_headers.update(headers or {})
+        request = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                         headers={name: value for name, value in request_headers.items() if value})
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+    
+    def test_repeated_jobs_reuse_prepared_template(self):
+        """Test that a second job on the same template reuses the prepared month tab."""
+        job = {'template': self.template_path, 'xml_dirs': [self.xml_dir], 'year': 2025, 'month': 1,
+               'output_dir': self.temp_dir}
+        
+        first_status, first = self.request('POST', '/jobs', job)
+        second_status, second = self.request('POST', '/jobs', job)
+        
+        self.assertEqual(first_status, 200, first)
+        self.assertEqual(second_status, 200, second)
+        self.assertEqual(second['records_processed'], 3)
+        worksheet = load_workbook(second['output_path'])["Ene2025"]
+        self.assertEqual(sorted(worksheet.cell(row=row, column=2).value for row in range(4, 7)),
+                         [datetime(2025, 1, 10 + i, 10, 30) for i in range(3)])
+        
+        status_code, status = self.request('GET', '/status')
+        self.assertEqual(status_code, 200)
+        self.assertEqual(status['jobs_run'], 2)
+        self.assertEqual(status['template_cache'], {'hits': 1, 'misses': 1, 'evictions': 0, 'entries': 1})
+    
+    def test_year_job(self):
+        """Test that a job without month fills the tabs of the whole year."""
+        status, summary = self.request('POST', '/jobs', {'template': self.template_path,
+                                                         'xml_files': [os.path.join(self.xml_dir, "cfdi_0.xml")],
+                                                         'year': 2025, 'month': None, 'output_dir': self.temp_dir})
+        
+        self.assertEqual(status, 200, summary)
+        self.assertEqual(summary['months'], {"1": 1})
+    
+    def test_invalid_and_failed_jobs(self):
+        """Test the status codes of invalid requests and of jobs that could not be written."""
+        self.assertEqual(self.request('POST', '/jobs', b'no es json')[0], 400)
+        self.assertEqual(self.request('POST', '/jobs', {'template': self.template_path, 'year': 2025})[0], 400)
+        self.assertEqual(self.request('GET', '/otra')[0], 404)
+        
+        status, summary = self.request('POST', '/jobs', {'template': self.template_path, 'xml_dirs': [self.xml_dir],
+                                                         'year': 2025, 'month': 3})
+        self.assertEqual(status, 422)
+        self.assertFalse(summary['success'])
+    
+    def test_rejects_browser_and_remote_requests(self):
+        """Test that requests a web page could send are rejected before any job runs."""
+        job = {'template': self.template_path, 'xml_dirs': [self.xml_dir], 'year': 2025, 'month': 1,
+               'output_dir': self.temp_dir}
+        port = self.service.address[1]
+        
+        # A cross-origin form or fetch() without preflight: text/plain and no token
+        self.assertEqual(self.request('POST', '/jobs', job, {'Content-Type': "text/plain", 'X-CFDI-Token': None})[0],
+                         415)
+        self.assertEqual(self.request('POST', '/jobs', job, {'X-CFDI-Token': None})[0], 401)
+        self.assertEqual(self.request('POST', '/jobs', job, {'X-CFDI-Token': "otro"})[0], 401)
+        self.assertEqual(self.request('GET', '/status', headers={'X-CFDI-Token': None})[0], 401)
+        # DNS rebinding: the browser sends the attacker's host name
+        self.assertEqual(self.request('POST', '/jobs', job, {'Host': f"atacante.example:{port}"})[0], 403)
+        self.assertEqual(self.request('POST', '/jobs', job, {'Host': "localhost:1"})[0], 403)
+        self.assertEqual(self.service.jobs_run, 0)
+        
+        self.assertEqual(self.request('POST', '/jobs', job, {'Host': f"localhost:{port}"})[0], 200)
+    
+    def test_service_token_file(self):
+        """Test that the per-install token is created once and then reused."""
+        token_path = os.path.join(self.temp_dir, "servicio.token")
+        token = load_service_token(token_path)
+        
+        self.assertGreater(len(token), 20)
+        self.assertEqual(load_service_token(token_path), token)
+        if os.name == 'posix':
+            self.assertEqual(os.stat(token_path).st_mode & 0o777, 0o600)
+    
+    def test_parse_job(self):
+        """Test job validation without the server."""
+        job = parse_job({'template': 't.xlsx', 'xml_files': ['a.xml'], 'year': 2025, 'month': 12})
+        
+        self.assertEqual(job['month'], 12)
+        self.assertEqual(job['xml_sources'], ['a.xml'])
+        for payload in ([], {'template': 't.xlsx', 'xml_files': ['a.xml'], 'year': '2025'},
+                        {'template': 't.xlsx', 'xml_files': ['a.xml'], 'year': 2025, 'month': 13},
+                        {'template': 't.xlsx', 'xml_files': ['a.xml'], 'year': 2025, 'output_mode': 'otro'}):
+            with self.assertRaises(JobRequestError):
+                parse_job(payload)
+    
+    def test_template_cache_reads_changed_template(self):
+        """Test that an edited template is prepared again."""
+        cache = TemplateCache(max_templates=1)
+        first = cache.patcher(self.template_path, "Ene2025")
+        self.assertIs(cache.patcher(self.template_path, "Ene2025"), first)
+        
+        wb = load_workbook(self.template_path)
+        wb.create_sheet("Mar2025")
+        wb.save(self.template_path)
+        os.utime(self.template_path, ns=(0, 0))
+        
+        self.assertEqual(cache.sheet_names(self.template_path), ["Ene2025", "Feb2025", "Mar2025"])
+        self.assertIsNot(cache.patcher(self.template_path, "Ene2025"), first)
+        self.assertEqual(cache.get_stats()['misses'], 2)
+    
+    def test_kept_parse_pool(self):
+        """Test that a kept pool is reused between runs and stopped by close()."""
+        parser = CFDIXMLParser()
+        parser.keep_pool(workers=2, parallel_mode='thread')
+        files = [os.path.join(self.xml_dir, f"cfdi_{i}.xml") for i in range(3)]
+        
+        first = parser.parse_to_batch(files)
+        executor = parser._kept_pool.executor
+        second = parser.parse_to_batch(files)
+        
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 3)
+        self.assertIsNotNone(executor)
+        self.assertIs(parser._kept_pool.executor, executor)
+        parser.close()
+        self.assertIsNone(parser._kept_pool)
+
+
+if __name__ == '__main__':
+    unittest.main()
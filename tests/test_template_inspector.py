@@ -0,0 +1,89 @@
+"""
+Unit tests for the lightweight template inspector
+"""
+
+import unittest
+import tempfile
+import os
+from pathlib import Path
+import sys
+from openpyxl import Workbook
+
+# Add src to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.template_inspector import TemplateInspector, TemplateInspectionError
+from core.excel_processor import ExcelProcessor, TemplateSession
+from config.settings import CFDI_MAPPING
+
+
+class TestTemplateInspector(unittest.TestCase):
+    """Test cases for TemplateInspector class."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.template_path = os.path.join(self.temp_dir, "template.xlsx")
+        
+        wb = Workbook()
+        wb.active.title = "Resumen"
+        for name in ("Ene2025", "Feb2025", "Mar 2025 & más"):
+            ws = wb.create_sheet(name)
+            for xml_path, column in CFDI_MAPPING.items():
+                ws[f"{column}3"] = xml_path
+        wb["Feb2025"]["A10"] = "dato"
+        wb.save(self.template_path)
+    
+    def tearDown(self):
+        """Clean up test fixtures."""
+        import shutil
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+    
+    def test_sheet_names(self):
+        """Test that sheet names are read from the workbook part in order."""
+        inspector = TemplateInspector(self.template_path)
+        
+        self.assertEqual(inspector.sheet_names(), ["Resumen", "Ene2025", "Feb2025", "Mar 2025 & más"])
+    
+    def test_sheet_names_from_session(self):
+        """Test that a TemplateSession can be inspected without loading it."""
+        session = TemplateSession(self.template_path)
+        
+        self.assertEqual(TemplateInspector(session).sheet_names()[1], "Ene2025")
+        self.assertFalse(session._loaded)
+    
+    def test_header_row(self):
+        """Test reading the header row of a sheet."""
+        inspector = TemplateInspector(self.template_path)
+        
+        header = inspector.header_row("Ene2025")
+        
+        headers = {column: xml_path for xml_path, column in CFDI_MAPPING.items()}
+        self.assertEqual(header[1], headers['B'])
+        self.assertEqual(header[0], "")
+        self.assertIsNone(inspector.header_row("Dic2025"))
+        self.assertEqual(inspector.header_row("Resumen"), [])
+    
+    def test_invalid_package(self):
+        """Test that files that are not xlsx packages raise TemplateInspectionError."""
+        bad_path = os.path.join(self.temp_dir, "bad.xlsx")
+        with open(bad_path, "w") as bad_file:
+            bad_file.write("no es un zip")
+        
+        with self.assertRaises(TemplateInspectionError):
+            TemplateInspector(bad_path).sheet_names()
+        with self.assertRaises(TemplateInspectionError):
+            TemplateInspector(os.path.join(self.temp_dir, "missing.xlsx")).sheet_names()
+    
+    def test_match_month_tab_name(self):
+        """Test month tab matching on inspected sheet names."""
+        processor = ExcelProcessor()
+        sheet_names = TemplateInspector(self.template_path).sheet_names()
+        
+        self.assertEqual(processor.match_month_tab_name(sheet_names, 2, 2025), "Feb2025")
+        self.assertIsNone(processor.match_month_tab_name(sheet_names, 3, 2025))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+"""
+Unit tests for duplicate CFDI detection by UUID
+"""
+
+import unittest
+import tempfile
+import os
+import zipfile
+from pathlib import Path
+import sys
+from openpyxl import Workbook, load_workbook
+
+# Add src to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.uuid_index import UUIDIndex, create_uuid_index
+from core.data_models import CFDIDataProcessor
+from core.pipeline import CFDIPipeline
+from core.xml_parser import CFDIXMLParser
+from core.xml_sources import DirectorySource
+from config.settings import CFDI_MAPPING
+
+
+class TestUUIDIndex(unittest.TestCase):
+    """Test cases for UUIDIndex and duplicate handling in the pipeline."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.xml_dir = os.path.join(self.temp_dir, "xml")
+        os.makedirs(self.xml_dir)
+        
+        self.sample_xml = '''<?xml version="1.0" encoding="UTF-8"?>
+<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" Fecha="2025-01-15T10:00:00" FormaPago="01"
+                   SubTotal="1000.00" Moneda="MXN" Total="{total}" TipoDeComprobante="I" MetodoPago="PUE">
+    <cfdi:Emisor Rfc="AAA010101AAA" Nombre="EMPRESA EJEMPLO S.A. DE C.V." RegimenFiscal="601"/>
+    <cfdi:Receptor Rfc="XEXX010101000" RegimenFiscalReceptor="601" UsoCFDI="G01"/>
+    <cfdi:Complemento>
+        <tfd:TimbreFiscalDigital xmlns:tfd="http://www.sat.gob.mx/TimbreFiscalDigital" UUID="{uuid}"/>
+    </cfdi:Complemento>
+</cfdi:Comprobante>'''
+        self._write("a.xml", "11111111-1111-1111-1111-111111111111", "1160.00")
+        self._write("b.xml", "22222222-2222-2222-2222-222222222222", "500.00")
+        self._write("copia_a.xml", "11111111-1111-1111-1111-111111111111".lower(), "1160.00")
+        with zipfile.ZipFile(os.path.join(self.xml_dir, "paquete.zip"), 'w') as archive:
+            archive.writestr("b_reenviado.xml", self.sample_xml.format(
+                uuid="22222222-2222-2222-2222-222222222222", total="500.00"))
+        
+        self.template_path = os.path.join(self.temp_dir, "plantilla.xlsx")
+        wb = Workbook()
+        wb.active.title = "Ene2025"
+        for xml_path, column in CFDI_MAPPING.items():
+            wb.active[f"{column}3"] = xml_path
+        wb.save(self.template_path)
+    
+    def tearDown(self):
+        """Clean up test fixtures."""
+        import shutil
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+    
+    def _write(self, name, uuid, total):
+        with open(os.path.join(self.xml_dir, name), 'w', encoding='utf-8') as f:
+            f.write(self.sample_xml.format(uuid=uuid, total=total))
+    
+    def _batch(self):
+        return CFDIXMLParser().parse_to_batch([DirectorySource(self.xml_dir)])
+    
+    def test_repeats_in_a_run(self):
+        """Test that copies under another name or inside a ZIP are dropped and reported."""
+        batch = self._batch()
+        self.assertEqual(len(batch), 4)
+        
+        result = CFDIDataProcessor().process_raw_data(batch, UUIDIndex())
+        
+        self.assertEqual(result.successful_files, 2)
+        self.assertEqual(result.duplicate_files, 2)
+        self.assertEqual(len(result.processed_data), 2)
+        self.assertEqual(sorted(set(result.processed_data.uuids)), ["11111111-1111-1111-1111-111111111111",
+                                                                    "22222222-2222-2222-2222-222222222222"])
+        self.assertEqual(result.total_amount, 1660)
+        self.assertTrue(all("ya leído en" in message for message in result.duplicates))
+        self.assertIn("CFDI duplicados (mismo UUID): 2", result.get_summary_text())
+    
+    def test_flag_keeps_repeats(self):
+        """Test that flagged repeats are reported but still written."""
+        result = CFDIDataProcessor().process_raw_data(self._batch(), UUIDIndex(drop=False))
+        
+        self.assertEqual(result.successful_files, 4)
+        self.assertEqual(result.duplicate_files, 2)
+        
+        result = CFDIDataProcessor().process_raw_data(self._batch())
+        self.assertEqual(result.successful_files, 4)
+        self.assertEqual(result.duplicate_files, 0)
+    
+    def test_records_without_uuid(self):
+        """Test that records without a stamp are never repeats."""
+        index = UUIDIndex()
+        self.assertEqual(index.check_many(["", "", "X"], ["a.xml", "b.xml", "c.xml"]), [None, None, None])
+        self.assertEqual(index.check_many([" x "], ["d.xml"]), [("c.xml", True)])
+        self.assertEqual(len(index), 1)
+    
+    def test_persisted_index(self):
+        """Test that a persisted index catches copies read in an earlier run, but not the same file."""
+        db_path = os.path.join(self.temp_dir, "uuids.sqlite3")
+        index = UUIDIndex(db_path)
+        self.assertEqual(index.check_many(["A", "B"], ["/x/a.xml", "/x/b.xml"]), [None, None])
+        index.close()
+        
+        index = UUIDIndex(db_path)
+        try:
+            self.assertEqual(index.check_many(["A", "B", "C"], ["/x/a.xml", "/y/b.xml", "/x/c.xml"]),
+                             [None, ("/x/b.xml", False), None])
+            # Within the run, the file read first is the copy that counts
+            self.assertEqual(index.check_many(["A"], ["/x/a.xml"]), [("/x/a.xml", True)])
+        finally:
+            index.close()
+    
+    def test_copies_of_earlier_runs_are_kept(self):
+        """Test that a month rebuilt from renamed copies keeps every invoice and reports the copies."""
+        db_path = os.path.join(self.temp_dir, "uuids.sqlite3")
+        index = UUIDIndex(db_path)
+        try:
+            CFDIDataProcessor().process_raw_data(self._batch(), index)
+        finally:
+            index.close()
+        
+        import shutil
+        shutil.move(self.xml_dir, os.path.join(self.temp_dir, "xml_renombrado"))
+        self.xml_dir = os.path.join(self.temp_dir, "xml_renombrado")
+        index = UUIDIndex(db_path)
+        try:
+            result = CFDIDataProcessor().process_raw_data(self._batch(), index)
+        finally:
+            index.close()
+        
+        # Both invoices are written once; their second copies in the folder are still dropped
+        self.assertEqual(result.successful_files, 2)
+        self.assertEqual(sorted(set(result.processed_data.uuids)), ["11111111-1111-1111-1111-111111111111",
+                                                                    "22222222-2222-2222-2222-222222222222"])
+        self.assertEqual(result.duplicate_files, 4)
+        self.assertEqual(sum("ejecución anterior" in message for message in result.duplicates), 2)
+    
+    def test_create_uuid_index(self):
+        """Test the modes of create_uuid_index()."""
+        self.assertIsNone(create_uuid_index("off"))
+        self.assertTrue(create_uuid_index("drop").drop)
+        self.assertFalse(create_uuid_index("flag").drop)
+        with self.assertRaises(ValueError):
+            create_uuid_index("merge")
+    
+    def test_pipeline_writes_each_invoice_once(self):
+        """Test that the pipeline writes one row per UUID."""
+        result = CFDIPipeline(batch_size=1, duplicate_mode="drop").run(
+            self.template_path, [DirectorySource(self.xml_dir)], 2025, 1, output_dir=self.temp_dir
+        )
+        
+        self.assertTrue(result['success'], result['error_message'])
+        self.assertEqual(result['records_processed'], 2)
+        self.assertEqual(result['processing_result'].duplicate_files, 2)
+        ws = load_workbook(result['output_path'])["Ene2025"]
+        self.assertIsNotNone(ws["B5"].value)
+        self.assertIsNone(ws["B6"].value)
+
+
+if __name__ == '__main__':
+    unittest.main()
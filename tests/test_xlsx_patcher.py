@@ -0,0 +1,251 @@
+"""
+Unit tests for the sheet-level xlsx patcher
+"""
+
+import unittest
+import tempfile
+import os
+import zipfile
+from datetime import datetime
+from pathlib import Path
+import sys
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Alignment, Border, Font, Side
+
+# Add src to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.xlsx_patcher import XlsxSheetPatcher, XlsxPatchError, ROWS_PER_WRITE
+from core.excel_processor import ExcelProcessor
+from core.data_models import CFDIData, CFDIBatch
+from config.settings import CFDI_MAPPING, EXCEL_CONFIG
+
+
+class TestXlsxSheetPatcher(unittest.TestCase):
+    """Test cases for XlsxSheetPatcher class."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.template_path = os.path.join(self.temp_dir, "plantilla.xlsx")
+        
+        wb = Workbook()
+        wb.active.title = "Resumen"
+        wb["Resumen"]["A1"] = "=SUM(Ene2025!G4:G1000)"
+        for name in ("Ene2025", "Feb2025"):
+            ws = wb.create_sheet(name)
+            ws["A1"] = f"Control {name}"
+            for xml_path, column in CFDI_MAPPING.items():
+                ws[f"{column}3"] = xml_path
+        ws = wb["Ene2025"]
+        ws.column_dimensions["J"].width = 20
+        ws["B4"] = "dato anterior"
+        ws["Q4"].font = Font(bold=True)      # Formatting next to the data columns
+        ws["B9"] = "otro dato"
+        ws["B9"].font = Font(italic=True)    # Old data row past the new records
+        ws["C10"] = "sin formato"
+        wb["Feb2025"]["B4"] = "febrero"
+        wb.save(self.template_path)
+        
+        self.sample_cfdi_data = CFDIData(
+            fecha='2025-01-15T10:30:00',
+            forma_pago='01',
+            subtotal='1000.00',
+            descuento='',
+            moneda='MXN',
+            total='1160.00',
+            tipo_comprobante='I',
+            metodo_pago='PUE',
+            emisor_rfc='AAA010101AAA',
+            emisor_nombre='PAPELERÍA & CÍA <SUR> ',
+            emisor_regimen='601',
+            receptor_rfc='XEXX010101000',
+            receptor_nombre='',
+            receptor_regimen='601',
+            total_impuestos='160.00',
+            file_path='/test/path.xml',
+            file_name='test.xml'
+        )
+    
+    def tearDown(self):
+        """Clean up test fixtures."""
+        import shutil
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+    
+    def test_write_month_tab(self):
+        """Test that records are written with typed values and the template formatting is kept."""
+        output_path = os.path.join(self.temp_dir, "salida.xlsx")
+        patcher = XlsxSheetPatcher(self.template_path, "Ene2025")
+        
+        written = patcher.write(output_path, [[self.sample_cfdi_data], [self.sample_cfdi_data] * 2])
+        
+        self.assertEqual(written, 3)
+        worksheet = load_workbook(output_path)["Ene2025"]
+        self.assertEqual(worksheet["A1"].value, "Control Ene2025")
+        self.assertEqual(worksheet["B3"].value, next(iter(CFDI_MAPPING)))
+        self.assertEqual(worksheet["B4"].value, datetime(2025, 1, 15, 10, 30))
+        self.assertEqual(worksheet["B4"].number_format, EXCEL_CONFIG['date_format'])
+        self.assertEqual(worksheet["G6"].value, 1160)
+        self.assertEqual(worksheet["G6"].number_format, EXCEL_CONFIG['amount_format'])
+        self.assertEqual(worksheet["K4"].value, 'PAPELERÍA & CÍA <SUR> ')
+        self.assertIsNone(worksheet["E4"].value)
+        self.assertTrue(worksheet["Q4"].font.b)
+        self.assertIsNone(worksheet["B9"].value)
+        self.assertTrue(worksheet["B9"].font.i)
+        self.assertIsNone(worksheet["C10"].value)
+        self.assertEqual(worksheet.column_dimensions["J"].width, 20)
+    
+    def test_template_cell_formatting_kept(self):
+        """Test that styled amount and date cells keep their formatting and only get the number format."""
+        wb = load_workbook(self.template_path)
+        ws = wb["Ene2025"]
+        for reference in ("B4", "G4", "G5"):
+            ws[reference].font = Font(name="Arial", bold=True)
+            ws[reference].border = Border(left=Side(style="thin"))
+        ws["B4"].alignment = Alignment(horizontal="center")
+        ws["G5"].number_format = EXCEL_CONFIG['amount_format']
+        wb.save(self.template_path)
+        
+        output_path = os.path.join(self.temp_dir, "salida.xlsx")
+        XlsxSheetPatcher(self.template_path, "Ene2025").write(output_path, [[self.sample_cfdi_data] * 3])
+        
+        worksheet = load_workbook(output_path)["Ene2025"]
+        for reference in ("B4", "G4", "G5"):
+            self.assertEqual(worksheet[reference].font.name, "Arial")
+            self.assertTrue(worksheet[reference].font.b)
+            self.assertEqual(worksheet[reference].border.left.style, "thin")
+        self.assertEqual(worksheet["B4"].alignment.horizontal, "center")
+        self.assertEqual(worksheet["B4"].number_format, EXCEL_CONFIG['date_format'])
+        self.assertEqual(worksheet["G4"].number_format, EXCEL_CONFIG['amount_format'])
+        self.assertEqual(worksheet["G5"].number_format, EXCEL_CONFIG['amount_format'])
+        self.assertEqual(worksheet["G4"].value, 1160)
+        # Unstyled cells still get the plain formats
+        self.assertFalse(worksheet["G6"].font.b)
+        self.assertEqual(worksheet["G6"].number_format, EXCEL_CONFIG['amount_format'])
+    
+    def test_write_many_rows(self):
+        """Test that rows are flushed in slices and stay in order across chunks."""
+        output_path = os.path.join(self.temp_dir, "salida.xlsx")
+        batch = CFDIBatch()
+        for i in range(ROWS_PER_WRITE + 500):
+            batch.append_values(self.sample_cfdi_data.excel_values()[:8] + (f"RFC{i:09d}",) +
+                                self.sample_cfdi_data.excel_values()[9:], "/test/path.xml", "test.xml")
+        
+        written = XlsxSheetPatcher(self.template_path, "Ene2025").write(output_path, [batch, batch])
+        
+        self.assertEqual(written, 2 * len(batch))
+        worksheet = load_workbook(output_path, read_only=True)["Ene2025"]
+        rfcs = [row[0] for row in worksheet.iter_rows(min_row=4, min_col=10, max_col=10, values_only=True)]
+        self.assertEqual(len(rfcs), 2 * len(batch))
+        self.assertEqual(rfcs[ROWS_PER_WRITE], f"RFC{ROWS_PER_WRITE:09d}")
+        self.assertEqual(rfcs[len(batch)], "RFC000000000")
+    
+    def test_continuation_sheets(self):
+        """Test that records past the row limit continue in new sheets after the month tab."""
+        output_path = os.path.join(self.temp_dir, "salida.xlsx")
+        patcher = XlsxSheetPatcher(self.template_path, "Ene2025", max_rows=6)  # Rows 4 to 6: 3 records per sheet
+        records = []
+        for i in range(7):
+            records.append(CFDIData.from_dict(dict(self.sample_cfdi_data.to_excel_row(), J=f"RFC{i}")))
+        
+        written = patcher.write(output_path, [records[:2], records[2:]])
+        
+        self.assertEqual(written, 7)
+        self.assertEqual(patcher.sheets, ["Ene2025", "Ene2025 (2)", "Ene2025 (3)"])
+        workbook = load_workbook(output_path)
+        self.assertEqual(workbook.sheetnames, ["Resumen", "Ene2025", "Ene2025 (2)", "Ene2025 (3)", "Feb2025"])
+        self.assertEqual([workbook["Ene2025"].cell(row=row, column=10).value for row in range(4, 8)],
+                         ["RFC0", "RFC1", "RFC2", None])
+        continuation = workbook["Ene2025 (2)"]
+        self.assertEqual(continuation["A1"].value, "Control Ene2025")
+        self.assertEqual(continuation["B3"].value, workbook["Ene2025"]["B3"].value)
+        self.assertEqual(continuation.column_dimensions["J"].width, 20)
+        self.assertEqual([continuation.cell(row=row, column=10).value for row in range(4, 7)], ["RFC3", "RFC4", "RFC5"])
+        self.assertIsNone(continuation["Q4"].value)
+        self.assertFalse(continuation["Q4"].font.b)  # Old data rows belong to the month tab only
+        self.assertEqual(workbook["Ene2025 (3)"]["J4"].value, "RFC6")
+        self.assertEqual(workbook["Feb2025"]["B4"].value, "febrero")
+    
+    def test_other_parts_unchanged(self):
+        """Test that every part except the month tab and the styles is copied unchanged."""
+        output_path = os.path.join(self.temp_dir, "salida.xlsx")
+        batch = CFDIBatch()
+        batch.append_values(self.sample_cfdi_data.excel_values(), "/test/path.xml", "test.xml")
+        
+        XlsxSheetPatcher(self.template_path, "Ene2025").write(output_path, [batch])
+        
+        with zipfile.ZipFile(self.template_path) as template, zipfile.ZipFile(output_path) as output:
+            self.assertEqual(sorted(template.namelist()), sorted(output.namelist()))
+            changed = [name for name in template.namelist() if template.read(name) != output.read(name)]
+        # openpyxl templates already ask for a full recalculation on load, so the workbook part stays the same
+        self.assertEqual(sorted(changed), ["xl/styles.xml", "xl/worksheets/sheet2.xml"])
+        
+        workbook = load_workbook(output_path)
+        self.assertEqual(workbook["Resumen"]["A1"].value, "=SUM(Ene2025!G4:G1000)")
+        self.assertEqual(workbook["Feb2025"]["B4"].value, "febrero")
+    
+    def test_calc_chain_dropped(self):
+        """Test that the calculation chain is removed together with its references."""
+        chained_path = os.path.join(self.temp_dir, "con_calc_chain.xlsx")
+        with zipfile.ZipFile(self.template_path) as template, zipfile.ZipFile(chained_path, 'w') as chained:
+            for name in template.namelist():
+                data = template.read(name)
+                if name == "[Content_Types].xml":
+                    data = data.replace(b'</Types>', b'<Override PartName="/xl/calcChain.xml" ContentType='
+                                        b'"application/vnd.openxmlformats-officedocument.spreadsheetml.calcChain+xml"/></Types>')
+                elif name == "xl/_rels/workbook.xml.rels":
+                    data = data.replace(b'</Relationships>', b'<Relationship Id="rId99" Type="http://schemas.'
+                                        b'openxmlformats.org/officeDocument/2006/relationships/calcChain" '
+                                        b'Target="calcChain.xml"/></Relationships>')
+                chained.writestr(name, data)
+            chained.writestr("xl/calcChain.xml", b'<calcChain xmlns="http://schemas.openxmlformats.org/'
+                                                 b'spreadsheetml/2006/main"><c r="A1" i="1"/></calcChain>')
+        output_path = os.path.join(self.temp_dir, "salida.xlsx")
+        
+        XlsxSheetPatcher(chained_path, "Ene2025").write(output_path, [[self.sample_cfdi_data]])
+        
+        with zipfile.ZipFile(output_path) as output:
+            self.assertNotIn("xl/calcChain.xml", output.namelist())
+            self.assertNotIn(b'calcChain', output.read("[Content_Types].xml"))
+            self.assertNotIn(b'calcChain', output.read("xl/_rels/workbook.xml.rels"))
+            self.assertIn(b'fullCalcOnLoad="1"', output.read("xl/workbook.xml"))
+        self.assertEqual(load_workbook(output_path)["Ene2025"]["J4"].value, "AAA010101AAA")
+    
+    def test_missing_sheet(self):
+        """Test that a missing tab raises XlsxPatchError before any output is created."""
+        with self.assertRaises(XlsxPatchError):
+            XlsxSheetPatcher(self.template_path, "Mar2025").prepare()
+    
+    def test_failed_write_removes_output(self):
+        """Test that no partial workbook is left when the records stream fails."""
+        output_path = os.path.join(self.temp_dir, "salida.xlsx")
+        
+        def failing_chunks():
+            yield [self.sample_cfdi_data]
+            raise RuntimeError("fallo")
+        
+        with self.assertRaises(RuntimeError):
+            XlsxSheetPatcher(self.template_path, "Ene2025").write(output_path, failing_chunks())
+        self.assertFalse(os.path.exists(output_path))
+    
+    def test_process_cfdi_to_excel_patch_mode(self):
+        """Test the patch output mode of ExcelProcessor.process_cfdi_to_excel."""
+        processor = ExcelProcessor()
+        
+        result = processor.process_cfdi_to_excel(self.template_path, [self.sample_cfdi_data], 2025, 1,
+                                                 output_dir=self.temp_dir, output_mode='patch')
+        missing = processor.process_cfdi_to_excel(self.template_path, [self.sample_cfdi_data], 2025, 3,
+                                                  output_dir=self.temp_dir, output_mode='patch')
+        
+        self.assertTrue(result['success'], result['error_message'])
+        self.assertEqual(result['records_processed'], 1)
+        self.assertEqual(load_workbook(result['output_path'])["Ene2025"]["G4"].value, 1160)
+        self.assertFalse(missing['success'])
+        self.assertIn("pestaña del mes 3", missing['error_message'])
+        with self.assertRaises(ValueError):
+            processor.process_cfdi_to_excel(self.template_path, [], 2025, 1, output_mode='otro')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,6 +12,7 @@ import sys
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
 from core.xml_parser import CFDIXMLParser
+from core.mapping_plan import compile_mapping
 
 
 class TestCFDIXMLParser(unittest.TestCase):
@@ -125,6 +126,33 @@ class TestCFDIXMLParser(unittest.TestCase):
                 if os.path.exists(file):
                     os.unlink(file)
     
+    def test_parse_multiple_files_parallel(self):
+        """Test the process-pool mode keeps input order and reports failures."""
+        files = []
+        try:
+            for i in range(6):
+                with tempfile.NamedTemporaryFile(mode='w', suffix='.xml', delete=False) as f:
+                    if i == 3:
+                        f.write("Invalid XML content")
+                    else:
+                        f.write(self.sample_xml.replace('2024-01-15T10:30:00', f'2024-01-{10+i:02d}T10:30:00'))
+                    files.append(f.name)
+            
+            results = self.parser.parse_multiple_files(files, workers=2, chunk_size=2)
+            
+            self.assertEqual(len(results), 5)
+            self.assertEqual([result['file_path'] for result in results], files[:3] + files[4:])
+            self.assertEqual(results[0]['B'], '2024-01-10T10:30:00')
+            self.assertEqual(results[-1]['B'], '2024-01-15T10:30:00')
+            self.assertEqual(results[0]['file_name'], Path(files[0]).name)
+            self.assertEqual(len(self.parser.last_failures), 1)
+            self.assertEqual(self.parser.last_failures[0]['file_path'], files[3])
+            
+        finally:
+            for file in files:
+                if os.path.exists(file):
+                    os.unlink(file)
+    
     def test_extract_data_from_element(self):
         """Test data extraction from XML element."""
         with tempfile.NamedTemporaryFile(mode='w', suffix='.xml', delete=False) as f:
@@ -171,6 +199,170 @@ class TestCFDIXMLParser(unittest.TestCase):
         finally:
             os.unlink(temp_file)
     
+    def test_streaming_and_dom_modes_match(self):
+        """Test that the streaming extractor returns the same data as the DOM extractor."""
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.xml', delete=False) as f:
+            f.write(self.sample_xml)
+            temp_file = f.name
+        
+        try:
+            stream_result = CFDIXMLParser(extraction_mode='stream').parse_cfdi_file(temp_file)
+            dom_result = CFDIXMLParser(extraction_mode='dom').parse_cfdi_file(temp_file)
+            self.assertEqual(stream_result, dom_result)
+        finally:
+            os.unlink(temp_file)
+    
+    def test_streaming_ignores_concepto_impuestos(self):
+        """Test that only the top-level Impuestos node is read in streaming mode."""
+        conceptos = ''.join(
+            f'<cfdi:Concepto Importe="{i}.00"><cfdi:Impuestos TotalImpuestosTrasladados="999.00"/></cfdi:Concepto>'
+            for i in range(500)
+        )
+        xml_content = self.sample_xml.replace(
+            '<cfdi:Impuestos TotalImpuestosTrasladados="160.00"/>',
+            f'<cfdi:Conceptos>{conceptos}</cfdi:Conceptos>\n'
+            '    <cfdi:Impuestos TotalImpuestosTrasladados="160.00"/>\n'
+            '    <cfdi:Addenda><Malformed></cfdi:Addenda>'
+        )
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.xml', delete=False) as f:
+            f.write(xml_content)
+            temp_file = f.name
+        
+        try:
+            result = CFDIXMLParser(extraction_mode='stream').parse_cfdi_file(temp_file)
+            self.assertIsNotNone(result)
+            self.assertEqual(result['P'], '160.00')
+            self.assertEqual(result['J'], 'AAA010101AAA')
+        finally:
+            os.unlink(temp_file)
+    
+    def test_streaming_reads_mapped_subtrees_only(self):
+        """Test that subtrees are skipped in streaming mode unless the mapping reaches into them."""
+        xml_content = self.sample_xml.replace(
+            '<cfdi:Impuestos TotalImpuestosTrasladados="160.00"/>',
+            '<cfdi:Conceptos><cfdi:Concepto Descripcion="Servicio"><cfdi:Impuestos/></cfdi:Concepto>'
+            '<cfdi:Concepto Descripcion="Otro"/></cfdi:Conceptos>\n'
+            '    <cfdi:Impuestos TotalImpuestosTrasladados="160.00"/>'
+        )
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.xml', delete=False) as f:
+            f.write(xml_content)
+            temp_file = f.name
+        
+        try:
+            plan = compile_mapping({"cfdi:Conceptos/cfdi:Concepto/@Descripcion": "B",
+                                    "cfdi:Impuestos/@TotalImpuestosTrasladados": "C"})
+            result = CFDIXMLParser(extraction_mode='stream', plan=plan).parse_cfdi_file(temp_file)
+            self.assertEqual((result['B'], result['C']), ("Servicio", "160.00"))
+            self.assertEqual(CFDIXMLParser(extraction_mode='stream').parse_cfdi_file(temp_file)['P'], '160.00')
+        finally:
+            os.unlink(temp_file)
+    
+    def test_backends_match(self):
+        """Test that the lxml and ElementTree backends extract the same data."""
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.xml', delete=False) as f:
+            f.write(self.sample_xml)
+            temp_file = f.name
+        
+        try:
+            results = [
+                CFDIXMLParser(extraction_mode=mode, backend=backend).parse_cfdi_file(temp_file)
+                for mode in ('stream', 'dom') for backend in ('etree', 'lxml')
+            ]
+            for result in results[1:]:
+                self.assertEqual(result, results[0])
+        finally:
+            os.unlink(temp_file)
+    
+    def test_parse_multiple_files_threaded(self):
+        """Test the thread-pool mode with the lxml backend."""
+        parser = CFDIXMLParser(backend='lxml')
+        files = []
+        try:
+            for i in range(4):
+                with tempfile.NamedTemporaryFile(mode='w', suffix='.xml', delete=False) as f:
+                    f.write(self.sample_xml.replace('2024-01-15T10:30:00', f'2024-01-{10+i:02d}T10:30:00'))
+                    files.append(f.name)
+            
+            results = parser.parse_multiple_files(files, workers=3, parallel_mode='thread')
+            
+            self.assertEqual([result['file_path'] for result in results], files)
+            self.assertEqual(results[2]['B'], '2024-01-12T10:30:00')
+            
+        finally:
+            for file in files:
+                if os.path.exists(file):
+                    os.unlink(file)
+    
+    def test_parse_and_validate(self):
+        """Test single-pass validation and extraction in every extraction mode."""
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.xml', delete=False) as f:
+            f.write(self.sample_xml)
+            temp_file = f.name
+        
+        try:
+            for mode in ('stream', 'dom', 'fast'):
+                outcome = CFDIXMLParser(extraction_mode=mode).parse_and_validate(temp_file)
+                self.assertTrue(outcome.success)
+                self.assertIsNone(outcome.failure)
+                self.assertEqual(outcome.record['J'], 'AAA010101AAA')
+                self.assertEqual(outcome.record['file_path'], temp_file)
+        finally:
+            os.unlink(temp_file)
+    
+    def test_parse_and_validate_failure_reasons(self):
+        """Test the typed failure reasons of parse_and_validate."""
+        documents = {
+            'xml_syntax': "Invalid XML content",
+            'not_cfdi': '<invalid:Root xmlns:invalid="urn:x"><invalid:Element/></invalid:Root>',
+            'unsupported_version': self.sample_xml.replace('http://www.sat.gob.mx/cfd/3', 'http://www.sat.gob.mx/cfd/2'),
+        }
+        temp_files = []
+        try:
+            for reason, content in documents.items():
+                with tempfile.NamedTemporaryFile(mode='w', suffix='.xml', delete=False) as f:
+                    f.write(content)
+                    temp_files.append(f.name)
+                for mode in ('stream', 'dom', 'fast'):
+                    outcome = CFDIXMLParser(extraction_mode=mode).parse_and_validate(f.name)
+                    self.assertFalse(outcome.success)
+                    self.assertEqual(outcome.failure, reason)
+                    self.assertIsNone(outcome.record)
+                    self.assertTrue(outcome.message)
+            
+            outcome = self.parser.parse_and_validate("nonexistent_file.xml")
+            self.assertEqual(outcome.failure, 'io_error')
+        finally:
+            for temp_file in temp_files:
+                os.unlink(temp_file)
+    
+    def test_parse_to_batch(self):
+        """Test that parse_to_batch fills the same rows as parse_multiple_files."""
+        files = []
+        try:
+            for i in range(3):
+                with tempfile.NamedTemporaryFile(mode='w', suffix='.xml', delete=False) as f:
+                    f.write(self.sample_xml.replace('2024-01-15T10:30:00', f'2024-01-{10+i:02d}T10:30:00'))
+                    files.append(f.name)
+            files.append("nonexistent_file.xml")
+            
+            batch = self.parser.parse_to_batch(files, batch_size=2)
+            results = self.parser.parse_multiple_files(files)
+            
+            self.assertEqual(len(batch), 3)
+            self.assertEqual(batch.file_paths, [result['file_path'] for result in results])
+            self.assertEqual(batch.column('B'), [result['B'] for result in results])
+            self.assertEqual(batch.column('P'), ['160.00'] * 3)
+            self.assertEqual(len(self.parser.last_failures), 1)
+        finally:
+            for file in files:
+                if os.path.exists(file):
+                    os.unlink(file)
+    
+    def test_invalid_extraction_mode(self):
+        """Test that an unknown extraction mode is rejected."""
+        with self.assertRaises(ValueError):
+            CFDIXMLParser(extraction_mode='unknown')
+    
     def test_get_processing_summary(self):
         """Test processing summary generation."""
         # Create test data
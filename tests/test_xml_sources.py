@@ -0,0 +1,209 @@
+"""
+Unit tests for XML sources (files, ZIP packages and folders)
+"""
+
+import unittest
+import tempfile
+import os
+import zipfile
+from pathlib import Path
+import sys
+
+# Add src to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.xml_sources import (FileSource, ZipMemberSource, DirectorySource, expand_sources, iter_zip_members,
+                              iter_batches, count_sources, close_archives)
+from core.xml_parser import CFDIXMLParser
+from core.parse_cache import ParseCache
+from core.mapping_plan import DEFAULT_PLAN
+
+
+class TestZipSources(unittest.TestCase):
+    """Test cases for reading CFDI XMLs out of ZIP packages."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.sample_xml = '''<?xml version="1.0" encoding="UTF-8"?>
+<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" Fecha="2024-01-15T10:30:00" Total="1160.00" Moneda="MXN">
+    <cfdi:Emisor Rfc="AAA010101AAA" Nombre="EMPRESA EJEMPLO S.A. DE C.V." RegimenFiscal="601"/>
+    <cfdi:Receptor Rfc="XEXX010101000" RegimenFiscalReceptor="601" UsoCFDI="G01"/>
+</cfdi:Comprobante>'''
+        
+        self.zip_path = os.path.join(self.temp_dir, "paquete.zip")
+        with zipfile.ZipFile(self.zip_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for i in range(4):
+                archive.writestr(f"2024/{i}.xml", self.sample_xml.replace('1160.00', f'{100 + i}.00'))
+            archive.writestr("2024/roto.xml", "Invalid XML content")
+            archive.writestr("LEEME.txt", "not an invoice")
+    
+    def tearDown(self):
+        """Clean up test fixtures."""
+        import shutil
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+    
+    def test_iter_zip_members(self):
+        """Test that only XML members are listed."""
+        members = [source.member_name for source in iter_zip_members(self.zip_path)]
+        
+        self.assertEqual(members, ["2024/0.xml", "2024/1.xml", "2024/2.xml", "2024/3.xml", "2024/roto.xml"])
+    
+    def test_expand_sources(self):
+        """Test that ZIP paths are expanded and XML paths are wrapped."""
+        sources = list(expand_sources(["a.xml", self.zip_path]))
+        
+        self.assertIsInstance(sources[0], FileSource)
+        self.assertEqual(len(sources), 6)
+        self.assertIsInstance(sources[1], ZipMemberSource)
+        self.assertEqual(sources[1].file_name, "0.xml")
+        self.assertEqual(sources[1].file_path, os.path.join(self.zip_path, "2024/0.xml"))
+    
+    def test_parse_zip_package(self):
+        """Test parsing a ZIP package without extracting it."""
+        parser = CFDIXMLParser()
+        results = parser.parse_multiple_files([self.zip_path])
+        
+        self.assertEqual(len(results), 4)
+        self.assertEqual([result['G'] for result in results], ['100.00', '101.00', '102.00', '103.00'])
+        self.assertEqual(results[0]['file_name'], '0.xml')
+        self.assertEqual(len(parser.last_failures), 1)
+        self.assertTrue(parser.last_failures[0]['file_path'].endswith('roto.xml'))
+        self.assertEqual(os.listdir(self.temp_dir), ["paquete.zip"])
+    
+    def test_parse_zip_package_in_worker_processes(self):
+        """Test that ZIP members are parsed in parallel by worker processes."""
+        for mode in ('process', 'thread'):
+            parser = CFDIXMLParser(extraction_mode='dom')
+            results = parser.parse_multiple_files([self.zip_path], workers=2, chunk_size=1, parallel_mode=mode)
+            
+            self.assertEqual([result['G'] for result in results], ['100.00', '101.00', '102.00', '103.00'])
+    
+    def test_zip_members_are_cached(self):
+        """Test that ZIP members are served from the parse cache on a second run."""
+        cache = ParseCache(os.path.join(self.temp_dir, "cache.sqlite3"), plan_signature=DEFAULT_PLAN.signature)
+        try:
+            parser = CFDIXMLParser(cache=cache)
+            parser.parse_multiple_files([self.zip_path])
+            results = parser.parse_multiple_files([self.zip_path])
+            
+            self.assertEqual(len(results), 4)
+            self.assertEqual(cache.hits, 4)
+        finally:
+            cache.close()
+    
+    def test_replaced_zip_is_reread(self):
+        """Test that a ZIP replaced under the same name is read again instead of served from the old handle."""
+        cache = ParseCache(os.path.join(self.temp_dir, "cache.sqlite3"), plan_signature=DEFAULT_PLAN.signature)
+        try:
+            parser = CFDIXMLParser(cache=cache)
+            parser.parse_multiple_files([self.zip_path])
+            
+            with zipfile.ZipFile(self.zip_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                archive.writestr("2024/0.xml", self.sample_xml.replace('1160.00', '900.00'))
+            stat = os.stat(self.zip_path)
+            os.utime(self.zip_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+            results = parser.parse_multiple_files([self.zip_path])
+            
+            self.assertEqual([result['G'] for result in results], ['900.00'])
+            self.assertEqual(cache.hits, 0)
+        finally:
+            cache.close()
+            close_archives()
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestDirectorySource(unittest.TestCase):
+    """Test cases for walking folders of CFDI XMLs."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.sample_xml = '''<?xml version="1.0" encoding="UTF-8"?>
+<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" Fecha="2024-01-15T10:30:00" Total="1160.00" Moneda="MXN">
+    <cfdi:Emisor Rfc="AAA010101AAA" Nombre="EMPRESA EJEMPLO S.A. DE C.V." RegimenFiscal="601"/>
+</cfdi:Comprobante>'''
+        
+        layout = ["a.xml", "B.XML", "notas.txt", "2024/c.xml", "2024/enero/d.xml", "respaldo/e.xml"]
+        for relative_path in layout:
+            path = os.path.join(self.temp_dir, relative_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self.sample_xml)
+        
+        with zipfile.ZipFile(os.path.join(self.temp_dir, "2024", "paquete.zip"), 'w') as archive:
+            archive.writestr("f.xml", self.sample_xml)
+    
+    def tearDown(self):
+        """Clean up test fixtures."""
+        import shutil
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+    
+    def _names(self, directory_source):
+        return sorted(source.file_name for source in directory_source)
+    
+    def test_recursive_walk(self):
+        """Test that sub-folders and ZIP packages are included."""
+        names = self._names(DirectorySource(self.temp_dir))
+        
+        self.assertEqual(names, ["B.XML", "a.xml", "c.xml", "d.xml", "e.xml", "f.xml"])
+    
+    def test_non_recursive_walk(self):
+        """Test that only the top folder is listed without recursion."""
+        names = self._names(DirectorySource(self.temp_dir, recursive=False))
+        
+        self.assertEqual(names, ["B.XML", "a.xml"])
+    
+    def test_include_and_exclude_patterns(self):
+        """Test include patterns and folder pruning with exclude patterns."""
+        names = self._names(DirectorySource(self.temp_dir, include=["*.xml"], exclude=["respaldo", "2024/enero"]))
+        
+        self.assertEqual(names, ["B.XML", "a.xml", "c.xml"])
+    
+    def test_walk_is_lazy(self):
+        """Test that the walk yields before the whole tree has been listed."""
+        sources = iter(DirectorySource(self.temp_dir))
+        
+        self.assertIsNotNone(next(sources))
+    
+    def test_count_sources(self):
+        """Test that documents are counted like expand_sources() yields them, up to the limit."""
+        sources = [DirectorySource(self.temp_dir), os.path.join(self.temp_dir, "2024", "paquete.zip"), "otro.xml"]
+        
+        self.assertEqual(count_sources(sources), 8)
+        self.assertEqual(count_sources(sources), len(list(expand_sources(sources))))
+        self.assertEqual(count_sources(sources, limit=3), 3)
+        self.assertEqual(count_sources([os.path.join(self.temp_dir, "no_existe.zip")]), 1)
+        self.assertIsNone(count_sources(iter(sources)))
+    
+    def test_iter_batches(self):
+        """Test that batches never exceed the batch size."""
+        batches = list(iter_batches(iter(range(7)), 3))
+        
+        self.assertEqual(batches, [[0, 1, 2], [3, 4, 5], [6]])
+    
+    def test_parse_folder_in_batches(self):
+        """Test that a folder is parsed batch by batch."""
+        parser = CFDIXMLParser()
+        
+        batches = list(parser.iter_parse([DirectorySource(self.temp_dir)], batch_size=4))
+        
+        self.assertEqual([len(batch) for batch in batches], [4, 2])
+        self.assertEqual(parser.last_failures, [])
+        results = parser.parse_multiple_files([DirectorySource(self.temp_dir)], batch_size=2)
+        self.assertEqual(len(results), 6)
+        self.assertTrue(all(result['J'] == "AAA010101AAA" for result in results))
+    
+    def test_parse_folder_with_worker_pool(self):
+        """Test that the worker pool is reused across batches."""
+        parser = CFDIXMLParser(backend='lxml')
+        
+        results = parser.parse_multiple_files([DirectorySource(self.temp_dir)], workers=2,
+                                              parallel_mode='thread', batch_size=4)
+        
+        self.assertEqual(len(results), 6)